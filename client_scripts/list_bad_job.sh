@@ -50,16 +50,18 @@ for ARGI; do
 done
 
 #--------------------------------------------------------------
-#  Part 3: Write to bad_jobs.txt
+#  Part 3: Write to bad_jobs.txt. Each slot of a multi-slot
+#          client has its own, so its own file on the host
 #--------------------------------------------------------------
+HOST_BAD_JOBS="${MONTE_MOOS_HOST_RECIEVE_DIR}/clients/bad_jobs/${MYNAME}${MONTE_MOOS_SLOT:+_slot${MONTE_MOOS_SLOT}}.txt"
 if [[ "${DELETE}" != "yes" ]]; then
     # Don't duplicate a bad job, but ensure its up to date on the host
     if ! is_bad_job "${JOB}" ; then
         echo "$JOB" >>"${CARLO_DIR_LOCATION}"/bad_jobs.txt
     fi
-    "${MONTE_MOOS_BASE_DIR}"/client_scripts/send2host.sh "${CARLO_DIR_LOCATION}/bad_jobs.txt" "${MONTE_MOOS_HOST_RECIEVE_DIR}/clients/bad_jobs/${MYNAME}.txt"
+    "${MONTE_MOOS_BASE_DIR}"/client_scripts/send2host.sh "${CARLO_DIR_LOCATION}/bad_jobs.txt" "${HOST_BAD_JOBS}" --replace
 else
     [[ -f "${CARLO_DIR_LOCATION}/bad_jobs.txt" ]] && { rm -f "${CARLO_DIR_LOCATION}/bad_jobs.txt"; }
-    "${MONTE_MOOS_BASE_DIR}"/client_scripts/send2host.sh "${MONTE_MOOS_HOST_RECIEVE_DIR}/clients/bad_jobs/${MYNAME}.txt" --delete
+    "${MONTE_MOOS_BASE_DIR}"/client_scripts/send2host.sh "${HOST_BAD_JOBS}" --delete --replace
     vecho "Delete bad_jobs.txt file" 1
 fi
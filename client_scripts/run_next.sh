@@ -44,12 +44,25 @@ for ARGI; do
 done
 echo $(tput bold)"-------------------------------------------------------" $txtrst
 
+#-------------------------------------------------------
+#  Part 1b: Start this run's trace (timing of each phase,
+#           see trace_phase). It is copied into the results
+#           dir, so it travels with them. The last 500 are kept
+#-------------------------------------------------------
+if [[ $MONTE_MOOS_TRACE != "no" ]]; then
+    TRACE_DIR="${CARLO_DIR_LOCATION}/traces"
+    mkdir -p "$TRACE_DIR"
+    export MONTE_MOOS_TRACE_FILE="${TRACE_DIR}/$(date +%Y%m%d_%H%M%S)_${MONTE_MOOS_SLOT:+slot${MONTE_MOOS_SLOT}_}$$.jsonl"
+    ls -t "$TRACE_DIR" | tail -n +501 | while read -r OLD_TRACE; do rm -f "${TRACE_DIR}/${OLD_TRACE}"; done
+fi
+
 #-------------------------------------------------------
 # If it should update the moos-dirs
 #-------------------------------------------------------
 if [[ "$TO_UPDATE" == "yes" ]]; then
     secho "Updating all repos..." 1
-    # remove old cache files
+    # remove old cache files. Every repo in the job is pulled again,
+    # but only rebuilt if its revision changed (see update_dirs.sh)
     rm -f .built_dirs
     if [ -f .built_dirs ]; then
         rm .built_dirs
@@ -59,12 +72,15 @@ fi
 #-------------------------------------------------------
 #  Part 2: Get the host's job queue files and decrypts them
 #-------------------------------------------------------
+TRACE_START=$(trace_now)
 if [[ "$HOSTLESS" == "yes" ]]; then
     OUTPUT=$(/${MONTE_MOOS_BASE_DIR}/client_scripts/select_queue_file.sh -nh)
 else
     OUTPUT=$(/${MONTE_MOOS_BASE_DIR}/client_scripts/select_queue_file.sh)
 fi
-[[ $? -eq 0 ]] || { vexit "unable to pull a queue file (hostless=$HOSTLESS). Exiting..." 8; }
+EXIT_CODE=$?
+trace_phase select_queue "$TRACE_START" $EXIT_CODE
+[[ $EXIT_CODE -eq 0 ]] || { vexit "unable to pull a queue file (hostless=$HOSTLESS). Exiting..." 8; }
 
 QUEUE_FILE=$(echo "$OUTPUT" | tail -n 1)
 echo "$OUTPUT" | awk '{if (a) print a; a=b; b=c; c=$0}'
@@ -75,8 +91,10 @@ vecho "Using queue file: ${FULL_QUEUE_FILE}" 1
 #-------------------------------------------------------
 #  Part 3: Determine which job to run
 #-------------------------------------------------------
+TRACE_START=$(trace_now)
 output=$(${MONTE_MOOS_BASE_DIR}/client_scripts/select_job.sh --queue_file="$FULL_QUEUE_FILE")
 EXIT_CODE=$?
+[[ $EXIT_CODE -eq 0 ]] || trace_phase select_job "$TRACE_START" $EXIT_CODE
 # Check the queue by observing the exit code
 # 1: no jobs left
 [[ $EXIT_CODE -ne 1 ]] || {
@@ -92,11 +110,18 @@ EXIT_CODE=$?
 [[ $EXIT_CODE -eq 0 ]] || { vexit "running /${MONTE_MOOS_BASE_DIR}/client_scripts/select_job.sh --queue_file="$FULL_QUEUE_FILE" returned exit code: $EXIT_CODE" 9; }
 
 vecho "queue line: $output" 5
-JOB_FILE=$(/${MONTE_MOOS_BASE_DIR}/scripts/read_queue.sh -l="$output" -jf)
-JOB_ARGS=$(/${MONTE_MOOS_BASE_DIR}/scripts/read_queue.sh -l="$output" -ja)
-RUNS_DES=$(/${MONTE_MOOS_BASE_DIR}/scripts/read_queue.sh -l="$output" -rd)
-RUNS_ACT=$(/${MONTE_MOOS_BASE_DIR}/scripts/read_queue.sh -l="$output" -ra)
+# All four fields from one parse of the line
+{
+    read -r JOB_FILE
+    read -r JOB_ARGS
+    read -r RUNS_DES
+    read -r RUNS_ACT
+} < <(python3 /${MONTE_MOOS_BASE_DIR}/scripts/job_queue.py -l="$output" --fields)
 RUNS_LEFT=$((RUNS_DES - RUNS_ACT))
+# Every trace record from here on is of this job
+export MONTE_MOOS_TRACE_JOB="$JOB_FILE"
+export MONTE_MOOS_TRACE_ARGS="$JOB_ARGS"
+trace_phase select_job "$TRACE_START" 0
 
 vecho "Initial run_act=$RUNS_ACT" 1
 
@@ -119,54 +144,77 @@ RUNS_ACT=$((RUNS_ACT + 1))
 vecho "New run_act=$RUNS_ACT" 1
 
 #-------------------------------------------------------
-#  Part 4B: Update the job file by pulling the job dir from the host
+#  Part 4B: Update the job file by pulling the job dir from the host.
+#           Extracted job dirs are cached in .job_dir_cache, keyed
+#           by the sha256 of the published archive, so an unchanged
+#           job dir is not downloaded, decrypted or untarred again
 #-------------------------------------------------------
 cd "${CARLO_DIR_LOCATION}" || vexit "cd ${CARLO_DIR_LOCATION} failed" 1
 if [ "$HOSTLESS" = "no" ]; then
+    TRACE_START=$(trace_now)
+    JOB_CACHE_DIR="${CARLO_DIR_LOCATION}/.job_dir_cache"
+    JOB_CACHE_MAX_MB=${MONTE_MOOS_JOB_CACHE_MB:-2048}
+    JOB_DIR_URL="${MONTE_MOOS_HOST_URL_WGET}${MONTE_MOOS_WGET_BASE_DIR}/clients/job_dirs/$JOB_DIR_FILE"
+    mkdir -p "$JOB_CACHE_DIR" .temp_job_dirs
 
-    # Update the queue file
+    # Only downloads the archive if it changed on the host
     vecho "Getting job dirs..." 1
-    vecho "/${MONTE_MOOS_BASE_DIR}/client_scripts/pull_from_host.sh \"${MONTE_MOOS_HOST_URL_WGET}${MONTE_MOOS_WGET_BASE_DIR}/clients/job_dirs/$JOB_DIR_FILE\"" 2
-    /${MONTE_MOOS_BASE_DIR}/client_scripts/pull_from_host.sh "${MONTE_MOOS_HOST_URL_WGET}${MONTE_MOOS_WGET_BASE_DIR}/clients/job_dirs/$JOB_DIR_FILE"
+    vecho "sync_queue.py --print_hash \"$JOB_DIR_URL\" \"$JOB_CACHE_DIR/$JOB_DIR_FILE\"" 2
+    JOB_DIR_HASH=$(python3 /${MONTE_MOOS_BASE_DIR}/scripts/sync_queue.py --print_hash "$JOB_DIR_URL" "$JOB_CACHE_DIR/$JOB_DIR_FILE" -v=$VERBOSE)
     EXIT_CODE=$?
-    if [[ $EXIT_CODE -ne 0 ]]; then
-        vexit "/${MONTE_MOOS_BASE_DIR}/client_scripts/pull_from_host.sh ${MONTE_MOOS_HOST_URL_WGET}${MONTE_MOOS_HOST_CLIENT_DIR}/job_dirs/$JOB_DIR_NAME failed with code $EXIT_CODE" 1
-    fi
-
-    # Success! Move encrypted file to .temp_job_dirs, decrypt it
-    if [ ! -d ".temp_job_dirs" ]; then
-        mkdir .temp_job_dirs
+    if [[ $EXIT_CODE -ne 0 && $EXIT_CODE -ne 3 ]]; then
+        vexit "sync_queue.py $JOB_DIR_URL failed with code $EXIT_CODE" 1
     fi
+    CACHE_ENTRY="$JOB_CACHE_DIR/$JOB_DIR_HASH"
 
-    vecho "Moving $JOB_DIR_FILE to .temp_job_dirs/..." 1
-    mv "$JOB_DIR_FILE" .temp_job_dirs/
+    if [[ -n "$JOB_DIR_HASH" && -d "$CACHE_ENTRY/$JOB_DIR_NAME" ]]; then
+        CACHE_RESULT="hit"
+        rm -f "$JOB_CACHE_DIR/$JOB_DIR_FILE"
+    else
+        CACHE_RESULT="miss"
+        # Unchanged on the host, but the entry was evicted
+        if [[ ! -f "$JOB_CACHE_DIR/$JOB_DIR_FILE" ]]; then
+            JOB_DIR_HASH=$(python3 /${MONTE_MOOS_BASE_DIR}/scripts/sync_queue.py --force --print_hash "$JOB_DIR_URL" "$JOB_CACHE_DIR/$JOB_DIR_FILE" -v=$VERBOSE)
+            [[ $? -eq 0 ]] || { vexit "sync_queue.py --force $JOB_DIR_URL failed" 1; }
+            CACHE_ENTRY="$JOB_CACHE_DIR/$JOB_DIR_HASH"
+        fi
+        # Extract into a temp dir, then move it into place
+        rm -rf "$CACHE_ENTRY" "$CACHE_ENTRY.tmp"
+        mkdir -p "$CACHE_ENTRY.tmp"
+        mv "$JOB_CACHE_DIR/$JOB_DIR_FILE" "$CACHE_ENTRY.tmp/"
 
-    # Decrypt
-    vecho "Decrypting .temp_job_dirs/$JOB_DIR_FILE ..." 1
-    monte_decrypt.sh ".temp_job_dirs/$JOB_DIR_FILE" -o -d
-    EXIT_CODE=$?
-    if [[ $EXIT_CODE -ne 0 ]]; then
-        vexit "monte_decrypt.sh failed do decrypt file .temp_job_dirs/$JOB_DIR_FILE -o -d with code $EXIT_CODE" 7
+        # Decrypt, decompress and untar in one pass (any format
+        # monte_pack.sh reads, whatever the file is named)
+        vecho "Unpacking $CACHE_ENTRY.tmp/$JOB_DIR_FILE ..." 1
+        monte_pack.sh --unpack "$CACHE_ENTRY.tmp/$JOB_DIR_FILE" --output="$CACHE_ENTRY.tmp" -o -d -v=$VERBOSE
+        EXIT_CODE=$?
+        if [[ $EXIT_CODE -ne 0 ]]; then
+            rm -rf "$CACHE_ENTRY.tmp"
+            vexit "monte_pack.sh failed to unpack $CACHE_ENTRY.tmp/$JOB_DIR_FILE with code $EXIT_CODE" 7
+        fi
+        mv "$CACHE_ENTRY.tmp" "$CACHE_ENTRY"
     fi
 
-    # Decompress
-    vecho "Decompressing .temp_job_dirs/$JOB_DIR_NAME.tar.gz ..." 1
-    monte_decompress.sh ".temp_job_dirs/$JOB_DIR_NAME.tar.gz" -o -d
-    EXIT_CODE=$?
-    if [[ $EXIT_CODE -ne 0 ]]; then
-        vexit "monte_decrypt.sh failed do decrypt file .temp_job_dirs/$JOB_DIR_NAME.tar.gz -o -d with code $EXIT_CODE" 7
-    fi
+    # Fresh copy for this run, so the job can't modify the cache
+    touch "$CACHE_ENTRY"
+    rm -rf ".temp_job_dirs/$JOB_DIR_NAME"
+    cp -Rp "$CACHE_ENTRY/$JOB_DIR_NAME" .temp_job_dirs/
 
     # Check that the dir now exists
     if [[ ! -d "${CARLO_DIR_LOCATION}/.temp_job_dirs/$JOB_DIR_NAME" ]]; then
         vexit "after decrypting $JOB_DIR_NAME, ${CARLO_DIR_LOCATION}/.temp_job_dirs/$JOB_DIR_NAME still does not exist" 1
     fi
 
+    # Count the hit/miss, evict least recently used entries
+    CACHE_STATS=$(python3 /${MONTE_MOOS_BASE_DIR}/scripts/job_dir_cache.py "$JOB_CACHE_DIR" --record=$CACHE_RESULT --max_size=$JOB_CACHE_MAX_MB --keep="$JOB_DIR_HASH")
+    secho "Job dir cache $CACHE_RESULT for $JOB_DIR_NAME ($CACHE_STATS)"
+    trace_phase job_dir "$TRACE_START" 0 cache=$CACHE_RESULT
 fi
 
 #-------------------------------------------------------
 #  Part 5: Run the job!
 #-------------------------------------------------------
+START_TIME=$(date +%s)
 if [ "$HOSTLESS" = "yes" ]; then
     vecho "monte_run_job.sh --job_file=\"$FULL_JOB_PATH\" --job_args=\"$JOB_ARGS\" -nh" 1
     monte_run_job.sh --job_file="$FULL_JOB_PATH" --job_args="$JOB_ARGS" -nh
@@ -178,6 +226,10 @@ fi
 EXIT_CODE=$?
 if [[ $EXIT_CODE -ne 0 ]]; then
     # checks if the job was stopped by ctrl-c
+    # Exit code 7: the job's ports don't fit this slot. Skipped, not bad
+    if [[ $EXIT_CODE -eq 7 ]]; then
+        vexit "monte_run_job.sh --job_file=\"$FULL_JOB_PATH\" --job_args=\"$JOB_ARGS\" does not fit slot ${MONTE_MOOS_SLOT}'s ports" 10
+    fi
     if [[ $EXIT_CODE -ne 130 ]]; then
         /${MONTE_MOOS_BASE_DIR}/client_scripts/list_bad_job.sh "${JOB_PATH} ${JOB_ARGS}"
         vexit "monte_run_job.sh --job_file=\"$FULL_JOB_PATH\" --job_args=\"$JOB_ARGS\" failed with exit code: $EXIT_CODE" 2
@@ -185,6 +237,14 @@ if [[ $EXIT_CODE -ne 0 ]]; then
     vexit "Detected ctrl-c. Exiting..." 130
 fi
 
+# Log the runtime, used by select_job.sh to weigh jobs. Keeps the
+# last 1000 runs
+echo "$(($(date +%s) - START_TIME)) $JOB_FILE $JOB_ARGS" >>"${CARLO_DIR_LOCATION}/.job_runtimes.txt"
+if [[ $(wc -l <"${CARLO_DIR_LOCATION}/.job_runtimes.txt") -gt 2000 ]]; then
+    tail -n 1000 "${CARLO_DIR_LOCATION}/.job_runtimes.txt" >"${CARLO_DIR_LOCATION}/.tmp_job_runtimes.txt"
+    mv "${CARLO_DIR_LOCATION}/.tmp_job_runtimes.txt" "${CARLO_DIR_LOCATION}/.job_runtimes.txt"
+fi
+
 #-------------------------------------------------------
 #  Part 6: Update the queue file
 #-------------------------------------------------------
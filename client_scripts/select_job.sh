@@ -1,7 +1,9 @@
 #!/bin/bash
 # Kevin Becker Nov 17 2023
 ME="select_job.sh"
-probability_skip=75 # proability it skips the first available job
+probability_skip=75 # proability it skips the first available job (skip policy)
+POLICY="fair"       # see job_queue.py --help
+SEED=""
 QUEUE_FILE=""
 source "/${MONTE_MOOS_BASE_DIR}/lib/lib_include.sh"
 
@@ -21,9 +23,19 @@ for ARGI; do
         echo " --help, -h Show this help message                        "
         echo " --queue_file=, -q= run give the queue file to use. This  "
         echo "                    file must exist on the local machine."
+        echo " --policy=    fair (default), weighted or skip. fair gives   "
+        echo "              each job owner an equal share of run time, and "
+        echo "              favors jobs with the most work (runs left *    "
+        echo "              average runtime) left. weighted picks by runs  "
+        echo "              left. skip is the old probability_skip walk.   "
+        echo " --seed=      Seed for the selection (same seed, same job)   "
         exit 0
     elif [[ "${ARGI}" == "--queue_file="* || "${ARGI}" == "-q="* ]]; then
         QUEUE_FILE="${ARGI#*=}"
+    elif [[ "${ARGI}" == "--policy="* ]]; then
+        POLICY="${ARGI#*=}"
+    elif [[ "${ARGI}" == "--seed="* ]]; then
+        SEED="--seed=${ARGI#*=}"
     else
         vexit "Bad Arg: $ARGI " 3
     fi
@@ -36,80 +48,22 @@ fi
 #-------------------------------------------------------
 #  Part 3: Determine which job to run
 #-------------------------------------------------------
-# add newline if not present at end of file
-[ "$(tail -c1 "$QUEUE_FILE")" ] && echo >>"$QUEUE_FILE"
-
-# get length of queue (number of jobs)
-length=$(wc -l "$QUEUE_FILE" | awk '{print $1}')
-for ((i = 1; i <= length; i++)); do
-    # select ith line from the queue
-    line=$(awk -v n=$i 'NR == n {print; exit}' "$QUEUE_FILE")
-    if [[ -z $line ]]; then
-        vecho "Line was empty. Continuing..." 5
-        continue
-    fi
-
-    # Skips over commented out lines (start with #)
-    if [[ $line == \#* ]]; then
-        vecho "Skipping comment..." 5
-        continue
-    fi
-
-    # check number of runs left for that job
-    # linearray=($line)
-    read -ra linearray <<<"$line"
-    JOB_FILE=${linearray[0]}
-    JOB_ARGS=""
-    RUNS_DES=""
-    RUNS_ACT=""
-
-    for j in "${linearray[@]}"; do
-        if [[ "$j" == "$JOB_FILE" ]]; then
-            continue
-        elif [[ "$j" == "--"* ]]; then
-            if [[ ! $JOB_ARGS == "" ]]; then
-                JOB_ARGS="${JOB_ARGS} ${j}"
-            else
-                JOB_ARGS="${j}"
-            fi
-        elif [[ $RUNS_DES -eq "" ]]; then
-            RUNS_DES=$j
-        else
-            RUNS_ACT=$j
-        fi
-    done
-
-    RUNS_LEFT=$((RUNS_DES - RUNS_ACT))
-
-    if is_bad_job "$JOB_FILE $JOB_ARGS"; then
-        vecho "Skipping bad job $JOB_FILE $JOB_ARGS ..." 1
-        continue
-    # checks if it has runs left
-    elif [[ $RUNS_LEFT -gt 0 ]]; then
-        vecho "job $JOB_FILE $JOB_ARGS is not bad" 1
-        GOOD_JOB_FILE=$JOB_FILE
-        GOOD_JOB_ARGS=$JOB_ARGS
-        GOOD_RUNS_DES=$RUNS_DES
-        GOOD_RUNS_ACT=$RUNS_ACT
-        random_number=$((RANDOM % 100))
-        # Randomly selects this job. Or tries the next one
-        if ((random_number > probability_skip)); then
-            vecho "Taking this job..." 1
-            break # takes the job
-        else
-            vecho "Randomly skipping job..." 1
-        fi
-    # No runs left
-    else
-        JOB_FILE=""
-    fi
-done
-
-# Un-cacheing the last known usable job
-JOB_FILE=$GOOD_JOB_FILE
-JOB_ARGS=$GOOD_JOB_ARGS
-RUNS_ACT=$GOOD_RUNS_ACT
-RUNS_DES=$GOOD_RUNS_DES
+# Parses the queue once, drops bad jobs and jobs with no runs left, and
+# picks one of the rest with the selection policy. Runtimes come from
+# .job_runtimes.txt, written by run_next.sh
+output=$(python3 "/${MONTE_MOOS_BASE_DIR}/scripts/job_queue.py" --queue_file="$QUEUE_FILE" \
+    --select --policy="$POLICY" $SEED --probability_skip=$probability_skip --fields)
+EXIT_CODE=$?
+[[ $EXIT_CODE -ne 3 ]] || { vexit "job_queue.py could not read $QUEUE_FILE" 3; }
+if [[ $EXIT_CODE -eq 2 ]]; then
+    ALL_JOBS_OK="no"
+fi
+{
+    read -r JOB_FILE
+    read -r JOB_ARGS
+    read -r RUNS_DES
+    read -r RUNS_ACT
+} <<<"$output"
 
 vecho "Job $JOB_FILE $JOB_ARGS selected" 3
 
@@ -69,23 +69,39 @@ if [[ "$HOSTLESS" == "yes" ]]; then
 fi
 
 #-------------------------------------------------------
-#  Part 3b: Otherwise, try to pull from host
+#  Part 3b: Otherwise, try to pull from host. sync_queue.py
+#           only downloads the file if it changed since the
+#           last pull (exit 0). Unchanged files exit with 3
 #-------------------------------------------------------
-# Remove old artifacts
-rm "${MY_QUEUE_FILE}.enc" 2>/dev/null
-rm "${HOST_QUEUE_FILE}.enc" 2>/dev/null
+SYNC_QUEUE="/${MONTE_MOOS_BASE_DIR}/scripts/sync_queue.py"
+HOST_CLIENTS_URL="${MONTE_MOOS_HOST_URL_WGET}${MONTE_MOOS_WGET_BASE_DIR}/clients"
 INCOMING_FILE="${MY_QUEUE_FILE}"
 
 # Attempts to pull one of two files from the host
-vecho "Attempting to pull $MY_QUEUE_FILE from host using ${MONTE_MOOS_HOST_URL_WGET}${MONTE_MOOS_WGET_BASE_DIR}/clients/${MY_QUEUE_FILE}.enc" 1
-/${MONTE_MOOS_BASE_DIR}/client_scripts/pull_from_host.sh -q "${MONTE_MOOS_HOST_URL_WGET}${MONTE_MOOS_WGET_BASE_DIR}/clients/${MY_QUEUE_FILE}.enc" >/dev/null
-if [[ $? -eq 0 ]]; then
-    INCOMING_FILE="${MY_QUEUE_FILE}"
-else
-    vecho "Attempting to pull $HOST_QUEUE_FILE from host using ${MONTE_MOOS_HOST_URL_WGET}${MONTE_MOOS_WGET_BASE_DIR}/clients/${HOST_QUEUE_FILE}.enc" 1
-    /${MONTE_MOOS_BASE_DIR}/client_scripts/pull_from_host.sh -q "${MONTE_MOOS_HOST_URL_WGET}${MONTE_MOOS_WGET_BASE_DIR}/clients/${HOST_QUEUE_FILE}.enc" >/dev/null
-    [[ $? -eq 0 ]] || { vexit "unable to pull $MY_QUEUE_FILE or $HOST_QUEUE_FILE from host" 5; }
+vecho "Attempting to pull $MY_QUEUE_FILE from host using ${HOST_CLIENTS_URL}/${MY_QUEUE_FILE}.enc" 1
+python3 "$SYNC_QUEUE" "${HOST_CLIENTS_URL}/${MY_QUEUE_FILE}.enc" "${MY_QUEUE_FILE}.enc" -v=$VERBOSE
+SYNC_EXIT=$?
+if [[ $SYNC_EXIT -eq 1 ]]; then
+    vecho "Attempting to pull $HOST_QUEUE_FILE from host using ${HOST_CLIENTS_URL}/${HOST_QUEUE_FILE}.enc" 1
     INCOMING_FILE="${HOST_QUEUE_FILE}"
+    python3 "$SYNC_QUEUE" "${HOST_CLIENTS_URL}/${HOST_QUEUE_FILE}.enc" "${HOST_QUEUE_FILE}.enc" -v=$VERBOSE
+    SYNC_EXIT=$?
+fi
+[[ $SYNC_EXIT -eq 0 || $SYNC_EXIT -eq 3 ]] || { vexit "unable to pull $MY_QUEUE_FILE or $HOST_QUEUE_FILE from host (sync_queue.py exit code $SYNC_EXIT)" 5; }
+
+#-------------------------------------------------------
+#  Part 3c: If the host's queue hasn't changed, keep using
+#           the local copy (no decrypt, no merge)
+#-------------------------------------------------------
+if [[ $SYNC_EXIT -eq 3 ]]; then
+    if [[ -f "${INCOMING_FILE}" ]]; then
+        vecho "$INCOMING_FILE unchanged on the host. Using the local copy" 1
+        echo "$INCOMING_FILE"
+        exit 0
+    fi
+    # Local copy is gone (cleaned), so the download is needed after all
+    python3 "$SYNC_QUEUE" --force "${HOST_CLIENTS_URL}/${INCOMING_FILE}.enc" "${INCOMING_FILE}.enc" -v=$VERBOSE
+    [[ $? -eq 0 ]] || { vexit "unable to pull $INCOMING_FILE from host" 5; }
 fi
 
 #-------------------------------------------------------
@@ -103,7 +119,7 @@ monte_decrypt.sh ${INCOMING_FILE}.enc -d -o
 #-------------------------------------------------------
 consolidate_queue_flags=" --first_desired --max_actual --first_jobs"
 TEMP_QUEUE="$(temp_filename queue.txt)"
-/${MONTE_MOOS_BASE_DIR}/scripts/merge_queues.sh --output=$TEMP_QUEUE $INCOMING_FILE ".old_${INCOMING_FILE}" $consolidate_queue_flags #>/dev/null
+python3 /${MONTE_MOOS_BASE_DIR}/scripts/consolidate_queue.py --output=$TEMP_QUEUE $INCOMING_FILE ".old_${INCOMING_FILE}" $consolidate_queue_flags
 rm ".old_${INCOMING_FILE}" 2>/dev/null
 mv "$TEMP_QUEUE" "${INCOMING_FILE}" 2>/dev/null
 echo "$INCOMING_FILE"
@@ -4,6 +4,9 @@
 # Script used to publish files to the host
 ME="send2host.sh"
 DELETE="no"
+NOW="no"
+MOVE="no"
+REPLACE=""
 LOCAL_PATH=""
 HOST_PATH=""
 SSH_HOST="$MONTE_MOOS_USERNAME@$MONTE_MOOS_HOSTNAME_SSH"
@@ -17,12 +20,19 @@ for ARGI; do
     if [ "${ARGI}" = "--help" -o "${ARGI}" = "-h" ]; then
         echo "$ME.sh local_dir host_dir [OPTIONS]"
         echo "                                                          "
-        echo " Used to publish files to the host. Essentially a wrapper "
-        echo " for rsync. Used by secho.sh, extract_results.sh and others..."
+        echo " Used to publish files to the host. Used by secho.sh,    "
+        echo " extract_results.sh and others... By default, the file is "
+        echo " put in the outbox (scripts/outbox.py) and sent in the    "
+        echo " background, in batches, over one ssh connection.         "
+        echo " Set MONTE_MOOS_OUTBOX=no to always send right away.      "
         echo "                                                          "
         echo "Options:                                                   "
         echo " --help, -h Show this help message                         "
         echo " --delete, -d Delete the file on the host                         "
+        echo " --move, -m Move the file/dir into the outbox (it's gone after)"
+        echo " --replace, -r Drop outbox entries still waiting for the same"
+        echo "    host path (for files re-sent as snapshots, like status)"
+        echo " --now, -n Send right away (rsync), skipping the outbox      "
         echo " --test, -t Test the ssh connection                         "
         echo "  --verbose=num, -v=num or --verbose, -v              "
         echo "    Set verbosity                                     "
@@ -37,6 +47,12 @@ for ARGI; do
         DELETE="yes"
     elif [[ "${ARGI}" == "--test" || "${ARGI}" == "-t" ]]; then
         TEST="yes"
+    elif [[ "${ARGI}" == "--now" || "${ARGI}" == "-n" ]]; then
+        NOW="yes"
+    elif [[ "${ARGI}" == "--move" || "${ARGI}" == "-m" ]]; then
+        MOVE="yes"
+    elif [[ "${ARGI}" == "--replace" || "${ARGI}" == "-r" ]]; then
+        REPLACE="--replace"
     else
         if [ -z "$LOCAL_PATH" ]; then
             LOCAL_PATH="${ARGI}"
@@ -63,6 +79,28 @@ if [[ $TEST != "yes" ]]; then
     fi
 fi
 
+#-------------------------------------------------------
+#  Part 1b: Queue it in the outbox. The uploader sends it
+#           (see scripts/outbox.py), so this doesn't wait
+#           on the network
+#-------------------------------------------------------
+if [[ $TEST != "yes" && $NOW != "yes" && $MONTE_MOOS_OUTBOX != "no" ]]; then
+    if [[ $DELETE = "yes" ]]; then
+        if [[ $HOST_PATH == "" || $HOST_PATH == "/" ]]; then
+            vexit "HOST_PATH is \"$HOST_PATH\". This is a bug" 3
+        fi
+        python3 "/${MONTE_MOOS_BASE_DIR}/scripts/outbox.py" --delete $REPLACE "$HOST_PATH"
+    elif [[ $MOVE = "yes" ]]; then
+        python3 "/${MONTE_MOOS_BASE_DIR}/scripts/outbox.py" --move $REPLACE "$LOCAL_PATH" "$HOST_PATH"
+    else
+        python3 "/${MONTE_MOOS_BASE_DIR}/scripts/outbox.py" $REPLACE "$LOCAL_PATH" "$HOST_PATH"
+    fi
+    EXIT_CODE=$?
+    [ $EXIT_CODE -eq 0 ] || vexit "unable to add \"${LOCAL_PATH} ${HOST_PATH}\" to the outbox. outbox.py exited with code $EXIT_CODE" 3
+    vecho "queued ${LOCAL_PATH} → ${HOST_PATH}" 1
+    exit 0
+fi
+
 #-------------------------------------------------------
 #  Part 2: Check ssh key
 #-------------------------------------------------------
@@ -171,3 +209,5 @@ fi
 #  Part 7: Kill the temporary ssh-agent
 #- - - - - - - - - - - - - - - - - - - - - - - - - - - -
 kill -9 $SSH_AGENT_PID
+[[ $MOVE == "yes" && $DELETE != "yes" ]] && rm -rf "$LOCAL_PATH"
+exit 0
@@ -16,6 +16,11 @@ built_dirs_cache="${CARLO_DIR_LOCATION}/.built_dirs"
 FLOW_DOWN_ARGS=""
 ALL="no"
 PROMPT_TIMEOUT=20
+# how many repos to clone/pull at once
+FETCH_JOBS=4
+# how many repos to build at once (default: cores / make -j)
+BUILD_JOBS=""
+UPDATE_LOG_DIR="${CARLO_DIR_LOCATION}/.update_logs"
 # shellcheck disable=SC1090
 source /"${MONTE_MOOS_BASE_DIR}"/lib/lib_include.sh
 # shellcheck disable=SC1090
@@ -37,6 +42,9 @@ for ARGI; do
         echo "    Set verbosity                                     "
         echo " --job_file=    set the name of the job file (only updates dirs that apply to this job) "
         echo " --job_args=    set the arguments to pass to the job "
+        echo " --fetch_jobs=N clone/pull up to N repos at once (default 4) "
+        echo " --build_jobs=N build up to N independent repos at once "
+        echo "                (default: number of cores / the -j flag) "
         # echo " --all, -a      update everything it has a repo_links.txt file for"
         echo " All other arguments will flow down to the build script (e.g. -j8 for 8 cores)"
         exit 0
@@ -44,6 +52,10 @@ for ARGI; do
         JOB_FILE="${ARGI#*=}"
     elif [[ "${ARGI}" == "--job_args="* ]]; then
         JOB_ARGS="${ARGI#*=}"
+    elif [[ "${ARGI}" == "--fetch_jobs="* ]]; then
+        FETCH_JOBS="${ARGI#*=}"
+    elif [[ "${ARGI}" == "--build_jobs="* ]]; then
+        BUILD_JOBS="${ARGI#*=}"
     # elif [ "${ARGI}" = "--all" -o "${ARGI}" = "-a" ]; then
     #     ALL="yes"
     elif [[ "${ARGI}" == "--verbose="* || "${ARGI}" == "-v="* ]]; then
@@ -79,35 +91,54 @@ fi
 #-------------------------------------------------------
 #  Part 4: Useful functions
 #-------------------------------------------------------
-#  Updates all necesary repos in an repo_links.txt file
-handle_repo_links_file() {
+# Every repo to update, in the order they were read. Bash 3
+# (mac) has no associative arrays, so these are parallel arrays
+REPO_NAMES=()
+REPO_LINKS=()
+REPO_FILES=()  # the repo_links file each repo came from
+REPO_AFTER=()  # repos to build before this one (space separated)
+REPO_STATE=()  # queued, fetching, fetched, building, built
+REPO_PIDS=()
+
+#-------------------------------------------------------
+#  Index of a repo in REPO_NAMES, or nothing
+repo_index() {
+    local i
+    for i in "${!REPO_NAMES[@]}"; do
+        if [[ "${REPO_NAMES[i]}" == "$1" ]]; then
+            echo "$i"
+            return 0
+        fi
+    done
+    return 1
+}
+
+#-------------------------------------------------------
+#  Adds the repos in a repo_links.txt file to the queue.
+#  A repo is built after the repo above it (across files,
+#  in the order they're queued) and after moos-ivp, unless
+#  the line has an after=repo_a,repo_b field
+queue_repo_links_file() {
     local repo_links_file
     repo_links_file=$1
 
     local repo_line
-    local starting_pwd
     local file_len
     local repo_name
     local repo_link
-    #-------------------------------------------------------
-    #  Git clone/git pull/build.sh all dirs in the file
-    #-------------------------------------------------------
+    local after
     vecho "#################################" 1
     vecho "repo_links file: $repo_links_file" 1
     # Add newline if not present
     [ -n "$(tail -c1 $repo_links_file)" ] && printf '\n' >>"$repo_links_file"
 
-    # For resetting the pwd after each iter
-    starting_pwd=$(pwd)
-
-    # Would prefer to do a while read loop, but
-    # The build scripts sometimes throw it off for some reason
-    # This works though.
     file_len=$(wc -l <$repo_links_file)
     for ((counter = 1; counter <= file_len; counter++)); do
-        cd "$starting_pwd" || vexit "Error cd'ing into old pwd?" 100
-
         repo_line=$(awk -v num=$counter 'NR==num' $repo_links_file)
+        if [[ -n "$repo_line" && "$repo_line" != \#* ]] && repo_index "$(extract_repo_name $repo_line)" >/dev/null; then
+            vecho "Already queued... $repo_line" 10
+            continue
+        fi
         if to_skip_repo_line $repo_line; then
             vecho "Skipping line... $repo_line" 10
             continue
@@ -115,56 +146,196 @@ handle_repo_links_file() {
         repo_name=$(extract_repo_name $repo_line)
         repo_link=$(extract_repo_link $repo_line)
 
-        #-------------------------------------------------------
-        # Update or clone the repo
-        if [ -d "${MONTE_MOOS_CLIENT_REPOS_DIR}/$repo_name" ]; then
-            update_repo $repo_name $repo_link
-            if [[ $? -ne 0 ]]; then
-                vexit "Error updating $repo_name with link: $repo_link" 10
-            fi
+        if [[ "$repo_name" == "moos-ivp" ]]; then
+            after=""
+        elif extract_repo_after "$repo_line" >/dev/null; then
+            after="moos-ivp $(extract_repo_after "$repo_line")"
+        elif [ ${#REPO_NAMES[@]} -gt 0 ]; then
+            after="moos-ivp ${REPO_NAMES[${#REPO_NAMES[@]} - 1]}"
         else
-            clone_repo $repo_name $repo_link
-            if [[ $? -ne 0 ]]; then
-                vexit "Error cloning $repo_name with link: $repo_link" 11
-            fi
+            after="moos-ivp"
         fi
+        vecho "Queued $repo_name (after: $after)" 1
 
-        #-------------------------------------------------------
-        #  Build the repo
-        cd ${MONTE_MOOS_CLIENT_REPOS_DIR}/"$repo_name" || (vexit "unable to cd ${MONTE_MOOS_CLIENT_REPOS_DIR}/$repo_name " 2)
-        echo -n "        Building..."
-
-        ##############################################
-        # SVN repos were developed in the lab.       #
-        # these repos should be built with -m to     #
-        # ensure they can run a shoreside as well    #
-        ##############################################
-        if [[ -f ".svn" || -d ".svn" ]]; then
-            ALL_FLOW_DOWN_ARGS="${FLOW_DOWN_ARGS} -m"
-        else
-            # shellcheck disable=SC2034 # ALL_FLOW_DOWN_ARGS is used in run_build_script
-            ALL_FLOW_DOWN_ARGS="${FLOW_DOWN_ARGS}"
+        REPO_NAMES+=("$repo_name")
+        REPO_LINKS+=("$repo_link")
+        REPO_FILES+=("$repo_links_file")
+        REPO_AFTER+=("$after")
+        REPO_STATE+=("queued")
+        REPO_PIDS+=("")
+    done
+}
+
+#-------------------------------------------------------
+#  Git clone/git pull one repo (run in the background)
+fetch_repo() { # $repo_name $repo_link $repo_links_file
+    local repo_name=$1
+    local repo_link=$2
+    # shellcheck disable=SC2034 # used by update_repo and clone_repo
+    local repo_links_file=$3
+    if [ -d "${MONTE_MOOS_CLIENT_REPOS_DIR}/$repo_name" ]; then
+        update_repo $repo_name $repo_link
+        if [[ $? -ne 0 ]]; then
+            vexit "Error updating $repo_name with link: $repo_link" 10
+        fi
+    else
+        clone_repo $repo_name $repo_link
+        if [[ $? -ne 0 ]]; then
+            vexit "Error cloning $repo_name with link: $repo_link" 11
         fi
+    fi
+}
+
+#-------------------------------------------------------
+#  Builds one repo (run in the background). Returns 1 if
+#  the build failed, 2 if it failed but isn't fatal
+build_repo() { # $repo_name
+    local repo_name=$1
+    local BUILD_KEY
+    cd ${MONTE_MOOS_CLIENT_REPOS_DIR}/"$repo_name" || vexit "unable to cd ${MONTE_MOOS_CLIENT_REPOS_DIR}/$repo_name " 2
+
+    ##############################################
+    # SVN repos were developed in the lab.       #
+    # these repos should be built with -m to     #
+    # ensure they can run a shoreside as well    #
+    ##############################################
+    if [[ -f ".svn" || -d ".svn" ]]; then
+        ALL_FLOW_DOWN_ARGS="${FLOW_DOWN_ARGS} -m"
+    else
+        # shellcheck disable=SC2034 # ALL_FLOW_DOWN_ARGS is used in run_build_script
+        ALL_FLOW_DOWN_ARGS="${FLOW_DOWN_ARGS}"
+    fi
+
+    #-------------------------------------------------------
+    #  Skip the build if this revision (with these flags and
+    #  this moos-ivp) is already built, or was built before
+    BUILD_KEY=$(build_key "$repo_name")
+    if is_built_for_key "$repo_name" "$BUILD_KEY"; then
+        echo $txtgrn"        Build is up to date" $txtrst
+        return 0
+    fi
+    if restore_build "$repo_name" "$BUILD_KEY"; then
+        echo $txtgrn"        Restored cached build" $txtrst
+        return 0
+    fi
+    [ -z "$BUILD_KEY" ] && vecho "        revision of $repo_name unknown, not caching its build" 1
+    # The build in the repo no longer matches any key until it succeeds
+    rm -f "$(build_cache_dir "$repo_name")/current"
 
-        run_build_script
-        BUILD_FAIL=$?
-        if [[ -z $BUILD_FAIL ]]; then
-            BUILD_FAIL=0
+    echo "        Building..."
+    run_build_script
+    BUILD_FAIL=$?
+    if [ $BUILD_FAIL -ne 0 ]; then
+        # svn repos not building isn't fatal, but git repos are fatal
+        if [[ -f ".svn" || -d ".svn" ]]; then
+            wecho "build failed on $repo_name. Check $repo_name/.build_log.txt"
+            return 2
         fi
+        echo "        build failed with exit code $BUILD_FAIL. Check $repo_name/.build_log.txt"
+        return 1
+    fi
+    echo $txtgrn"        built sucessfully" $txtrst
+    save_build "$repo_name" "$BUILD_KEY" || wecho "unable to cache the build of $repo_name"
+    return 0
+}
 
-        if [ $BUILD_FAIL -ne 0 ]; then
-            # svn repos not building isn't fatal, but git repos are fatal
-            if [[ -f ".svn" || -d ".svn" ]]; then
-                wecho "build failed on $repo_name. Check $repo_name/.build_log.txt"
+#-------------------------------------------------------
+#  Checks if all the repos a repo is built after are built
+#  (repos that aren't queued are already up to date)
+deps_built() {
+    local dep
+    local j
+    for dep in ${REPO_AFTER[$1]}; do
+        j=$(repo_index "$dep") || continue
+        [[ "${REPO_STATE[j]}" == "built" ]] || return 1
+    done
+    return 0
+}
+
+#-------------------------------------------------------
+#  Number of repos in a state
+count_state() {
+    local n=0
+    local state
+    for state in "${REPO_STATE[@]}"; do
+        [[ "$state" == "$1" ]] && n=$((n + 1))
+    done
+    echo $n
+}
+
+#-------------------------------------------------------
+#  Clones/pulls all queued repos, FETCH_JOBS at a time, and
+#  builds each one as soon as it and its dependencies are
+#  ready, BUILD_JOBS at a time. Output of each step is
+#  printed when it's done so repos don't interleave
+update_queued_repos() {
+    local i
+    local rc
+    local progress
+    local failed=""
+    mkdir -p "$UPDATE_LOG_DIR"
+    while [[ $(count_state built) -lt ${#REPO_NAMES[@]} ]]; do
+        progress="no"
+        #-------------------------------------------------------
+        #  Collect the repos that finished
+        for i in "${!REPO_NAMES[@]}"; do
+            [[ "${REPO_STATE[i]}" == "fetching" || "${REPO_STATE[i]}" == "building" ]] || continue
+            kill -0 "${REPO_PIDS[i]}" 2>/dev/null && continue
+            wait "${REPO_PIDS[i]}"
+            rc=$?
+            progress="yes"
+            echo "      ${REPO_NAMES[i]}:"
+            cat "$UPDATE_LOG_DIR/${REPO_NAMES[i]}.txt"
+            if [[ "${REPO_STATE[i]}" == "fetching" ]]; then
+                [ $rc -ne 0 ] && vexit "Error updating ${REPO_NAMES[i]}. See above" $rc
+                REPO_STATE[i]="fetched"
+            elif [ $rc -eq 1 ]; then
+                failed="${REPO_NAMES[i]}"
+                REPO_STATE[i]="failed"
             else
-                vexit "build failed on $repo_name with exit code $?" 3
+                REPO_STATE[i]="built"
+                echo "${REPO_NAMES[i]}" >>$built_dirs_cache
+            fi
+        done
+
+        #-------------------------------------------------------
+        #  A fatal build failure: let the others finish, then exit
+        if [ -n "$failed" ]; then
+            if [[ $(count_state fetching) -eq 0 && $(count_state building) -eq 0 ]]; then
+                vexit "build failed on $failed" 3
+            fi
+            sleep 0.5
+            continue
+        fi
+
+        #-------------------------------------------------------
+        #  Start builds, then fetches
+        for i in "${!REPO_NAMES[@]}"; do
+            [[ $(count_state building) -lt $BUILD_JOBS ]] || break
+            [[ "${REPO_STATE[i]}" == "fetched" ]] && deps_built $i || continue
+            vecho "      started building ${REPO_NAMES[i]}" 1
+            build_repo "${REPO_NAMES[i]}" >"$UPDATE_LOG_DIR/${REPO_NAMES[i]}.txt" 2>&1 &
+            REPO_PIDS[i]=$!
+            REPO_STATE[i]="building"
+            progress="yes"
+        done
+        for i in "${!REPO_NAMES[@]}"; do
+            [[ $(count_state fetching) -lt $FETCH_JOBS ]] || break
+            [[ "${REPO_STATE[i]}" == "queued" ]] || continue
+            vecho "      started updating ${REPO_NAMES[i]}" 1
+            fetch_repo "${REPO_NAMES[i]}" "${REPO_LINKS[i]}" "${REPO_FILES[i]}" >"$UPDATE_LOG_DIR/${REPO_NAMES[i]}.txt" 2>&1 &
+            REPO_PIDS[i]=$!
+            REPO_STATE[i]="fetching"
+            progress="yes"
+        done
+
+        if [[ "$progress" == "no" ]]; then
+            if [[ $(count_state fetching) -eq 0 && $(count_state building) -eq 0 ]]; then
+                vexit "dependency cycle in the after= fields of: ${REPO_NAMES[*]}" 4
             fi
+            sleep 0.5
         fi
-        wait
-        echo $txtgrn " built sucessfully" $txtrst
-        cd ../.. >/dev/null || exit 1
-        echo "$repo_name" >>$built_dirs_cache
-    done <"$repo_links_file"
+    done
 }
 
 #-------------------------------------------------------
@@ -194,7 +365,7 @@ fi
 #-------------------------------------------------------
 #  Part 6: Loop through and finds each repo_links.txt file
 #-------------------------------------------------------
-handle_repo_links_file "${MONTE_MOOS_BASE_REPO_LINKS}"
+queue_repo_links_file "${MONTE_MOOS_BASE_REPO_LINKS}"
 # loop through all repo_links.txt files in the JOB_DIR and all of its parent directories
 
 SEARCH_DIR=$(dirname $JOB_FILE)
@@ -216,9 +387,23 @@ done
 # Loop through repo links in descending order
 # More natural to have dependencies in this manner
 for ((i = ${#array[@]} - 1; i >= 0; i--)); do
-    handle_repo_links_file "${array[i]}"
+    queue_repo_links_file "${array[i]}"
 done
 
+#-------------------------------------------------------
+#  Part 6b: Update and build everything that was queued
+#-------------------------------------------------------
+if [ -z "$BUILD_JOBS" ]; then
+    # -jN in the flow-down args is the number of cores per build
+    MAKE_JOBS=$(echo " $FLOW_DOWN_ARGS" | sed -n 's/.* -j *\([0-9][0-9]*\).*/\1/p')
+    NUM_CORES=$(getconf _NPROCESSORS_ONLN 2>/dev/null || echo 1)
+    BUILD_JOBS=$((NUM_CORES / ${MAKE_JOBS:-1}))
+fi
+[[ $BUILD_JOBS -ge 1 ]] || BUILD_JOBS=1
+[[ $FETCH_JOBS -ge 1 ]] || FETCH_JOBS=1
+vecho "Updating ${#REPO_NAMES[@]} repos, fetching $FETCH_JOBS and building $BUILD_JOBS at a time" 1
+update_queued_repos
+
 #-------------------------------------------------------
 #  Part 7: Check that every required repo has been updated
 #-------------------------------------------------------
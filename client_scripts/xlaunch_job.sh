@@ -18,20 +18,56 @@ source /${MONTE_MOOS_BASE_DIR}/lib/lib_include.sh
 # Reset path upon ctrl+c exit
 trap ctrl_c INT
 ctrl_c() {
+    # The mission is not in the foreground process group
+    bring_down_mission
     safe_exit 130
 }
 
-# Checks uqueryDB for error
-check_uquerydb() {
-    local QUERY_MODE="a"
-    if [[ "${QUERY_MODE}" = "a" ]]; then
-        uQueryDB --alias="mm-query" $SHORE_TARG &>/dev/null
-        EXIT_CODE=$?
-        OUTPUT=$EXIT_CODE
-    fi
+# Runs a launch command in its own process group, so the mission
+# can be brought down without touching anything else (like the
+# other slots' MOOS processes, when running as a slot of a
+# multi-slot client).
+MISSION_PGIDS=()
+launch_mission() {
+    set -m
+    "$@" &
+    local pid=$!
+    set +m
+    MISSION_PGIDS+=("$pid")
+    wait "$pid"
+}
 
-    vecho "                                                                  uQueryDB (mode $QUERY_MODE) output: $OUTPUT" 3
-    return $OUTPUT
+# Checks if any of the mission's process groups are still running
+mission_running() {
+    local pgid
+    for pgid in "${MISSION_PGIDS[@]}"; do
+        kill -0 -- -"$pgid" >&/dev/null && return 0
+    done
+    return 1
+}
+
+# Kills the mission's process groups: TERM, then KILL whatever is
+# still running after up to 2 seconds. Outside of a slot, ktm and
+# killall are still used if a pAntler survives (e.g. one that
+# moved itself to another process group).
+bring_down_mission() {
+    local pgid
+    local i
+    for pgid in "${MISSION_PGIDS[@]}"; do
+        kill -TERM -- -"$pgid" >&/dev/null
+    done
+    for ((i = 0; i < 20; i++)); do
+        mission_running || break
+        sleep 0.1
+    done
+    for pgid in "${MISSION_PGIDS[@]}"; do
+        kill -KILL -- -"$pgid" >&/dev/null
+    done
+    MISSION_PGIDS=()
+    if [[ -z "$MONTE_MOOS_SLOT" ]] && pgrep -x pAntler >&/dev/null; then
+        ktm >&/dev/null
+        killall pAntler >&/dev/null
+    fi
 }
 
 #-----------------------------------------------------
@@ -118,6 +154,63 @@ if (($VEHICLES > 0)); then
     fi
 fi
 
+#-----------------------------------------------------
+#  Part 4b: In a slot of a multi-slot client, every launch
+#           must use the slot's port range, or it collides
+#           with the other slots' missions. Launches without
+#           port flags get the slot's ports: the shoreside
+#           --mport=BASE --pshare=BASE+1, vehicle i (from 0)
+#           --mport=BASE+2+2i --pshare=BASE+3+2i
+#-----------------------------------------------------
+# Prints the ports set by MOOS launch flags (--mport=, --pshare=,
+# --shore_pshare=, or any other --*port*=), one per line
+launch_ports() {
+    local flag
+    local value
+    for flag in $1; do
+        [[ "$flag" == --*=* ]] || continue
+        [[ "${flag%%=*}" == *port* || "${flag%%=*}" == *pshare* ]] || continue
+        value="${flag#*=}"
+        value="${value##*:}" # --shore=ip:port
+        [[ "$value" =~ ^[0-9]+$ ]] && echo "$value"
+    done
+}
+
+if [[ -n "$MONTE_MOOS_SLOT" ]]; then
+    PORT_LOW=${MONTE_MOOS_PORT_BASE:-0}
+    PORT_HIGH=$((PORT_LOW + ${MONTE_MOOS_PORT_RANGE:-0} - 1))
+    PORT_PROBLEM=""
+    if [[ -z "$(launch_ports "$SHORE_FLAGS")" ]]; then
+        SHORE_FLAGS+=" --mport=${PORT_LOW} --pshare=$((PORT_LOW + 1))"
+    fi
+    for ((i = 0; i < $VEHICLES; i++)); do
+        if [[ -z "$(launch_ports "${VEHICLE_FLAGS[$i]} ${SHARED_VEHICLE_FLAGS}")" ]]; then
+            VEHICLE_FLAGS[$i]+=" --mport=$((PORT_LOW + 2 + 2 * i)) --pshare=$((PORT_LOW + 3 + 2 * i))"
+        fi
+    done
+    ALL_FLAGS=("$SHORE_FLAGS")
+    for ((i = 0; i < $VEHICLES; i++)); do
+        ALL_FLAGS+=("${VEHICLE_FLAGS[$i]} ${SHARED_VEHICLE_FLAGS}")
+    done
+    for FLAGS in "${ALL_FLAGS[@]}"; do
+        for PORT in $(launch_ports "$FLAGS"); do
+            if [[ $PORT -lt $PORT_LOW || $PORT -gt $PORT_HIGH ]]; then
+                PORT_PROBLEM="port $PORT is outside of slot ${MONTE_MOOS_SLOT}'s range ${PORT_LOW}-${PORT_HIGH} in \"$FLAGS\""
+                break 2
+            fi
+        done
+    done
+    # Not a bad job (it runs fine on a single slot client), so it
+    # gets its own exit code, which run_next.sh doesn't list as bad
+    if [[ -n "$PORT_PROBLEM" ]]; then
+        if [[ "$MONTE_MOOS_PORT_CHECK" == "warn" ]]; then
+            vecho "WARNING: $PORT_PROBLEM" 0
+        else
+            vexit "$PORT_PROBLEM. Set the ports from \$MONTE_MOOS_PORT_BASE, or set MONTE_MOOS_PORT_CHECK=warn" 7
+        fi
+    fi
+fi
+
 #-------------------------------------------------------
 #  Part 5: Add shared (aka extra) repos to the path
 #-------------------------------------------------------
@@ -150,6 +243,8 @@ cd ${CARLO_DIR_LOCATION} || vexit "unable to cd into CARLO_DIR_LOCATION $CARLO_D
 #-----------------------------------------------------
 #  Part 7: Launch shoreside
 #-----------------------------------------------------
+# Launching is timed up to the shore targ showing up (see trace_phase)
+TRACE_START=$(trace_now)
 
 vecho "   Part 1: Launching the shoreside mission... " 0
 vecho "             shoreside script: $SHORESIDE_SCRIPT" 1
@@ -157,9 +252,10 @@ vecho "             shoreside repo: $SHORE_REPO" 1
 vecho "             shoreside mission: $SHORE_MISSION" 1
 vecho "             shoreside flags: $SHORE_FLAGS" 1
 vecho "${MONTE_MOOS_BASE_DIR}/client_scripts/source_launch.sh --script=${SHORESIDE_SCRIPT} --repo=${SHORE_REPO} --mission=${SHORE_MISSION}  -v=$VERBOSE ${SHORE_FLAGS}" 2
-${MONTE_MOOS_BASE_DIR}/client_scripts/source_launch.sh --script="${SHORESIDE_SCRIPT}" --repo="${SHORE_REPO}" --mission="${SHORE_MISSION}" -v=$VERBOSE ${SHORE_FLAGS}
+launch_mission ${MONTE_MOOS_BASE_DIR}/client_scripts/source_launch.sh --script="${SHORESIDE_SCRIPT}" --repo="${SHORE_REPO}" --mission="${SHORE_MISSION}" -v=$VERBOSE ${SHORE_FLAGS}
 LEXIT_CODE=$?
 if [ $LEXIT_CODE != 0 ]; then
+    trace_phase launch "$TRACE_START" $LEXIT_CODE
     vexit " ${MONTE_MOOS_BASE_DIR}/client_scripts/source_launch.sh --script=\"${SHORESIDE_SCRIPT}\" --repo=\"${SHORE_REPO}\" --mission=\"${SHORE_MISSION}\" -v=$VERBOSE ${SHORE_FLAGS} returned non-zero exit code:  $LEXIT_CODE" 4
 fi
 
@@ -174,9 +270,10 @@ for ((i = 0; i < VEHICLES; i++)); do
     vecho "             vehicle flags: ${VEHICLE_FLAGS[i]}" 1
     vecho "             shared vehicle flags: $SHARED_VEHICLE_FLAGS" 1
     vecho "/${MONTE_MOOS_BASE_DIR}/client_scripts/source_launch.sh --script="${VEHICLE_SCRIPTS[i]}" --repo="${VEHICLE_REPOS[i]}" --mission="${VEHICLE_MISSIONS[i]}" ${VEHICLE_FLAGS[i]} ${SHARED_VEHICLE_FLAGS}" 2
-    /${MONTE_MOOS_BASE_DIR}/client_scripts/source_launch.sh --script="${VEHICLE_SCRIPTS[i]}" --repo="${VEHICLE_REPOS[i]}" --mission="${VEHICLE_MISSIONS[i]}" -v=$VERBOSE ${VEHICLE_FLAGS[i]} ${SHARED_VEHICLE_FLAGS}
+    launch_mission /${MONTE_MOOS_BASE_DIR}/client_scripts/source_launch.sh --script="${VEHICLE_SCRIPTS[i]}" --repo="${VEHICLE_REPOS[i]}" --mission="${VEHICLE_MISSIONS[i]}" -v=$VERBOSE ${VEHICLE_FLAGS[i]} ${SHARED_VEHICLE_FLAGS}
     LEXIT_CODE=$?
     if [ $LEXIT_CODE != 0 ]; then
+        trace_phase launch "$TRACE_START" $LEXIT_CODE
         vexit " /${MONTE_MOOS_BASE_DIR}/client_scripts/source_launch.sh --script="${VEHICLE_SCRIPTS[i]}" --repo="${VEHICLE_REPOS[i]}" --mission="${VEHICLE_MISSIONS[i]}"  -v=$VERBOSE ${VEHICLE_FLAGS[i]} ${SHARED_VEHICLE_FLAGS} returned non-zero exit code:  $LEXIT_CODE" 5
     fi
 done
@@ -208,7 +305,8 @@ done
 
 # If SHORE_TARG is still not found, exit
 if [ ! -f "$SHORE_TARG" ]; then
-    ktm
+    trace_phase launch "$TRACE_START" 6
+    bring_down_mission
     vecho "SHORE_REPO=$SHORE_REPO" 1
     vecho "SHORE_MISSION=$SHORE_MISSION" 1
     vecho "SHORE_TARG=$SHORE_TARG" 1
@@ -216,6 +314,7 @@ if [ ! -f "$SHORE_TARG" ]; then
 else
     vecho "   shore targ $SHORE_TARG found" 1
 fi
+trace_phase launch "$TRACE_START" 0
 
 if [ -z "$DELAY_POKE" ]; then
     DELAY_POKE=5
@@ -225,6 +324,7 @@ fi
 #  Part 10: Poke the mission
 #-------------------------------------------------------
 echo "$ME Part 2: Poking/Starting mission in $DELAY_POKE seconds... "
+TRACE_START=$(trace_now)
 sleep "$DELAY_POKE"
 echo "$ME             poking... "
 
@@ -241,127 +341,45 @@ for ((i = 0; i < NUM_REPEAT_POKES; i++)); do
     fi
     EXIT_CODE=$?
     if [ $EXIT_CODE != 0 ]; then
+        trace_phase poke_delay "$TRACE_START" $EXIT_CODE
         vexit "uPokeDB $SHORE_TARG $START_POKE returned non-zero exit code:  $EXIT_CODE" 4
     fi
     sleep $DELAY_REPEAT_POKE
 done
+trace_phase poke_delay "$TRACE_START" 0
 
 #-------------------------------------------------------
-#  Part 11: Keep checking if the mission until it is done
-#          and bring it down when complete
+#  Part 11: Watch the mission until it is done (halt
+#           conditions met, or timed out)
 #-------------------------------------------------------
 echo "$ME Part 3: Query the mission for halt conditions"
 echo ""
-valid_uquerydb="yes"
-start_time=$(date +%s)
-first_iter="yes"
-
-while true; do
-
-    rm -f .checkvars
-
-    #-----------------------------------------------------
-    # Check for halt conditions
-    #-----------------------------------------------------
-
-    # Check if uQueryDB is valid
-    if [[ $TIMER_ONLY = "yes" ]]; then
-        vecho "Timer only mode. Not querying..." 1
-    else
-        if [[ $valid_uquerydb = "yes" ]]; then
-            vecho "uQueryDB $SHORE_TARG " 2
-            check_uquerydb $SHORE_TARG
-            # uQueryDB $SHORE_TARG &>/dev/null
-            QUERY=$?
-            vecho "output of query: $QUERY" 2
-
-            if [ $QUERY -eq 1 ]; then
-                vecho "Continuing mission..." 2
-            fi
-
-            if [ $QUERY -eq 0 ]; then
-                current_time=$(date +%s)
-                elapsed_time=$(($current_time - $start_time))
-                if [ $first_iter = "yes" ]; then
-                    valid_uquerydb="no"
-                    first_iter="no"
-                    vecho "Empty uQueryDB. Resorting to only using the timer..." 2
-                else
-                    first_iter="no"
-                    echo "${txtgrn}      Mission completed after ${elapsed_time} seconds${txtrst}"
-                    break
-                fi
-            fi
-        else
-            vecho "Invalid uQueryDB" 20
-        fi
-    fi
-
-    # Check timer, exit if necessary
-    current_time=$(date +%s)
-    elapsed_time=$(($current_time - $start_time))
-    vecho "     elapsed time=$elapsed_time (timeout=$JOB_TIMEOUT)" 20
-
-    if [ $((elapsed_time % 30)) -eq 0 ]; then
-        secho "Still running $JOB_FILE | $elapsed_time/$JOB_TIMEOUT seconds elapsed " >&/dev/null
-    fi
-
-    #-----------------------------------------------------
-    # Update timer
-    #-----------------------------------------------------
-    bar_width=40
-    progress=$(echo "$bar_width/$JOB_TIMEOUT*$elapsed_time" | bc -l)
-    fill=$(printf "%.0f\n" $progress)
-    if [ $fill -gt $bar_width ]; then
-        fill=$bar_width
-    fi
-    empty=$(($fill - $bar_width))
-    percent=$(echo "100/$JOB_TIMEOUT*$elapsed_time" | bc -l)
-    percent=$(printf "%0.2f\n" $percent)
-    if [ $(echo "$percent>100" | bc) -gt 0 ]; then
-        percent="100.00"
-    fi
-
-    #- - - - - - - - - - - - - - - - - - - - -
-    # check if darwin/macos vs linux
-    if [ "$(uname)" == "Darwin" ]; then
-        printf "\r      "
-        printf "%${fill}s" '' | tr ' ' ░
-        printf "%${empty}s" '' | tr ' ' ▉
-    else
-        printf "\r      ["
-        printf "%${fill}s" ''
-        printf "%${empty}s" '' | tr ' ' '='
-        printf "]"
-    fi
-    printf " $percent%% (${elapsed_time}/${JOB_TIMEOUT} sec)"
-    if [ $valid_uquerydb = "no" ]; then
-        printf " \e[33mWarning: uQueryDB failed. Using timer \e[0m"
-    fi
-    # fi
-
-    # Check timer, exit if necessary
-    if [ $elapsed_time -gt "$JOB_TIMEOUT" ]; then
-        echo ""
-        echo "${txtylw}      Mission timed out after ${elapsed_time} seconds${txtrst}"
-        break
-    fi
-
-    #-----------------------------------------------------
-    # Sleep, if uQueryDB has too short of a wait time
-    #-----------------------------------------------------
-    sleep 1
-    first_iter="no"
-
-done
+MONITOR_ARGS="--targ=$SHORE_TARG --timeout=$JOB_TIMEOUT --log_dir=$FULL_MISSION_DIR --job_file=$JOB_FILE -v=$VERBOSE"
+if [[ $TIMER_ONLY = "yes" ]]; then
+    vecho "Timer only mode. Not querying..." 1
+    MONITOR_ARGS+=" --timer_only"
+fi
+SECONDS=0
+TRACE_START=$(trace_now)
+vecho "mission_monitor.py $MONITOR_ARGS" 2
+# shellcheck disable=SC2086
+/${MONTE_MOOS_BASE_DIR}/scripts/mission_monitor.py $MONITOR_ARGS
+MONITOR_EXIT=$?
+trace_phase mission "$TRACE_START" $MONITOR_EXIT
+if [[ $MONITOR_EXIT -eq 0 ]]; then
+    echo "${txtgrn}      Mission completed after ${SECONDS} seconds${txtrst}"
+elif [[ $MONITOR_EXIT -eq 2 ]]; then
+    echo "${txtylw}      Mission timed out after ${SECONDS} seconds${txtrst}"
+else
+    echo "${txtylw}      mission_monitor.py exited with code $MONITOR_EXIT after ${SECONDS} seconds${txtrst}"
+fi
 
 echo "$ME Part 4: Bringing down the mission... "
-ktm >&/dev/null
-killall pAntler >&/dev/null
-sleep 1
+TRACE_START=$(trace_now)
+bring_down_mission
+trace_phase teardown "$TRACE_START" 0
 # Kills ALL child processes
-pkill -P $$
-sleep 1
+pkill -P $$ >&/dev/null
 
 # Resets path, lib
 safe_exit 0
@@ -161,6 +161,14 @@ vecho "Shoreside variables set" 1
 [ "$JOB_TIMEOUT" -gt 1 ] || { vexit "JOB_TIMEOUT ($JOB_TIMEOUT) not greater than one" 12; }
 vecho "JOB_TIMEOUT set" 1
 
+#-------------------------------------------------------
+#  Part 5: Check the stopping rule, if there is one
+#-------------------------------------------------------
+if [[ -n "$STOP_CI" ]]; then
+    /"${MONTE_MOOS_BASE_DIR}"/scripts/early_stop.py --check_rule --rule="$STOP_CI" >&/dev/null || { vexit "STOP_CI ($STOP_CI) is not a valid stopping rule. Use STOP_CI=\"column=width column=width% ...\"" 13; }
+    vecho "STOP_CI is good" 1
+fi
+
 #-------------------------------------------------------
 #  Done!
 #-------------------------------------------------------
@@ -109,6 +109,8 @@ fi
 if [[ "${BINARIES}" = "yes" ]]; then
     vecho "Cleaning binaries..." 1
     [ -f "${CARLO_DIR_LOCATION}/.built_dirs" ] && rm -f "${CARLO_DIR_LOCATION}/.built_dirs"
+    # Cached builds of each revision (see lib_repo_updating_utils.sh)
+    [ -d "${CARLO_DIR_LOCATION}/.build_cache" ] && rm -rf "${CARLO_DIR_LOCATION}/.build_cache"
 fi
 
 if [ -d "${MONTE_MOOS_CLIENT_REPOS_DIR}" ]; then
@@ -218,6 +220,8 @@ fi
 #-------------------------------------------------------
 if [[ "${CACHE}" = "yes" ]]; then
     vecho "Cleaning cache (.build_dirs, bad_jobs.txt)" 1
+    # Repos get pulled again, but are only rebuilt if their revision
+    # changed. Use --binaries to also drop the .build_cache
     [ -f "${CARLO_DIR_LOCATION}/.built_dirs" ] && rm -f "${CARLO_DIR_LOCATION}/.built_dirs"
     if [[ $MYNAME != "$MONTE_MOOS_HOST" ]]; then
         /"${MONTE_MOOS_BASE_DIR}"/client_scripts/list_bad_job.sh -d
@@ -5,6 +5,10 @@ ME="monte_client_loop.sh"
 PERPETUAL=""
 IGNORE_WARNING="no"
 HOSTLESS=""
+SLOTS=1
+PORT_BASE=10000 # first MOOS port handed out to slots
+PORT_RANGE=100  # number of ports each slot may use
+FLOW_DOWN_ARGS=""
 
 # shellcheck disable=SC1090
 source "/${MONTE_MOOS_BASE_DIR}/lib/lib_include.sh"
@@ -30,20 +34,41 @@ for ARGI; do
         echo " -p,        perpetual mode. Does not exit when there are  "
         echo "            no more jobs left in the queue. Useful for "
         echo "            running in a cluster.     "
+        echo " --slots=N, -s=N  Run N jobs at once. Each slot gets its own"
+        echo "            carlo dir (.slots/slot_N), repos dir          "
+        echo "            (\$MONTE_MOOS_CLIENT_REPOS_DIR_slotN), process "
+        echo "            groups and MOOS port range. The range starts at "
+        echo "            \$MONTE_MOOS_PORT_BASE. Launches without port flags"
+        echo "            get --mport=/--pshare= from it (shoreside BASE,"
+        echo "            BASE+1, vehicle i BASE+2+2i, BASE+3+2i). Jobs with"
+        echo "            ports outside the range are skipped, not listed"
+        echo "            as bad (MONTE_MOOS_PORT_CHECK=warn to run them"
+        echo "            anyway). Logs are written to"
+        echo "            .slots/slot_N/client_loop.log. With --hostless,"
+        echo "            each slot runs its own copy of the local queue."
+        echo " --port_base=N  First port of slot 1. Default: $PORT_BASE  "
+        echo "            (slot i gets $PORT_RANGE ports from N+(i-1)*$PORT_RANGE)"
         echo "  --verbose=num, -v=num or --verbose, -v              "
         exit 0
     elif [[ "${ARGI}" = "--hostless" || "${ARGI}" = "-nh" ]]; then
         HOSTLESS="--hostless"
+        FLOW_DOWN_ARGS+="${ARGI} "
     elif [[ "${ARGI}" = "-p" ]]; then
         PERPETUAL="yes"
+        FLOW_DOWN_ARGS+="${ARGI} "
     elif [[ "${ARGI}" = "-y" ]]; then
         IGNORE_WARNING="yes"
+    elif [[ "${ARGI}" == "--slots="* || "${ARGI}" == "-s="* ]]; then
+        SLOTS="${ARGI#*=}"
+    elif [[ "${ARGI}" == "--port_base="* ]]; then
+        PORT_BASE="${ARGI#*=}"
     elif [[ "${ARGI}" == "--verbose="* || "${ARGI}" == "-v="* ]]; then
         if [[ "${ARGI}" = "--verbose" || "${ARGI}" = "-v" ]]; then
             VERBOSE=1
         else
             VERBOSE="${ARGI#*=}"
         fi
+        FLOW_DOWN_ARGS+="${ARGI} "
     else
         vexit "Unrecognized option: $ARGI" 1
     fi
@@ -60,6 +85,14 @@ if [[ -f monte_info ]]; then
     # shellcheck disable=SC1091
     source monte_info
 fi
+# monte_info is written for the main carlo dir. A slot (see Part 3b)
+# keeps its own carlo dir, repos dir and ports whatever it sets
+if [[ -n "$MONTE_MOOS_SLOT" ]]; then
+    export CARLO_DIR_LOCATION="$MONTE_MOOS_SLOT_DIR"
+    export MONTE_MOOS_CLIENT_REPOS_DIR="$MONTE_MOOS_SLOT_REPOS_DIR"
+    export MONTE_MOOS_PORT_BASE="$MONTE_MOOS_SLOT_PORT_BASE"
+    export MONTE_MOOS_PORT_RANGE="$MONTE_MOOS_SLOT_PORT_RANGE"
+fi
 
 monte_check_job.sh
 if [ $? -ne 0 ]; then
@@ -90,6 +123,79 @@ if [ -f "${CARLO_DIR_LOCATION}/force_quit" ]; then
     exit 0
 fi
 
+#-------------------------------------------------------
+#  Part 3b: Multi-slot mode. Starts one client loop per slot
+#           and waits for them. Nothing is shared between
+#           slots except myname.txt (and so the queue file),
+#           the .password and the outbox, so there's one uploader
+#-------------------------------------------------------
+if [[ $SLOTS -gt 1 && -z "$MONTE_MOOS_SLOT" ]]; then
+    SLOTS_DIR="${CARLO_DIR_LOCATION}/.slots"
+    SLOT_PIDS=()
+    # Each slot loop is the leader of its own process group, so
+    # ctrl-c/kill only needs to be passed on to each group
+    stop_slots() {
+        for pid in "${SLOT_PIDS[@]}"; do
+            kill -INT -- -"$pid" 2>/dev/null
+        done
+        wait
+    }
+    trap 'stop_slots; exit 130' INT TERM
+    export MONTE_MOOS_OUTBOX_DIR="${MONTE_MOOS_OUTBOX_DIR:-${CARLO_DIR_LOCATION}/.outbox}"
+
+    for ((i = 1; i <= SLOTS; i++)); do
+        SLOT_DIR="${SLOTS_DIR}/slot_${i}"
+        mkdir -p "$SLOT_DIR"
+        rm -f "${SLOT_DIR}/force_quit"
+        cp -p "${CARLO_DIR_LOCATION}/myname.txt" "${SLOT_DIR}/" 2>/dev/null
+        # Needed to decrypt the queue and job dirs
+        if [[ -f "${CARLO_DIR_LOCATION}/.password" ]]; then
+            ln -sf "$(cd "$CARLO_DIR_LOCATION" && pwd)/.password" "${SLOT_DIR}/.password"
+        fi
+        [[ -f monte_info ]] && cp -p monte_info "${SLOT_DIR}/"
+        if [ "$HOSTLESS" = "--hostless" ]; then
+            rm -rf "${SLOT_DIR}/local_job_dirs"
+            [[ -d "${CARLO_DIR_LOCATION}/local_job_dirs" ]] && cp -rp "${CARLO_DIR_LOCATION}/local_job_dirs" "${SLOT_DIR}/"
+            cp -p "${CARLO_DIR_LOCATION}/"*_job_queue.txt "${SLOT_DIR}/" 2>/dev/null
+        fi
+        SLOT_PORT_BASE=$((PORT_BASE + (i - 1) * PORT_RANGE))
+
+        set -m
+        (
+            cd "$SLOT_DIR" || exit 1
+            # Applied again after the slot sources monte_info (Part 1a)
+            export MONTE_MOOS_SLOT=$i
+            export MONTE_MOOS_SLOT_DIR="$SLOT_DIR"
+            export MONTE_MOOS_SLOT_REPOS_DIR="${MONTE_MOOS_CLIENT_REPOS_DIR%/}_slot${i}"
+            export MONTE_MOOS_SLOT_PORT_BASE=$SLOT_PORT_BASE
+            export MONTE_MOOS_SLOT_PORT_RANGE=$PORT_RANGE
+            export CARLO_DIR_LOCATION="$MONTE_MOOS_SLOT_DIR"
+            export MONTE_MOOS_CLIENT_REPOS_DIR="$MONTE_MOOS_SLOT_REPOS_DIR"
+            export MONTE_MOOS_PORT_BASE=$SLOT_PORT_BASE
+            export MONTE_MOOS_PORT_RANGE=$PORT_RANGE
+            # shellcheck disable=SC2086
+            exec monte_client_loop.sh $FLOW_DOWN_ARGS -y
+        ) >"${SLOT_DIR}/client_loop.log" 2>&1 </dev/null &
+        SLOT_PID=$!
+        SLOT_PIDS+=("$SLOT_PID")
+        set +m
+        secho "Started slot $i (pid ${SLOT_PID}, ports ${SLOT_PORT_BASE}-$((SLOT_PORT_BASE + PORT_RANGE - 1)))"
+    done
+
+    # A force_quit in the main carlo dir stops each slot after its current job
+    while [[ -n "$(jobs -pr)" ]]; do
+        if [ -f "${CARLO_DIR_LOCATION}/force_quit" ]; then
+            for ((i = 1; i <= SLOTS; i++)); do
+                touch "${SLOTS_DIR}/slot_${i}/force_quit"
+            done
+        fi
+        sleep 5
+    done
+    wait
+    secho "All $SLOTS slots have exited"
+    exit 0
+fi
+
 #-------------------------------------------------------
 #  Part 4: Force updates on monte-moos and moos-dirs
 #-------------------------------------------------------
@@ -114,6 +220,8 @@ fi
 #-------------------------------------------------------
 while true; do
     vecho "New iteration of loop..." 10
+    # monte_run_job.sh sets its own phase (see status.jsonl)
+    export MONTE_MOOS_STATUS_PHASE="idle"
     monte_clean.sh
     this_hour=$(get_hour)
 
@@ -169,6 +277,11 @@ while true; do
     elif [ $EXIT -eq 2 ]; then
         secho "Skipping bad job..."
     #- - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Exit code 10: Job's ports don't fit this slot's range
+    elif [ $EXIT -eq 10 ]; then
+        secho "Skipping job with ports outside of this slot's range. Waiting $SLEEP_TIME seconds..."
+        check_sleep $SLEEP_TIME
+    #- - - - - - - - - - - - - - - - - - - - - - - - - -
     # Exit code 8: Unable to pull queue file. Trying again
     elif [ $EXIT -eq 8 ]; then
         secho "Unable to pull queue file. Trying again in $SLEEP_TIME seconds..."
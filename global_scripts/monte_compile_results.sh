@@ -26,7 +26,8 @@ for ARGI; do
         echo "Updates compiles the results for a single job file given the "
         echo "directory for that job's results and the job file itself. "
         echo "                                                          "
-        echo "This script copies files in job_results/web, and appends the    "
+        echo "This script publishes files in job_results/web (hardlinked from"
+        echo "a content-addressed store, see scripts/publish_web.py), and appends the"
         echo "job_results/results.csv file to web/monte/.../job_name/results.csv"
         echo "It also generates a scatterplot of X vs Y and publishes it online."
         echo "   For now, X=<first column in results.csv> Y=<second column>"
@@ -54,6 +55,7 @@ for ARGI; do
         INPUT_JOB_RESULTS_DIR="${ARGI#*=}"
     elif [[ "${ARGI}" == "--output_results="* ]]; then
         compiled="${ARGI#*=}"
+        OUTPUT_RESULTS_GIVEN="yes"
     elif [[ "${ARGI}" == "--job_file="* ]]; then
         PATH_TO_JOB_FILE="${ARGI#*=}"
     elif [[ "${ARGI}" = "--verbose" || "${ARGI}" = "-v" ]]; then
@@ -121,57 +123,33 @@ if [ ! -d "$INPUT_JOB_RESULTS_DIR" ]; then
 fi
 
 mkdir -p "$compiled"
-vecho "monte_merge_results.py --job=$JOB_NAME --output=$compiled_csv  --wd=$INPUT_JOB_RESULTS_DIR" 1
-monte_merge_results.py --job="$JOB_NAME" --output="$compiled_csv" --wd="$INPUT_JOB_RESULTS_DIR" #&> /dev/null
+# --incremental only parses runs that are new/changed since the last call
+# --columns keeps a .npy copy of results.csv that pltcsv.py maps directly
+vecho "monte_merge_results.py --job=$JOB_NAME --output=$compiled_csv  --wd=$INPUT_JOB_RESULTS_DIR --incremental --columns" 1
+monte_merge_results.py --job="$JOB_NAME" --output="$compiled_csv" --wd="$INPUT_JOB_RESULTS_DIR" --incremental --columns #&> /dev/null
 EXIT_CODE=$?
 [ $EXIT_CODE -eq 0 ] || echo "${txtylw}Error running scripts/merge_results.py ---job=$JOB_NAME --output=$compiled_csv --wd=$INPUT_JOB_RESULTS_DIR ${txtrst}"
 
 #--------------------------------------------------------------
-#  Part 4: Copy the web subdirectories (only for host)
+#  Part 4: Publish the web subdirectories of new runs to
+#          post_processed/<JOB_ID> (JOB_ID format: job_name_hash).
+#          Files are stored once by content in a blob store shared
+#          by every job, and hardlinked into post_processed. Runs
+#          already published are listed in .post_processed.index.json
+#          so only new runs are looked at (see scripts/publish_web.py)
 #--------------------------------------------------------------
-# Loop through every run of the job
-# if [[ $MONTE_MOOS_HOST == $MYNAME ]]; then
-for job_result in "$INPUT_JOB_RESULTS_DIR"/*; do
-    if [ -d "$job_result" ]; then
-        JOB_ID="${job_result#"$INPUT_JOB_RESULTS_DIR"/}" # JOB_ID format: job_name_hash
-
-        # - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-        # Check if the job has already been extracted
-        # - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-        if [ -d "$post_processed_dirs/$JOB_ID" ]; then
-            vecho "    $job_result has already been extracted. Skipping..." 5
-            continue
-        fi
-        vecho "    $job_result directory has not been extracted. Extracting..." 1
-
-        # - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-        # copy the yco/.../job_name/job_name_hash/web/ directory to
-        #          /web/results/job_name/post_processed/job_name_hash
-        # - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-        #  if [ there's something to cp] and [the job hasn't been copied yet]
-        if [ -d "$job_result/web" ] && [ ! -d "$post_processed_dirs/$JOB_ID" ]; then
-            # only copy if the web isn't empty
-            if [ "$(ls -A "$job_result"/web)" ]; then
-                mkdir -p "$post_processed_dirs/$JOB_ID"
-                # Copy or link the results to the web directory
-                if [ "$TYPE" = "cp" ]; then
-                    vecho "cp -rp $job_result/web/* $post_processed_dirs/$JOB_ID" 3
-                    cp -rp "$job_result/web/"* "$post_processed_dirs/$JOB_ID" 2>/dev/null
-                elif [ "$TYPE" = "ln" ]; then
-                    vecho "ln -s $job_result/web/* $post_processed_dirs/$JOB_ID" 3
-                    ln -s "$job_result/web/"* "$post_processed_dirs/$JOB_ID"
-                fi
-            else
-                vecho "$job_result/web is empty. Nothing to copy" 3
-            fi
-        else
-            [ -d "$job_result/web" ] || { vecho "No results to copy to web (no dir at $job_result/web)" 3; }
-            [ ! -d "$post_processed_dirs/$JOB_ID" ] || { vecho "Results have already been copied to ($post_processed_dirs/$JOB_ID)" 3; }
-        fi
-    else
-        vecho "    $job_result is not a directory. Skipping..." 2
-    fi
-done
+if [[ -n $OUTPUT_RESULTS_GIVEN ]]; then
+    BLOB_DIR="$compiled/.blobs"
+else
+    BLOB_DIR="$OUTPUT_BASE_DIR/.blobs"
+fi
+PUBLISH_FLAGS=""
+[ "$TYPE" = "ln" ] && PUBLISH_FLAGS="--symlink"
+vecho "publish_web.py --input=$INPUT_JOB_RESULTS_DIR --output=$post_processed_dirs --blobs=$BLOB_DIR $PUBLISH_FLAGS" 1
+# shellcheck disable=SC2086
+/"${MONTE_MOOS_BASE_DIR}"/scripts/publish_web.py --input="$INPUT_JOB_RESULTS_DIR" --output="$post_processed_dirs" --blobs="$BLOB_DIR" -v="$VERBOSE" $PUBLISH_FLAGS
+EXIT_CODE=$?
+[ $EXIT_CODE -eq 0 ] || echo "${txtylw}Error running /${MONTE_MOOS_BASE_DIR}/scripts/publish_web.py${txtrst}"
 
 #--------------------------------------------------------------
 #  Part 5: Determine what to plot using job file
@@ -197,4 +175,18 @@ else
     fi
 fi
 
+#--------------------------------------------------------------
+#  Part 6: Early stopping (host only). If the job file has a
+#          stopping rule (STOP_CI="column=width ..."), update its
+#          confidence intervals with the runs merged above, and cap
+#          the job's runs desired in the host queue at the runs
+#          projected to be needed.
+#--------------------------------------------------------------
+if [[ -n "$STOP_CI" && $MONTE_MOOS_HOST == "$MYNAME" && -f "${compiled_csv}" ]]; then
+    vecho "early_stop.py --results=$compiled_csv --rule=\"$STOP_CI\" --confidence=${STOP_CONFIDENCE:-0.95} --min_runs=${STOP_MIN_RUNS:-10} --job=$JOB_SHORT_PATH" 1
+    /"${MONTE_MOOS_BASE_DIR}"/scripts/early_stop.py --results="$compiled_csv" --rule="$STOP_CI" --confidence="${STOP_CONFIDENCE:-0.95}" --min_runs="${STOP_MIN_RUNS:-10}" --job="$JOB_SHORT_PATH" --queue_file="${CARLO_DIR_LOCATION}/host_job_queue.txt" -v="$VERBOSE"
+    EXIT_CODE=$?
+    [ $EXIT_CODE -eq 0 ] || echo "${txtylw}Error running /${MONTE_MOOS_BASE_DIR}/scripts/early_stop.py${txtrst}"
+fi
+
 exit 0
@@ -146,6 +146,7 @@ if [ -z "$hash" ]; then
     hash=$(mhash_gen)
 fi
 vecho "Hash = $hash" 1
+export MONTE_MOOS_TRACE_HASH="$hash"
 LOCAL_RESULTS_DIR="${CARLO_DIR_LOCATION}/results"
 
 #-------------------------------------------------------
@@ -168,6 +169,9 @@ fi
 
 # Writes to an argfile, which saves the job name job args
 echo "$JOB_FILE $JOB_ARGS" >>"$LOCAL_JOB_RESULTS_DIR"/.argfile
+# The job args as a column of the merged results, so the queue lines of
+# a job can be told apart (see early_stop.py)
+printf 'job_args\n"%s"\n' "${JOB_ARGS//\"/\"\"}" >"$LOCAL_JOB_RESULTS_DIR"/job_args.csv
 
 #-------------------------------------------------------
 #  Part 4: Run post-processing script specific
@@ -191,6 +195,7 @@ fi
 chmod +x "${results_script_directory}"/post_process_results.sh
 
 # Step 3: Execute the script
+TRACE_START=$(trace_now)
 vecho "$(tput bold)${txtylw}Using the script: $(tput smul)${results_script_directory}/post_process_results.sh Ensure this is the correct script" 1
 if [[ $JOB_ARGS == "" ]]; then
     vecho "Running with these flags: $(tput smul)${results_script_directory}/post_process_results.sh --job_file=$JOB_FILE --local_results_dir=$LOCAL_JOB_RESULTS_DIR" 1
@@ -201,6 +206,7 @@ else
 fi
 
 EXIT_CODE=$?
+trace_phase post_process "$TRACE_START" $EXIT_CODE
 if [ $EXIT_CODE -ne 0 ]; then
     vexit "${results_script_directory}/post_process_results.sh --job_file=\"$JOB_FILE\" --local_results_dir=\"$LOCAL_JOB_RESULTS_DIR\" exited with code: $EXIT_CODE " 2
 fi
@@ -221,12 +227,27 @@ else
     vecho "Results saved to $(tput smul)${txtblu}${LOCAL_JOB_RESULTS_DIR}" 1
 fi
 
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#  Part 4b: The run's trace (so far) goes with the results,
+#           with the hash filled in on the records made
+#           before it was known
+if [[ -f $MONTE_MOOS_TRACE_FILE ]]; then
+    TRACE_HASH="\"hash\":\"$(json_escape "$hash")\""
+    while IFS= read -r TRACE_LINE; do
+        echo "${TRACE_LINE/\"hash\":\"\"/$TRACE_HASH}"
+    done <"$MONTE_MOOS_TRACE_FILE" >"$LOCAL_JOB_RESULTS_DIR/trace.jsonl"
+fi
+
 #- - - - - - - - - - - - - - - - - - - - - - - - - - - -
 #  Part 5: Send results to host, if desired
 if [[ $OFFLOAD != "no" ]]; then
     vecho "Part 5: Offloading results $LOCAL_JOB_RESULTS_DIR $HOST_RESULTS_FULL_DIR " 5
-    /"${MONTE_MOOS_BASE_DIR}"/client_scripts/send2host.sh "$LOCAL_JOB_RESULTS_DIR" "$HOST_RESULTS_FULL_DIR"
-    [ $? -eq 0 ] || { vexit "send2host.sh $LOCAL_JOB_RESULTS_DIR $HOST_RESULTS_FULL_DIR failed with exit code $?" 3; }
+    # Moved into the outbox, the uploader sends it in the background
+    TRACE_START=$(trace_now)
+    /"${MONTE_MOOS_BASE_DIR}"/client_scripts/send2host.sh --move "$LOCAL_JOB_RESULTS_DIR" "$HOST_RESULTS_FULL_DIR"
+    EXIT_CODE=$?
+    trace_phase send "$TRACE_START" $EXIT_CODE
+    [ $EXIT_CODE -eq 0 ] || { vexit "send2host.sh $LOCAL_JOB_RESULTS_DIR $HOST_RESULTS_FULL_DIR failed with exit code $EXIT_CODE" 3; }
     rm -rf "$LOCAL_JOB_RESULTS_DIR"
 else
     vecho "Not offloading results" 1
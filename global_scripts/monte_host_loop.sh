@@ -75,6 +75,12 @@ while [ "$QUEUE_COMPLETE" != "yes" ] || [ "$PERPETUAL" = "yes" ]; do
         vexit "Error. monte-moos/host_scripts/merge_all_queues.sh exit code: $EXIT_CODE" 5
     fi
 
+    # Re-apply the early stopping caps (see monte_compile_results.sh),
+    # in case the merge brought back the original runs desired
+    if [ -f "${CARLO_DIR_LOCATION}/early_stop_caps.json" ]; then
+        "/${MONTE_MOOS_BASE_DIR}/scripts/early_stop.py" --apply --queue_file="${CARLO_DIR_LOCATION}/host_job_queue.txt" -v=$VERBOSE
+    fi
+
     #- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     #  Part 3a: Push latest queue to web
     #- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -114,6 +120,28 @@ while [ "$QUEUE_COMPLETE" != "yes" ] || [ "$PERPETUAL" = "yes" ]; do
     [ $EXIT_CODE -eq 0 ] || { vexit "running ${MONTE_MOOS_BASE_DIR}/host_scripts/update_job_dirs.sh returned exit code: $EXIT_CODE" 2; }
     check_quit
 
+    #- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    #  Part 3b: Roll the clients' status streams up into one summary
+    #           (and <client>.txt, for anything reading the old files)
+    #- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    STATUS_DIR="${MONTE_MOOS_HOST_RECIEVE_DIR}/clients/status"
+    if [ -d "$STATUS_DIR" ]; then
+        python3 "/${MONTE_MOOS_BASE_DIR}/scripts/status_stream.py" --summary="$STATUS_DIR" --txt --output="${MONTE_MOOS_HOST_RECIEVE_DIR}/clients/fleet_summary.txt"
+        python3 "/${MONTE_MOOS_BASE_DIR}/scripts/status_stream.py" --summary="$STATUS_DIR" --json --output="${MONTE_MOOS_HOST_RECIEVE_DIR}/clients/fleet_summary.json"
+        [ $VERBOSE -ge 1 ] && cat "${MONTE_MOOS_HOST_RECIEVE_DIR}/clients/fleet_summary.txt"
+    fi
+
+    #- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    #  Part 3b: Where the clients' time goes, from the run traces
+    #           that come back with the results (trace.jsonl), over
+    #           the last MONTE_MOOS_TRACE_HOURS (default a week). The
+    #           index keeps the traces already read, so only new ones
+    #           are parsed
+    #- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    if [ -d "${MONTE_MOOS_HOST_RECIEVE_DIR}/results" ]; then
+        python3 "/${MONTE_MOOS_BASE_DIR}/scripts/run_trace.py" "${MONTE_MOOS_HOST_RECIEVE_DIR}/results" --since="${MONTE_MOOS_TRACE_HOURS:-168}" --index="${MONTE_MOOS_HOST_RECIEVE_DIR}/clients/.trace_report.index.json" --output="${MONTE_MOOS_HOST_RECIEVE_DIR}/clients/trace_report.txt" --json_output="${MONTE_MOOS_HOST_RECIEVE_DIR}/clients/trace_report.json"
+    fi
+
     #- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     #  Part 3c: If it will do another loop, wait a bit
     #- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -1,55 +1,397 @@
 #!/usr/bin/env python3
 import csv
+import json
 import os
 import sys
+import tempfile
+from array import array
+from multiprocessing import Pool
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
+MANIFEST_VERSION = 2
+COLUMNS_VERSION = 1
 
-def merge_csv_files(main_dir, output_file, job_name):
-    """Function merging all results.csv files for a given job_name to an output_file."""
-    skip_dirs = set()
-    skip_dirs.add(job_name)
-    all_headers = set()
-    data = {}
 
-    # if os.path.exists(output_file):
-    #     with open(output_file, 'r') as f:
-    #         reader = csv.DictReader(f)
-    #         headers = reader.fieldnames
-    #         all_headers.update(headers[1:])
-    #         for row in reader:
-    #             skip_dirs.add(row[job_name])
-    #             data[job_name] = row
+def find_run_dirs(main_dir, job_name):
+    """Walks main_dir, yielding each run directory (job_name_hash) of a job.
 
+    Returns:
+        generator of (string, string, list): the run's name, its path and the
+            names of the csv files inside of it
+    """
     for subdir, _, files in os.walk(main_dir):
         subdir_name = os.path.basename(subdir)
-        if subdir_name in skip_dirs:
+        if subdir_name == job_name:
             continue
         if not (job_name in subdir_name):
             continue
-        for file in files:
-            if file.endswith('.csv'):
-                data[subdir_name] = {}
-                try:
-                    with open(os.path.join(subdir, file), 'r') as f:
-                        reader = csv.DictReader(f)
-                        headers = reader.fieldnames
-                        all_headers.update(headers)
-                        for row in reader:
-                            data[subdir_name].update(row)
-                except Exception as e:
-                    print(f'Error reading file {file}: {e}')
+        csv_files = [file for file in files if file.endswith('.csv')]
+        if csv_files:
+            yield subdir_name, subdir, csv_files
+
+
+def read_run(subdir, csv_files):
+    """Reads the csv files of a single run (ex: results.csv and the
+    metrics.csv of alog_metrics.py). Every file adds its headers and values
+    to the run's row. Files are read in name order, so when two have the
+    same column, the later name's value is kept whatever the listing order.
+
+    Returns:
+        list, dict: headers found in the run, merged row of the run
+    """
+    headers = set()
+    row_data = {}
+    for file in sorted(csv_files):
+        try:
+            with open(os.path.join(subdir, file), 'r') as f:
+                reader = csv.DictReader(f)
+                headers.update(reader.fieldnames)
+                for row in reader:
+                    row_data.update(row)
+        except Exception as e:
+            print(f'Error reading file {file}: {e}')
+    return sorted(headers), row_data
+
+
+def run_signature(subdir, csv_files):
+    """Size and mtime of every csv file in a run, used to detect changes."""
+    signature = {}
+    for file in csv_files:
+        try:
+            stat = os.stat(os.path.join(subdir, file))
+            signature[file] = [stat.st_size, stat.st_mtime_ns]
+        except OSError:
+            signature[file] = None
+    return signature
+
+
+def write_results(output_file, job_name, all_headers, data, mode='w'):
+    """Writes (or appends, without a header) rows to the output file.
+
+    Returns:
+        bool: False if the output file could not be written
+    """
+    try:
+        with open(output_file, mode, newline='') as f:
+            writer = csv.writer(f)
+            if mode == 'w':
+                writer.writerow([job_name] + all_headers)
+            for subdir_name, row_data in data.items():
+                row = [subdir_name]
+                for header in all_headers:
+                    row.append(row_data.get(header, ''))
+                writer.writerow(row)
+    except Exception as e:
+        print(f'Error writing to output file: {e}')
+        return False
+    return True
+
+
+def merge_csv_files(main_dir, output_file, job_name):
+    """Function merging all results.csv files for a given job_name to an output_file."""
+    all_headers = set()
+    data = {}
+
+    for subdir_name, subdir, csv_files in find_run_dirs(main_dir, job_name):
+        headers, data[subdir_name] = read_run(subdir, csv_files)
+        all_headers.update(headers)
     all_headers = sorted(list(all_headers))
+    write_results(output_file, job_name, all_headers, data)
+
+
+def scan_run_dirs(main_dir, job_name):
+    """Same as find_run_dirs (and in the same order as os.walk), but built on
+    os.scandir so the directory entries are only listed once."""
+    stack = [main_dir]
+    while stack:
+        subdir = stack.pop()
+        csv_files = []
+        dirs = []
+        try:
+            with os.scandir(subdir) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if not entry.is_symlink():
+                            dirs.append(entry.path)
+                    elif entry.name.endswith('.csv'):
+                        csv_files.append(entry.name)
+        except OSError:
+            continue
+        subdir_name = os.path.basename(subdir)
+        if csv_files and subdir_name != job_name and job_name in subdir_name:
+            yield subdir_name, subdir, csv_files
+        # os.walk is top-down, depth first, in listing order
+        stack.extend(reversed(dirs))
+
+
+def _read_run_task(task):
+    """Pool worker: parses one run directory."""
+    subdir_name, subdir, csv_files = task
+    headers, row_data = read_run(subdir, csv_files)
+    row_data.pop(None, None)  # extra values without a header are never written
+    return subdir_name, headers, row_data
+
+
+def _row_size(row_data):
+    """Rough number of bytes a parsed row holds in memory."""
+    return 200 + sum(100 + len(k) + len(v or '') for k, v in row_data.items()
+                     if isinstance(v, str) or v is None)
+
+
+def merge_csv_files_parallel(main_dir, output_file, job_name, workers=1, max_memory=256):
+    """Gives the same output as merge_csv_files, for jobs with too many runs to
+    hold in memory. Runs are found with os.scandir and parsed by a pool of
+    workers. Parsed rows are kept in memory up to max_memory (MB), and past
+    that are spilled to a temporary file. The output is then written in a
+    second pass, once the union of the headers is known.
+    """
+    all_headers = set()
+    seen = set()
+    dup_rows = {}  # same run name in two places: last row wins, first position kept
+    buffer = []
+    buffer_size = 0
+    max_bytes = max_memory * 1024 * 1024
+    spill = None
+
+    tasks = scan_run_dirs(main_dir, job_name)
+    pool = Pool(workers) if workers > 1 else None
+    try:
+        if pool is not None:
+            results = pool.imap(_read_run_task, tasks, chunksize=64)
+        else:
+            results = map(_read_run_task, tasks)
+
+        # Pass 1: parse every run, collect the header union
+        for subdir_name, headers, row_data in results:
+            all_headers.update(headers)
+            if subdir_name in seen:
+                dup_rows[subdir_name] = row_data
+                continue
+            seen.add(subdir_name)
+            buffer.append((subdir_name, row_data))
+            buffer_size += _row_size(row_data)
+            if buffer_size > max_bytes:
+                if spill is None:
+                    spill = tempfile.TemporaryFile(
+                        'w+', dir=os.path.dirname(os.path.abspath(output_file)))
+                for item in buffer:
+                    spill.write(json.dumps(item) + "\n")
+                buffer = []
+                buffer_size = 0
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    all_headers = sorted(list(all_headers))
+
+    # Pass 2: stream the rows out
+    def rows():
+        if spill is not None:
+            spill.seek(0)
+            for line in spill:
+                yield json.loads(line)
+        yield from buffer
+
     try:
         with open(output_file, 'w', newline='') as f:
             writer = csv.writer(f)
             writer.writerow([job_name] + all_headers)
-            for subdir_name, row_data in data.items():
+            for subdir_name, row_data in rows():
+                if subdir_name in dup_rows:
+                    row_data = dup_rows[subdir_name]
                 row = [subdir_name]
                 for header in all_headers:
                     row.append(row_data.get(header, ''))
                 writer.writerow(row)
     except Exception as e:
         print(f'Error writing to output file: {e}')
+    finally:
+        if spill is not None:
+            spill.close()
+
+
+def manifest_filename(output_file):
+    """Sidecar manifest kept next to the output file (results.csv ->
+    .results.csv.manifest.json)"""
+    return os.path.join(os.path.dirname(output_file),
+                        "." + os.path.basename(output_file) + ".manifest.json")
+
+
+def load_manifest(output_file, job_name):
+    """Returns the manifest of a prior merge, or None if it can't be reused.
+    It can't if the output file was written since (ex: by a full merge)."""
+    if not os.path.isfile(output_file):
+        return None
+    try:
+        with open(manifest_filename(output_file), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("job") != job_name:
+        return None
+    if manifest.get("output") != source_stat(output_file):
+        return None
+    return manifest
+
+
+def save_manifest(output_file, job_name, runs):
+    """Atomically writes the manifest for output_file, along with the
+    output's size and mtime."""
+    fname = manifest_filename(output_file)
+    temp = fname + ".tmp"
+    with open(temp, 'w') as f:
+        json.dump({"version": MANIFEST_VERSION, "job": job_name, "runs": runs,
+                   "output": source_stat(output_file)}, f)
+    os.replace(temp, fname)
+
+
+def read_results(output_file, job_name):
+    """Reads a previously merged output file back into {run: row}."""
+    data = {}
+    with open(output_file, 'r', newline='') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            subdir_name = row.pop(job_name, None)
+            if subdir_name is not None:
+                data[subdir_name] = row
+    return data
+
+
+def merge_csv_files_incremental(main_dir, output_file, job_name):
+    """Like merge_csv_files, but only parses runs that are new or whose csv
+    files changed (size/mtime) since the last merge. New runs are appended to
+    output_file; the file is only rewritten when runs change, disappear, or
+    bring new columns.
+
+    Returns:
+        int: number of runs that were (re)parsed
+    """
+    manifest = load_manifest(output_file, job_name)
+    old_runs = manifest["runs"] if manifest else {}
+    runs = {}
+    changed = {}
+    for subdir_name, subdir, csv_files in find_run_dirs(main_dir, job_name):
+        signature = run_signature(subdir, csv_files)
+        old = old_runs.get(subdir_name)
+        if old is not None and old["files"] == signature:
+            runs[subdir_name] = old
+            continue
+        headers, changed[subdir_name] = read_run(subdir, csv_files)
+        runs[subdir_name] = {"files": signature, "headers": headers}
+
+    all_headers = set()
+    for run in runs.values():
+        all_headers.update(run["headers"])
+    all_headers = sorted(list(all_headers))
+
+    written = True
+    if manifest is None:
+        # No usable prior merge, write everything
+        data = {name: changed[name] for name in runs}
+        written = write_results(output_file, job_name, all_headers, data)
+    else:
+        old_headers = set()
+        for run in old_runs.values():
+            old_headers.update(run["headers"])
+        removed = [name for name in old_runs if name not in runs]
+        only_new = all(name not in old_runs for name in changed)
+        if not changed and not removed:
+            pass  # nothing to do
+        elif only_new and not removed and sorted(old_headers) == all_headers:
+            written = write_results(output_file, job_name, all_headers, changed, mode='a')
+        else:
+            data = read_results(output_file, job_name)
+            for name in removed:
+                data.pop(name, None)
+            data.update(changed)
+            written = write_results(output_file, job_name, all_headers, data)
+    # Runs that didn't make it to the output must be parsed again next time
+    if written:
+        save_manifest(output_file, job_name, runs)
+    return len(changed)
+
+
+def columns_dirname(output_file):
+    """Columnar store kept next to the output file (results.csv ->
+    .results.csv.columns/)"""
+    return os.path.join(os.path.dirname(output_file),
+                        "." + os.path.basename(output_file) + ".columns")
+
+
+def source_stat(output_file):
+    """Size and mtime of the output file, used by readers to make sure the
+    columnar store matches the csv."""
+    stat = os.stat(output_file)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def write_columns(output_file, job_name):
+    """Writes a typed, columnar copy of output_file: one float64 .npy file per
+    column (values that are not numbers are NaN, like np.genfromtxt) plus a
+    schema.json. Readers can np.load(mmap_mode='r') each column instead of
+    parsing the csv. The first column (run names) is text and is not stored.
+    Does nothing if the store is already up to date.
+    """
+    if np is None:
+        print("numpy not found, not writing the columnar store")
+        return
+    columns_dir = columns_dirname(output_file)
+    schema_file = os.path.join(columns_dir, "schema.json")
+    try:
+        with open(schema_file, 'r') as f:
+            old_schema = json.load(f)
+        if old_schema.get("version") == COLUMNS_VERSION and \
+                old_schema.get("source") == source_stat(output_file):
+            return
+    except (OSError, ValueError):
+        pass
+
+    nan = float('nan')
+    with open(output_file, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = [h.strip() for h in next(reader, [])]
+        values = [array('d') for _ in header]
+        rows = 0
+        for row in reader:
+            rows += 1
+            for i in range(1, len(header)):
+                try:
+                    values[i].append(float(row[i]))
+                except (ValueError, IndexError):
+                    values[i].append(nan)
+
+    os.makedirs(columns_dir, exist_ok=True)
+    columns = []
+    for i, name in enumerate(header):
+        if i == 0:
+            columns.append({"name": name, "file": None, "dtype": "text"})
+            continue
+        fname = f"c{i:05d}.npy"
+        temp = os.path.join(columns_dir, ".tmp_" + fname)
+        with open(temp, 'wb') as f:
+            np.save(f, np.frombuffer(values[i], dtype=np.float64))
+        os.replace(temp, os.path.join(columns_dir, fname))
+        columns.append({"name": name, "file": fname, "dtype": "float64"})
+        values[i] = None
+
+    # Remove columns left over from an older, wider output file
+    kept = set(column["file"] for column in columns)
+    for fname in os.listdir(columns_dir):
+        if fname.endswith(".npy") and fname not in kept:
+            os.remove(os.path.join(columns_dir, fname))
+
+    schema = {"version": COLUMNS_VERSION, "job": job_name, "rows": rows,
+              "source": source_stat(output_file), "columns": columns}
+    with open(schema_file + ".tmp", 'w') as f:
+        json.dump(schema, f, indent=1)
+    os.replace(schema_file + ".tmp", schema_file)
 
 
 def display_help():
@@ -63,6 +405,14 @@ def display_help():
     print("                             add a column in the output file containing the     ")
     print("                             the job_file name. Defaults do basename(working_dir)")
     print("     -wd=<working_dir>       Working directory of this script. Defaults to \".\"  ")
+    print("     --incremental, -i       Only parse runs that are new or changed since the  ")
+    print("                             last merge (tracked in .<output>.manifest.json)    ")
+    print("     --workers=<N>, -w=<N>   Parse run directories with N worker processes,     ")
+    print("                             streaming rows to disk (same output, bounded RAM)  ")
+    print("     --max_memory=<MB>       With --workers, rows held in memory before spilling")
+    print("                             to a temporary file. Defaults to 256               ")
+    print("     --columns, -c           Also write a columnar copy of the output (one .npy ")
+    print("                             per column in .<output>.columns/) for fast plotting")
 
 
 def main():
@@ -71,6 +421,10 @@ def main():
     working_dir = ""
     output_file = ""
     job_name = ""
+    incremental = False
+    workers = 0
+    max_memory = 256
+    columns = False
     for (i, arg) in enumerate(sys.argv):
         # skip over the name of this script
         if i == 0:
@@ -90,6 +444,18 @@ def main():
         if arg.startswith("--job="):
             job_name = arg[len("--job="):]
             continue
+        if arg.startswith("--workers=") or arg.startswith("-w="):
+            workers = int(arg[arg.index("=")+1:])
+            continue
+        if arg.startswith("--max_memory="):
+            max_memory = int(arg[len("--max_memory="):])
+            continue
+        if arg == "--columns" or arg == "-c":
+            columns = True
+            continue
+        if arg == "--incremental" or arg == "-i":
+            incremental = True
+            continue
         if working_dir == "":
             print("Setting working dir = "+arg)
             working_dir = arg
@@ -105,7 +471,14 @@ def main():
     if output_file == "":
         output_file = working_dir + "/results.csv"
 
-    merge_csv_files(working_dir, output_file, job_name)
+    if incremental:
+        merge_csv_files_incremental(working_dir, output_file, job_name)
+    elif workers > 0:
+        merge_csv_files_parallel(working_dir, output_file, job_name, workers, max_memory)
+    else:
+        merge_csv_files(working_dir, output_file, job_name)
+    if columns and os.path.isfile(output_file):
+        write_columns(output_file, job_name)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,212 @@
+#!/bin/bash
+#--------------------------------------------------------------
+# Author: Kevin Becker
+# Script: monte_pack.sh
+#--------------------------------------------------------------
+# Part 0: Convenience functions, defaults
+#--------------------------------------------------------------
+ME="monte_pack.sh"
+MODE="pack"
+CODEC="gzip"
+LEVEL=""
+THREADS=""
+FORMAT=""
+PACK_MAGIC="MMPACK"
+
+source "/${MONTE_MOOS_BASE_DIR}/lib/lib_include.sh"
+
+# Prints the (de)compress command for a codec, preferring the
+# multi-threaded version when it is installed.
+#   $1: codec (gzip, zstd or xz)
+#   $2: "c" to compress, "d" to decompress
+compress_cmd() {
+    local codec=$1
+    local direction=$2
+    case "$codec" in
+    gzip)
+        if command -v pigz >/dev/null 2>&1; then
+            [ "$direction" = "c" ] && echo "pigz -c -${LEVEL:-6} -p $THREADS" || echo "pigz -dc -p $THREADS"
+        else
+            [ "$direction" = "c" ] && echo "gzip -c -${LEVEL:-6}" || echo "gzip -dc"
+        fi
+        ;;
+    zstd)
+        [ "$direction" = "c" ] && echo "zstd -c -q -${LEVEL:-3} -T$THREADS" || echo "zstd -dc -q"
+        ;;
+    xz)
+        [ "$direction" = "c" ] && echo "xz -c -${LEVEL:-6} -T$THREADS" || echo "xz -dc -T$THREADS"
+        ;;
+    *)
+        return 1
+        ;;
+    esac
+}
+
+#-------------------------------------------------------
+#  Part 1: Check for and handle command-line arguments
+#-------------------------------------------------------
+for ARGI; do
+    if [ "${ARGI}" = "--help" -o "${ARGI}" = "-h" ]; then
+        echo "$ME [OPTIONS] [DIR]  OR                                   "
+        echo "$ME [OPTIONS] --unpack [FILE]                             "
+        echo "                                                          "
+        echo " Packs a directory into one encrypted archive in a single "
+        echo " pass (tar | compress | openssl), with no intermediate    "
+        echo " .tar.gz or .enc files. --unpack does the reverse.        "
+        echo "                                                          "
+        echo " Formats:                                                 "
+        echo "   1: openssl enc -pbkdf2 -aes-256-cbc of a .tar.gz. Same "
+        echo "      as monte_compress.sh + monte_encrypt.sh. The default"
+        echo "      for --codec=gzip, so older clients can still read it"
+        echo "   2: a \"$PACK_MAGIC 2 <codec>\" line, then the same       "
+        echo "      encryption of a tar compressed with <codec>         "
+        echo " --unpack reads both (the format is detected).            "
+        echo "                                                          "
+        echo "Options:                                                  "
+        echo " --help, -h Show this help message                        "
+        echo " --unpack, -u Unpack FILE instead of packing DIR          "
+        echo " --output=   Archive to write (default: DIR.tar.gz.enc    "
+        echo "             for format 1, DIR.tar.<codec>.enc for 2)     "
+        echo "             or, with --unpack, dir to extract into       "
+        echo "             (default: the archive's dir)                 "
+        echo " --codec=    gzip (default), zstd or xz                   "
+        echo " --level=N   Compression level (default: the codec's)     "
+        echo " --threads=N Compression threads (default: all cores).    "
+        echo "             gzip uses pigz for this, if installed        "
+        echo " --format=N  1 or 2 (default: 1 for gzip, else 2)         "
+        echo " --password= For a custom password.                       "
+        echo " --delete, -d Delete original after packing/unpacking     "
+        echo " --overwrite, -o Overwrite an existing archive/dir        "
+        echo " --verbose=num, -v=num or --verbose, -v                   "
+        exit 0
+    elif [ "${ARGI}" = "--unpack" -o "${ARGI}" = "-u" ]; then
+        MODE="unpack"
+    elif [[ "${ARGI}" == "--output="* ]]; then
+        OUTPUT="${ARGI#*=}"
+    elif [[ "${ARGI}" == "--codec="* ]]; then
+        CODEC="${ARGI#*=}"
+    elif [[ "${ARGI}" == "--level="* ]]; then
+        LEVEL="${ARGI#*=}"
+    elif [[ "${ARGI}" == "--threads="* ]]; then
+        THREADS="${ARGI#*=}"
+    elif [[ "${ARGI}" == "--format="* ]]; then
+        FORMAT="${ARGI#*=}"
+    elif [[ "${ARGI}" == "--password="* ]]; then
+        PASSWORD="${ARGI#*=}"
+    elif [ "${ARGI}" = "--delete" -o "${ARGI}" = "-d" ]; then
+        DELETE="yes"
+    elif [ "${ARGI}" = "--overwrite" -o "${ARGI}" = "-o" ]; then
+        OVERWRITE="yes"
+    elif [[ "${ARGI}" == "--verbose="* || "${ARGI}" == "-v="* ]]; then
+        VERBOSE="${ARGI#*=}"
+    elif [ "${ARGI}" = "--verbose" -o "${ARGI}" = "-v" ]; then
+        VERBOSE=1
+    elif [[ -z $INPUT ]]; then
+        INPUT="${ARGI}"
+    else
+        vexit "Bad Arg: $ARGI" 1
+    fi
+done
+
+#-------------------------------------------------------
+#  Part 2: Check arguments, set defaults
+#-------------------------------------------------------
+[[ -n $INPUT ]] || { vexit "No input given. Use -h or --help for help with this script" 1; }
+INPUT="$(realpath "$INPUT")"
+vecho "INPUT = ${INPUT}" 3
+if [[ -z $PASSWORD ]]; then
+    PASSWORD=$(head -n 1 "${CARLO_DIR_LOCATION}"/.password)
+fi
+if [[ -z $THREADS ]]; then
+    THREADS=$(getconf _NPROCESSORS_ONLN 2>/dev/null || echo 1)
+fi
+# openssl reads the password from the environment, so it doesn't
+# show up in ps
+export MONTE_MOOS_PACK_PASSWORD="$PASSWORD"
+set -o pipefail
+
+#-------------------------------------------------------
+#  Part 3: Pack (dir -> tar -> compress -> encrypt)
+#-------------------------------------------------------
+if [[ $MODE == "pack" ]]; then
+    [[ -d $INPUT ]] || { vexit "No input dir found at $INPUT" 1; }
+    if [[ -z $FORMAT ]]; then
+        [[ $CODEC == "gzip" ]] && FORMAT=1 || FORMAT=2
+    fi
+    [[ $FORMAT == "1" && $CODEC != "gzip" ]] && { vexit "Format 1 is only for --codec=gzip" 1; }
+    [[ $FORMAT == "1" || $FORMAT == "2" ]] || { vexit "Unknown format $FORMAT" 1; }
+    COMPRESS=$(compress_cmd "$CODEC" c) || { vexit "Unknown codec $CODEC. Use gzip, zstd or xz" 1; }
+    if [[ -z $OUTPUT ]]; then
+        [[ $FORMAT == "1" ]] && OUTPUT="${INPUT}.tar.gz.enc" || OUTPUT="${INPUT}.tar.${CODEC}.enc"
+    fi
+    if [[ -f $OUTPUT && $OVERWRITE != "yes" ]]; then
+        vexit "File $OUTPUT already exists. Use -o or --overwrite to overwrite" 2
+    fi
+
+    vecho "Packing $INPUT to $OUTPUT (format $FORMAT, $COMPRESS)..." 1
+    # Written next to the output, then moved into place
+    TMP_OUTPUT="$(dirname "$OUTPUT")/.tmp_$(basename "$OUTPUT")"
+    {
+        [[ $FORMAT == "2" ]] && echo "$PACK_MAGIC $FORMAT $CODEC"
+        tar -C "$(dirname "$INPUT")" -cf - "$(basename "$INPUT")" |
+            $COMPRESS |
+            openssl enc -pbkdf2 -aes-256-cbc -salt -pass env:MONTE_MOOS_PACK_PASSWORD
+    } >"$TMP_OUTPUT"
+    EXIT_CODE=$?
+    if [[ $EXIT_CODE -ne 0 ]]; then
+        rm -f "$TMP_OUTPUT"
+        vexit "error packing $INPUT (exit code $EXIT_CODE)" 6
+    fi
+    mv "$TMP_OUTPUT" "$OUTPUT"
+    [[ $DELETE == "yes" ]] && rm -rf "$INPUT"
+    vecho "Output: $OUTPUT" 1
+    exit 0
+fi
+
+#-------------------------------------------------------
+#  Part 4: Unpack (decrypt -> decompress -> untar)
+#-------------------------------------------------------
+[[ -f $INPUT ]] || { vexit "No input file found at $INPUT" 1; }
+[[ -n $OUTPUT ]] || OUTPUT="$(dirname "$INPUT")"
+mkdir -p "$OUTPUT" || vexit "unable to make $OUTPUT" 1
+
+# Detect the format from the first line
+SKIP_BYTES=0
+HEADER=$(head -c 64 "$INPUT" | head -n 1 | LC_ALL=C tr -d '\0')
+if [[ $HEADER == "$PACK_MAGIC "* ]]; then
+    read -r _ FORMAT CODEC <<<"$HEADER"
+    SKIP_BYTES=$((${#HEADER} + 1))
+    [[ $FORMAT == "2" ]] || { vexit "$INPUT is format $FORMAT, which this version can't read. Update monte-moos" 3; }
+else
+    FORMAT=1
+    CODEC="gzip"
+fi
+DECOMPRESS=$(compress_cmd "$CODEC" d) || { vexit "Unknown codec $CODEC in $INPUT" 3; }
+command -v "${DECOMPRESS%% *}" >/dev/null 2>&1 || { vexit "$INPUT needs ${DECOMPRESS%% *}, which is not installed" 3; }
+
+# The dir the archive unpacks to (only the start of the archive
+# is read for this). It is replaced only with --overwrite
+TOP_DIR=$(tail -c +$((SKIP_BYTES + 1)) "$INPUT" |
+    openssl enc -pbkdf2 -d -aes-256-cbc -pass env:MONTE_MOOS_PACK_PASSWORD 2>/dev/null |
+    $DECOMPRESS 2>/dev/null | tar -tf - 2>/dev/null | head -n 1)
+TOP_DIR="${TOP_DIR%%/*}"
+if [[ -n $TOP_DIR && -d "$OUTPUT/$TOP_DIR" ]]; then
+    if [[ $OVERWRITE == "yes" ]]; then
+        vecho "Removing existing dir $OUTPUT/$TOP_DIR" 2
+        rm -rf "${OUTPUT:?}/$TOP_DIR"
+    else
+        vexit "Directory $OUTPUT/$TOP_DIR already exists. Use -o or --overwrite to overwrite" 2
+    fi
+fi
+
+vecho "Unpacking $INPUT into $OUTPUT (format $FORMAT, $DECOMPRESS)..." 1
+tail -c +$((SKIP_BYTES + 1)) "$INPUT" |
+    openssl enc -pbkdf2 -d -aes-256-cbc -pass env:MONTE_MOOS_PACK_PASSWORD |
+    $DECOMPRESS |
+    tar -C "$OUTPUT" -xf -
+EXIT_CODE=$?
+if [[ $EXIT_CODE -ne 0 ]]; then
+    vexit "error unpacking $INPUT (exit code $EXIT_CODE)" 4
+fi
+[[ $DELETE == "yes" ]] && rm -f "$INPUT"
+exit 0
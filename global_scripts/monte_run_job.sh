@@ -124,9 +124,14 @@ fi
 #          Updates status file along the way
 #-------------------------------------------------------
 
+# Tags every secho (status.jsonl) from here on with the job and phase
+export MONTE_MOOS_STATUS_JOB="$JOB_FILE $JOB_ARGS"
+export MONTE_MOOS_STATUS_PHASE="check"
+
 #- - - - - - - - - - - - - - - - - - - - - - - - - - - -
 #  Part 3a: Check job file
 echo "[1] Checking job file... "
+TRACE_START=$(trace_now)
 if [ "$HOSTLESS" = "yes" ] || [ "$TEST" = "yes" ]; then
     echo "$ME running: monte_check_job.sh  --job_file=$JOB_FILE --job_args=\"$JOB_ARGS\""
     monte_check_job.sh --job_file=$JOB_FILE --job_args="$JOB_ARGS"
@@ -135,6 +140,7 @@ else
     monte_check_job.sh --job_file=$JOB_FILE --job_args="$JOB_ARGS" --client
 fi
 EXIT_CODE=$?
+trace_phase check "$TRACE_START" $EXIT_CODE
 if [ $EXIT_CODE -ne 0 ]; then
     vexit "Job file is invalid (failed check_job.sh with exit code $EXIT_CODE)" 3
 fi
@@ -142,12 +148,16 @@ fi
 #- - - - - - - - - - - - - - - - - - - - - - - - - - - -
 #  Part 3b: Update the moos directories
 echo "[2] Updating dirs from job file... "
+export MONTE_MOOS_STATUS_PHASE="update"
 secho "Updating_dirs from $JOB_FILE"
 # cd "${CARLO_DIR_LOCATION}"
 echo "$ME: /${MONTE_MOOS_BASE_DIR}/client_scripts/update_dirs.sh --job_file=$JOB_FILE  --job_args=\"$JOB_ARGS\" -j2"
 # cd - >/dev/null
+TRACE_START=$(trace_now)
 /${MONTE_MOOS_BASE_DIR}/client_scripts/update_dirs.sh --job_file=$JOB_FILE --job_args="$JOB_ARGS" -j2
-if [ $? -ne 0 ]; then
+EXIT_CODE=$?
+trace_phase update "$TRACE_START" $EXIT_CODE
+if [ $EXIT_CODE -ne 0 ]; then
     vexit "updating dirs mentioned in job using: /${MONTE_MOOS_BASE_DIR}/client_scripts/update_dirs.sh --job_file=$JOB_FILE  --job_args=\"$JOB_ARGS\" -j2" 3
 fi
 echo $txtgrn"      Done updating dirs" $txtrst
@@ -156,11 +166,15 @@ echo $txtgrn"      Done updating dirs" $txtrst
 #  Part 3c: Run the job file
 echo "$ME: /${MONTE_MOOS_BASE_DIR}/client_scripts/xlaunch_job.sh --job_file=$JOB_FILE  --job_args=\"$JOB_ARGS\"  -v=$VERBOSE"
 echo "[3] Running job from file..."
+export MONTE_MOOS_STATUS_PHASE="run"
 secho "Running job $JOB_FILE $JOB_ARGS"
 /${MONTE_MOOS_BASE_DIR}/client_scripts/xlaunch_job.sh --job_file=$JOB_FILE --job_args="$JOB_ARGS" -v=$VERBOSE
 EXIT_CODE=$?
 if [[ $EXIT_CODE -eq 2 ]]; then
     echo "Mission timed out. Extracting results anyway..."
+elif [[ $EXIT_CODE -eq 7 ]]; then
+    # The job's ports don't fit this slot, not a bad job
+    vexit "/${MONTE_MOOS_BASE_DIR}/client_scripts/xlaunch_job.sh --job_file=$JOB_FILE  --job_args=\"$JOB_ARGS\" uses ports outside of slot ${MONTE_MOOS_SLOT}'s range" 7
 else
     if [ $EXIT_CODE -ne 0 ]; then
         vexit "/${MONTE_MOOS_BASE_DIR}/client_scripts/xlaunch_job.sh --job_file=$JOB_FILE  --job_args=\"$JOB_ARGS\" exited with exit code: $EXIT_CODE" 5
@@ -181,6 +195,7 @@ fi
 
 #- - - - - - - - - - - - - - - - - - - - - - - - - - - -
 #  Part 3e: Post-process, send the results
+export MONTE_MOOS_STATUS_PHASE="extract"
 secho "$ME: Extracting results from $JOB_FILE"
 if [ "$HOSTLESS" = "yes" ]; then
     vecho "monte_extract_results.sh -no --job_file=$JOB_FILE" 1
@@ -195,5 +210,7 @@ if [ $EXIT_CODE -ne 0 ]; then
 fi
 
 echo $txtgrn"      Results extracted" $txtrst
+# Counted in the runs/hour of the fleet summary
+MONTE_MOOS_STATUS_PHASE="done" secho "Finished job $JOB_FILE $JOB_ARGS"
 
 safe_exit 0
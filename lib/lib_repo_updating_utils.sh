@@ -31,7 +31,9 @@ is_in_job() {
 }
 
 #--------------------------------------------------------------
-# Checks if a repo has been built
+# Checks if a repo has been updated (and built) since .built_dirs
+# was last cleared. Whether the build itself is stale is decided
+# by the build cache (see build_key)
 #--------------------------------------------------------------
 has_not_built_repo() {
 
@@ -64,7 +66,7 @@ extract_repo_name() {
     local repo_full
     repo_full=$(echo "$1" | xargs)
     local repo_name
-    repo_name="$(echo "$repo_full" | awk '{print $2}')"
+    repo_name="$(echo "$repo_full" | awk '$2 !~ /=/ {print $2}')"
 
     if [[ $repo_name = "" ]]; then
         if [[ $repo_full =~ \.git$ ]]; then
@@ -94,6 +96,17 @@ extract_repo_link() {
     echo "$trimmed" | awk '{print $1}'
 }
 
+#--------------------------------------------------------------
+# given a line in a repo_links file, retrieves the repos listed
+# in its after=repo_a,repo_b field (space separated). Returns 1
+# if there is no after= field
+#--------------------------------------------------------------
+extract_repo_after() {
+    local after
+    after=$(echo "$1" | xargs -n 1 | grep -m 1 '^after=') || return 1
+    echo "${after#after=}" | tr ',' ' '
+}
+
 #--------------------------------------------------------------
 # Wrapper for git pull (note: alter return if no changes)
 #--------------------------------------------------------------
@@ -212,6 +225,182 @@ run_build_script() {
     return $BUILD_FAIL
 }
 
+#--------------------------------------------------------------
+# Build cache. Each repo has a dir in .build_cache:
+#     .build_cache/<repo_name>/current    key of the build in the repo
+#     .build_cache/<repo_name>/<key>/     copy of bin/ and lib/
+# The key is a hash of the repo revision (+ local changes), the
+# build script and flags, and the key of the moos-ivp build it
+# was built against. A repo is only rebuilt when its key is new.
+#--------------------------------------------------------------
+build_cache_dir() {
+    echo "${CARLO_DIR_LOCATION}/.build_cache/$1"
+}
+
+#--------------------------------------------------------------
+# Prints the dirs of a repo's build that are cached. None for
+# moos-ivp: other repos build against its build/ (the MOOS core
+# libs and CMake config) too, so a restored bin/ and lib/ would
+# sit next to another revision's build/. It is always rebuilt
+# when its key changes.
+#--------------------------------------------------------------
+build_cached_dirs() {
+    if [[ "$1" != "moos-ivp" ]]; then
+        echo "bin lib"
+    fi
+}
+
+#--------------------------------------------------------------
+# sha256 of stdin (sha256sum on linux, shasum on mac)
+#--------------------------------------------------------------
+sha256_stdin() {
+    if type sha256sum >/dev/null 2>&1; then
+        sha256sum | awk '{print $1}'
+    else
+        shasum -a 256 | awk '{print $1}'
+    fi
+}
+
+#--------------------------------------------------------------
+# Prints the git HEAD or svn revision of a repo dir, with a hash
+# of uncommitted changes appended (local repos are linked, not
+# cloned, so they are often edited in place). Prints nothing if
+# the revision can't be found.
+#--------------------------------------------------------------
+repo_revision() {
+    local dir=$1
+    local rev
+    if [ -d "$dir/.git" ]; then
+        rev=$(git -C "$dir" rev-parse HEAD 2>/dev/null) || return 0
+        if [ -n "$(git -C "$dir" status --porcelain --untracked-files=no 2>/dev/null)" ]; then
+            rev+="+$(git -C "$dir" diff HEAD 2>/dev/null | sha256_stdin)"
+        fi
+    elif [[ -f "$dir/.svn" || -d "$dir/.svn" ]]; then
+        rev=$(svnversion "$dir" 2>/dev/null)
+        [[ -z "$rev" || "$rev" == Unversioned* || "$rev" == Uncommitted* ]] && return 0
+        if [[ "$rev" == *M* ]]; then
+            rev+="+$(svn diff "$dir" 2>/dev/null | sha256_stdin)"
+        fi
+    fi
+    echo "$rev"
+}
+
+#--------------------------------------------------------------
+# Directory the build script runs in (the repo, or its trunk)
+#--------------------------------------------------------------
+build_output_dir() {
+    local dir=$1
+    if [ ! -f "$dir/$script" ] && [ -f "$dir/trunk/$script" ]; then
+        echo "$dir/trunk"
+    else
+        echo "$dir"
+    fi
+}
+
+#--------------------------------------------------------------
+# Prints the build key of a repo (uses $script and
+# $ALL_FLOW_DOWN_ARGS). Prints nothing if the revision is
+# unknown, in which case the repo is always built.
+#--------------------------------------------------------------
+build_key() {
+    local repo_name=$1
+    local rev
+    local moos_ivp_key=""
+    rev=$(repo_revision "${MONTE_MOOS_CLIENT_REPOS_DIR}/$repo_name")
+    [ -z "$rev" ] && return 0
+    mkdir -p "$(build_cache_dir "$repo_name")"
+    if [[ "$repo_name" != "moos-ivp" ]]; then
+        moos_ivp_key=$(cat "$(build_cache_dir moos-ivp)/current" 2>/dev/null)
+    fi
+    {
+        echo "revision=$rev"
+        echo "build=$script ${ALL_FLOW_DOWN_ARGS}"
+        echo "moos-ivp=$moos_ivp_key"
+    } | tee "$(build_cache_dir "$repo_name")/.last_key_info" | sha256_stdin
+}
+
+#--------------------------------------------------------------
+# Checks if the build in the repo is the one for this key
+#--------------------------------------------------------------
+is_built_for_key() {
+    local repo_name=$1
+    local key=$2
+    local cache_dir
+    cache_dir=$(build_cache_dir "$repo_name")
+    [ -n "$key" ] || return 1
+    [[ "$(cat "$cache_dir/current" 2>/dev/null)" == "$key" ]] || return 1
+    [ -d "$(build_output_dir "${MONTE_MOOS_CLIENT_REPOS_DIR}/$repo_name")/bin" ] || return 1
+    touch "$cache_dir/$key"
+    return 0
+}
+
+#--------------------------------------------------------------
+# Copies a cached bin/ and lib/ for this key back into the repo
+# (never for moos-ivp, see build_cached_dirs)
+#--------------------------------------------------------------
+restore_build() {
+    local repo_name=$1
+    local key=$2
+    local cache_dir
+    local out_dir
+    local sub
+    local subs
+    cache_dir=$(build_cache_dir "$repo_name")
+    subs=$(build_cached_dirs "$repo_name")
+    [[ -n "$key" && -n "$subs" && -f "$cache_dir/$key/key_info.txt" ]] || return 1
+    out_dir=$(build_output_dir "${MONTE_MOOS_CLIENT_REPOS_DIR}/$repo_name")
+    for sub in $subs; do
+        rm -rf "${out_dir:?}/$sub"
+        if [ -d "$cache_dir/$key/$sub" ]; then
+            cp -Rp "$cache_dir/$key/$sub" "$out_dir/$sub" || return 1
+        fi
+    done
+    echo "$key" >"$cache_dir/current"
+    touch "$cache_dir/$key"
+    return 0
+}
+
+#--------------------------------------------------------------
+# Saves bin/ and lib/ of a fresh build under its key (only the
+# key for moos-ivp), then removes all but the newest
+# MONTE_MOOS_BUILD_CACHE_KEEP builds
+#--------------------------------------------------------------
+save_build() {
+    local repo_name=$1
+    local key=$2
+    local cache_dir
+    local out_dir
+    local sub
+    local old_key
+    cache_dir=$(build_cache_dir "$repo_name")
+    if [ -z "$key" ]; then
+        rm -f "$cache_dir/current"
+        return 0
+    fi
+    out_dir=$(build_output_dir "${MONTE_MOOS_CLIENT_REPOS_DIR}/$repo_name")
+    rm -rf "${cache_dir:?}/$key" "$cache_dir/$key.tmp"
+    mkdir -p "$cache_dir/$key.tmp"
+    for sub in $(build_cached_dirs "$repo_name"); do
+        if [ -d "$out_dir/$sub" ]; then
+            cp -Rp "$out_dir/$sub" "$cache_dir/$key.tmp/$sub" || {
+                rm -rf "$cache_dir/$key.tmp"
+                return 1
+            }
+        fi
+    done
+    cp "$cache_dir/.last_key_info" "$cache_dir/$key.tmp/key_info.txt"
+    mv "$cache_dir/$key.tmp" "$cache_dir/$key"
+    echo "$key" >"$cache_dir/current"
+
+    # Newest first; keep the current one no matter what
+    ls -1t "$cache_dir" | grep -E '^[0-9a-f]{64}$' | tail -n +$((${MONTE_MOOS_BUILD_CACHE_KEEP:-3} + 1)) | while read -r old_key; do
+        [[ "$old_key" == "$key" ]] && continue
+        vecho "        removing old build $old_key of $repo_name" 2
+        rm -rf "${cache_dir:?}/$old_key"
+    done
+    return 0
+}
+
 #-------------------------------------------------------
 #  git pulls/svn ups the repo in question
 #-------------------------------------------------------
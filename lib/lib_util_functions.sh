@@ -23,7 +23,8 @@ wecho() { echo ${txtylw}"$ME: $1" ${txtrst}; }
 # Verbose exit
 #--------------------------------------------------------------
 vexit() {
-    secho "${txtred}$ME: Error: $1. Exit Code $2 $txtrst"
+    # the "error" phase is sent to the host right away
+    MONTE_MOOS_STATUS_PHASE="error" secho "${txtred}$ME: Error: $1. Exit Code $2 $txtrst"
     exit "$2"
 }
 
@@ -164,3 +165,43 @@ is_comment() {
     fi
     return 1
 }
+
+#--------------------------------------------------------------
+# Run trace: one timing record (JSON line) per phase of a run,
+# appended to $MONTE_MOOS_TRACE_FILE (set by run_next.sh). Does
+# nothing if it isn't set. See scripts/run_trace.py
+#     START=$(trace_now)
+#     ...phase...
+#     trace_phase update "$START" $EXIT_CODE [key=value ...]
+# Job, args and hash come from MONTE_MOOS_TRACE_JOB, _ARGS, _HASH
+#--------------------------------------------------------------
+trace_now() {
+    # Microseconds. bash 3 (macOS) has no EPOCHREALTIME, so whole seconds
+    if [[ -n $EPOCHREALTIME ]]; then
+        echo "${EPOCHREALTIME/[.,]/}"
+    else
+        echo "$(date +%s)000000"
+    fi
+}
+json_escape() {
+    local s=${1//\\/\\\\}
+    s=${s//\"/\\\"}
+    printf '%s' "${s//$'\t'/ }"
+}
+trace_phase() {
+    [[ -n $MONTE_MOOS_TRACE_FILE ]] || return 0
+    local phase=$1
+    local start=$2
+    local exit_code=${3:-0}
+    local duration extra pair
+    duration=$(($(trace_now) - start))
+    shift 3
+    for pair in "$@"; do
+        extra+=",\"$(json_escape "${pair%%=*}")\":\"$(json_escape "${pair#*=}")\""
+    done
+    printf '{"node":"%s","slot":"%s","job":"%s","args":"%s","hash":"%s","phase":"%s","start":%d.%06d,"duration":%d.%06d,"exit":%d%s}\n' \
+        "$(json_escape "$MYNAME")" "$MONTE_MOOS_SLOT" "$(json_escape "$MONTE_MOOS_TRACE_JOB")" \
+        "$(json_escape "$MONTE_MOOS_TRACE_ARGS")" "$(json_escape "$MONTE_MOOS_TRACE_HASH")" "$phase" \
+        $((start / 1000000)) $((start % 1000000)) $((duration / 1000000)) $((duration % 1000000)) \
+        "$exit_code" "$extra" >>"$MONTE_MOOS_TRACE_FILE"
+}
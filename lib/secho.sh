@@ -8,7 +8,7 @@
 #--------------------------------------------------------------
 ME="secho.sh"
 TO_PRINT=""
-LINES_TO_KEEP=500
+LINES_TO_KEEP=200
 PRINT_LONG="no"
 HOSTLESS="no"
 source "/${MONTE_MOOS_BASE_DIR}/lib/lib_vars.sh"
@@ -27,11 +27,11 @@ for ARGI; do
     if [[ "${ARGI}" = "--help" || "${ARGI}" = "-h" ]]; then
         echo "$ME: [OPTIONS]                                       "
         echo "                                                          "
-        echo "Status echo. Prints a line to status.txt, push to     "
-        echo " the host, and print to screen. Also generates myname.txt"
-        echo " if needed. If the most recent secho line is similar to"
-        echo " the line to be secho'd, then just the time is updated.    "
-        echo " The secho.txt file retains the first $LINES_TO_KEEP lines. "
+        echo "Status echo. Prints to screen, appends a record to    "
+        echo " status.jsonl and queues the recent records for the host."
+        echo " Also generates myname.txt if needed. Records with the   "
+        echo " same job, phase and text (up to the first |) are merged, "
+        echo " and status.txt shows the last $LINES_TO_KEEP of them.    "
         echo "                                                          "
         echo "Options:                                              "
         echo "  --help, -h                                          "
@@ -72,68 +72,29 @@ if [ -f /usr/bin/vcgencmd ]; then
     # free_memory=$(free -m | awk '/^Mem:/{print $4}')
     META_INFO="$META_INFO temp=$TEMP"
 fi
-cd "$MONTE_MOOS_BASE_DIR" || vexit "cd $MONTE_MOOS_BASE_DIR failed" 1
-MONTE_MOOS_RELSEASE="$(git rev-parse --short HEAD)"
-cd - >/dev/null || vexit "cd - failed" 1
-META_INFO="$META_INFO  mm-version=$MONTE_MOOS_RELSEASE"
-META_INFO="$(date)  $META_INFO"
+MONTE_MOOS_RELSEASE="$(git -C "/${MONTE_MOOS_BASE_DIR}" rev-parse --short HEAD 2>/dev/null)"
+META_INFO="$META_INFO mm-version=$MONTE_MOOS_RELSEASE"
 
 if [[ $PRINT_LONG == "yes" ]]; then
-    TO_ECHO="$TO_PRINT | $META_INFO"
+    TO_ECHO="$TO_PRINT | $(date)  $META_INFO"
 else
     TO_ECHO="$TO_PRINT"
 fi
 
 #--------------------------------------------------------------
-#  Part 4: Print and write to status.txt
+#  Part 4: Print and append to status.jsonl. The phase and job
+#          come from MONTE_MOOS_STATUS_PHASE/MONTE_MOOS_STATUS_JOB
 #--------------------------------------------------------------
 
 echo "$TO_ECHO"
 
-TO_ADD="$TO_PRINT | $META_INFO"
-if [ -f "${CARLO_DIR_LOCATION}/status.txt" ]; then
-    KEPT_LINES=$(head -n $LINES_TO_KEEP "${CARLO_DIR_LOCATION}/status.txt")
-    new_subline="${TO_ADD%%|*}" # remove everything after the first |
-
-    # Remove the most recent line if it is almost the same as the new line. Just update the time
-    recent_line=$(head -n 1 "${CARLO_DIR_LOCATION}/status.txt")
-    recent_subline="${recent_line%%|*}" # remove everything after the first |
-
-    recent_line2=$(head -n 2 "${CARLO_DIR_LOCATION}/status.txt" | tail -n 1)
-    recent_subline2="${recent_line2%%|*}" # remove everything after the first |
-
-    recent_line3=$(head -n 3 "${CARLO_DIR_LOCATION}/status.txt" | tail -n 1)
-    recent_subline3="${recent_line3%%|*}" # remove everything after the first |
-    
-    vecho "New subline: $new_subline" 5
-    vecho "Recent subline: $recent_subline" 5
-    vecho "Recent subline2: $recent_subline2" 5
-    vecho "Recent subline3: $recent_subline3" 5
-
-    if [[ ( $new_subline == "$recent_subline2" && $recent_subline == "$recent_subline3" ) && ${#recent_subline} -ge ${#recent_subline3} ]]; then
-        vecho "New line Same as 2nd to last line, last line same as 3rd to last line. Removing last 2 lines..." 5
-        # If the last line is the same as the new line, then we replace it
-        KEPT_LINES=$(tail -n +3 "${CARLO_DIR_LOCATION}/status.txt")
-    elif [[ $new_subline == "$recent_subline" ]]; then
-        # If the last line is the same as the new line, then we replace it
-        vecho "Same as last line. Removing last line..." 1
-        KEPT_LINES=$(tail -n +2 "${CARLO_DIR_LOCATION}/status.txt")
-    else
-        vecho "Not the same as last line. Keeping last line..." 2
-        echo "$TO_ADD" >>.temp_status
-    fi
-else
-    KEPT_LINES=""
-fi
-
-echo "$TO_ADD" >.temp_status
-echo "$KEPT_LINES" >>.temp_status
-mv .temp_status "${CARLO_DIR_LOCATION}"/status.txt
-
 #--------------------------------------------------------------
-#  Part 5: Copy to host
+#  Part 5: Queue for the host. Repeated lines are coalesced, and
+#          it's sent at most every $MONTE_MOOS_STATUS_FLUSH seconds
+#          (see scripts/status_stream.py)
 #--------------------------------------------------------------
-
-if [[ $MYNAME != "$MONTE_MOOS_HOST" && $HOSTLESS != "yes" ]]; then
-    "${MONTE_MOOS_BASE_DIR}/client_scripts/send2host.sh" "${CARLO_DIR_LOCATION}/status.txt" "${MONTE_MOOS_HOST_RECIEVE_DIR}/clients/status/${MYNAME}.txt" >&/dev/null
+if [[ $MYNAME == "$MONTE_MOOS_HOST" || $HOSTLESS == "yes" ]]; then
+    python3 "/${MONTE_MOOS_BASE_DIR}/scripts/status_stream.py" --hostless --meta="$META_INFO" "$TO_PRINT"
+else
+    python3 "/${MONTE_MOOS_BASE_DIR}/scripts/status_stream.py" --name="$MYNAME" --meta="$META_INFO" "$TO_PRINT"
 fi
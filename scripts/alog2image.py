@@ -2,8 +2,10 @@
 import csv
 import os
 import sys
-import subprocess
-import matplotlib.pyplot as plt
+from array import array
+from functools import partial
+from multiprocessing import Pool
+import numpy as np
 
 verbose = False
 
@@ -27,12 +29,12 @@ def populate_xy(input_file):
 
 
     :param input_file: Specify the file that we want to read from
-    :return: A list of x values, y values, and timestamps
+    :return: Arrays (array('d')) of x values, y values, and timestamps
     :doc-author: Trelent
     """
-    x = []
-    y = []
-    t = []
+    x = array('d')
+    y = array('d')
+    t = array('d')
     with open(input_file, 'r', encoding="utf-8") as file:
         reader = csv.reader(file, delimiter=' ')
         # next(reader) # skip header row
@@ -58,55 +60,187 @@ def remove_extension(fname):
     return fname
 
 
-def prepare_alog(input_file):
+def is_alog(fname):
+    """Determines if a file is an alog file (checks the header for a %)
+
+    Args:
+        fname (string): file name
+
+    Returns:
+        bool: if the file is an alog, return true
     """
-    The prepare_alog function takes in an alog file and runs the aloggrep command on it to process it into a csv file.
-    It then returns the name of this new csv file. If the input is already a csv, then prepare_alog just returns that same
-    file.
+    with open(fname, 'r', encoding="utf-8", errors="replace") as file:
+        return file.readline().startswith('%')
 
-    :param input_file: Specify the alog file to process
-    :return: The input file if it is a csv file and returns the output of aloggrep if it is an alog file
-    :doc-author: Trelent
+
+def parse_report(value):
+    """Splits a MOOS report string (ex: NAME=abe,X=1,Y=2) into a dict.
+    Keys are lower-cased, matching aloggrep's case-insensitive --subpat.
+
+    Args:
+        value (string): the value of a MOOS variable
+
+    Returns:
+        dict: key/value pairs of the report
+    """
+    report = {}
+    for pair in value.split(','):
+        key, sep, val = pair.partition('=')
+        if sep:
+            report[key.strip().lower()] = val.strip()
+    return report
+
+
+def read_node_reports(input_file, fields=()):
+    """Reads an alog file once, pulling out the NODE_REPORT_LOCAL positions
+    (and any other report fields asked for) and the MISSION_HASH.
+
+    Args:
+        input_file (string): path to the alog file
+        fields (tuple of strings): other report keys to keep (lower case,
+            ex: "spd", "hdg"). A report without one gets NaN
+
+    Returns:
+        array, array, array, dict, string, string: x values, y values,
+            timestamps (as compact array('d')), {field: array('d')}, the
+            (last reported) vehicle name, and the (last) mission hash
+    """
+    x = array('d')
+    y = array('d')
+    t = array('d')
+    extras = {field: array('d') for field in fields}
+    vname = ""
+    mhash = ""
+    with open(input_file, 'r', encoding="utf-8", errors="replace") as file:
+        for line in file:
+            # skip header and comments
+            if line.startswith('%'):
+                continue
+            parts = line.split(None, 3)
+            if len(parts) < 4:
+                continue
+            var = parts[1]
+            if var == "NODE_REPORT_LOCAL":
+                report = parse_report(parts[3])
+                name = report.get("name")
+                if name:
+                    vname = name
+                try:
+                    x_value = float(report["x"])
+                    y_value = float(report["y"])
+                    timestamp = float(parts[0])
+                except (KeyError, ValueError):
+                    continue
+                x.append(x_value)
+                y.append(y_value)
+                t.append(timestamp)
+                for (field, values) in extras.items():
+                    try:
+                        values.append(float(report[field]))
+                    except (KeyError, ValueError):
+                        values.append(float("nan"))
+            elif var == "MISSION_HASH":
+                value = parts[3].strip()
+                if '=' in value:
+                    value = parse_report(value).get("mhash", "")
+                if value:
+                    mhash = value
+    return x, y, t, extras, vname, mhash
+
+
+def parse_alog(input_file):
+    """Reads an alog file once, pulling out everything needed to plot it.
+    Replaces the aloggrep calls for NODE_REPORT_LOCAL (x, y, time, name) and
+    MISSION_HASH (mhash), so moos-ivp does not need to be on the PATH.
+
+    Args:
+        input_file (string): path to the alog file
+
+    Returns:
+        array, array, array, string, string: x values, y values, timestamps
+            (as compact array('d')), the (last reported) vehicle name, and
+            the (last) mission hash
+    """
+    x, y, t, _, vname, mhash = read_node_reports(input_file)
+    return x, y, t, vname, mhash
+
+
+def simplify_track(x, y, t, tolerance):
+    """Douglas-Peucker line simplification. Drops every point that is within
+    tolerance (in meters) of the line through the points kept around it.
+    The first and last points are always kept.
+
+    Args:
+        x, y, t (arrays): the trajectory
+        tolerance (float): max distance of a dropped point from the new line
+
+    Returns:
+        arrays: x, y and t of the points that were kept
     """
+    if tolerance <= 0 or len(x) < 3:
+        return x, y, t
+    xs = np.asarray(x, dtype=float)
+    ys = np.asarray(y, dtype=float)
+    keep = np.zeros(len(xs), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(xs)-1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx = xs[last] - xs[first]
+        dy = ys[last] - ys[first]
+        px = xs[first+1:last] - xs[first]
+        py = ys[first+1:last] - ys[first]
+        length = np.hypot(dx, dy)
+        if length == 0:
+            dist = np.hypot(px, py)
+        else:
+            dist = np.abs(px*dy - py*dx)/length
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            mid = first + 1 + i
+            keep[mid] = True
+            stack.append((first, mid))
+            stack.append((mid, last))
+    return xs[keep], ys[keep], np.asarray(t, dtype=float)[keep]
 
-    # Determines if a file is an alog file or a csv file (checks the header)
-    def is_alog(fname):
-        """Determines if a file is an alog file (checks the header for a %)
 
-        Args:
-            fname (string): file name
+def load_track(input_file, tolerance=0):
+    """Loads the trajectory of a single vehicle from an alog, or from a csv
+    (space delimited: time x y) made previously with aloggrep.
 
-        Returns:
-            bool: if the file is an alog, return true
-        """
-        return open(fname, 'r', encoding="utf-8").readline().startswith('%')
+    Args:
+        input_file (string): path to the alog or csv file
+        tolerance (float): if > 0, simplify the track (see simplify_track)
 
-    # If the file is an alog file, run aloggrep to process it into a csv file
+    Returns:
+        array, array, array, string, string, int: x values, y values,
+            timestamps, vehicle name and mission hash (both empty for csv
+            files), and the number of points before simplifying
+    """
     if is_alog(input_file):
-        output_file = remove_extension(input_file) + "_data.alog"
-        output_file_real = remove_extension(input_file) + "_data.csv"
-        # Remove the output file if it already exists to prevent aloggrep from asking to overwrite
-        # subprocess.run(f"rm {output_file}", shell=True)
-        script = "aloggrep "+input_file+" NODE_REPORT_LOCAL "+\
-            output_file + " -sd --format=time:val --csw --subpat=x:y "
-        subprocess.run(script, shell=True, check=True)
-        subprocess.run(
-            f"mv {output_file} {output_file_real}", shell=True, check=True)
-        return output_file_real
-    # If the file is a csv file, just return it
-    return input_file
-
-
-def find_alogs():
+        x, y, t, vname, mhash = parse_alog(input_file)
+    else:
+        x, y, t = populate_xy(input_file)
+        vname, mhash = "", ""
+    num_points = len(x)
+    x, y, t = simplify_track(x, y, t, tolerance)
+    return x, y, t, vname, mhash, num_points
+
+
+def find_alogs(path=None):
     """
-    The find_alogs function searches the current directory for all alog files.
+    The find_alogs function searches the current directory (or path) for all alog files.
     It then returns a list of strings containing the full path to each alog file.
 
+    :param path: Directory to search. Defaults to the current directory
     :return: A list of alog files in the current directory
     :doc-author: Trelent
     """
     alog_files = []
-    path = os.getcwd()
+    if path is None:
+        path = os.getcwd()
     for root, dirs, files in os.walk(path):
         # ignore subdirectories that begin with a period
         dirs[:] = [d for d in dirs if not d.startswith('.')]
@@ -123,44 +257,6 @@ def find_alogs():
     return alog_files
 
 
-def alog_vname(alog_file):
-    """
-    The alog_vname function returns the vehicle name from an alog file.
-
-    :param alog_file: Specify the alog file to be used
-    :return: The vehicle name from an alog file
-    :doc-author: Trelent
-    """
-    script = "aloggrep "+alog_file + \
-        " NODE_REPORT_LOCAL --v --final --format=val --subpat=name"
-    vname = subprocess.run(
-        script, shell=True, capture_output=True, check=True).stdout.decode('utf-8')
-    assert type(vname) == str, "Error: subprocess.run returns non-string type"
-    assert not (vname.__contains__(" exiting")
-                ), f"Error: {script} exitied with error: {vname}"
-    return vname
-
-
-def alog_mhash(alog_file):
-    """Returns mission hash from alog
-
-    Args:
-        alog_file (string): input file name
-
-    Returns:
-        string: mission hash
-    """    """Returns the mission hash"""
-    script = "aloggrep "+alog_file + \
-        " MISSION_HASH --v --final --format=val --subpat=mhash"
-    hash = subprocess.run(script, shell=True,
-                          capture_output=True, check=True).stdout.decode('utf-8').strip()
-    assert not (hash.__contains__(" exiting")
-                ), f"Error: {script} exitied with error: {hash}"
-    assert isinstance(
-        hash, str), "Error: subprocess.run returns non-string type"
-    return hash
-
-
 def extract_files():
     """Finds all algo files (or uses the ones provided)
 
@@ -210,7 +306,32 @@ def handle_no_alogs(to_find_alogs):
     return alog_files
 
 
-def plot_alogs(alogs, figname, ignore_hash, file_type):
+def load_tracks(alogs, jobs, tolerance=0):
+    """Loads (and simplifies) every alog, in parallel if jobs > 1. Results are
+    returned in the same order as alogs, so the plot is identical to a serial
+    run.
+
+    Args:
+        alogs (list of strings): paths to each alog (or csv) file
+        jobs (int): number of worker processes. 0 uses every cpu
+        tolerance (float): simplification tolerance, see simplify_track
+
+    Returns:
+        list of tuples: the output of load_track for each file
+    """
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(alogs))
+    load = partial(load_track, tolerance=tolerance)
+    if jobs <= 1:
+        return [load(alog) for alog in alogs]
+    vprint("\tLoading "+str(len(alogs))+" files with "+str(jobs)+" workers")
+    with Pool(jobs) as pool:
+        return pool.map(load, alogs, chunksize=1)
+
+
+def plot_alogs(alogs, figname, ignore_hash, file_type, jobs=1, tolerance=0,
+               point_stats=False):
     """
     The plot_alogs function takes in a list of alog files and plots them.
     It will also save the plot as a file with the name specified by figname.
@@ -221,21 +342,31 @@ def plot_alogs(alogs, figname, ignore_hash, file_type):
     :param figname: Set the name of the figure
     :param ignore_hash: Ignore the hash of the alog files
     :param file_type: Determine the file type of the output figure
+    :param jobs: Number of worker processes used to parse the alogs
+    :param tolerance: Simplify each track to within this many meters (0 = off)
+    :param point_stats: Print how many points of each track were kept/dropped
     :return: A tuple of the mission hash and figure name
     :doc-author: Trelent
     """
+    # Only needed to plot, so importing the parsing above stays cheap
+    import matplotlib.pyplot as plt
     mhash = ""
 
     if (file_type == ""):
         file_type = "png"
 
     legends = set()
-    for arg in alogs:
-        # converts to csv if necessary
-        alog_file = prepare_alog(arg)
-        legend_name = alog_vname(arg)
-        x, y, t = populate_xy(alog_file)
-        subprocess.run(f"rm {alog_file}", shell=True, check=True)
+    # parsing is independent per file; merging into the figure is done here,
+    # in order, so legends and the hash check stay deterministic
+    total_points = 0
+    total_kept = 0
+    for (arg, track) in zip(alogs, load_tracks(alogs, jobs, tolerance)):
+        x, y, t, legend_name, this_mhash, num_points = track
+        total_points += num_points
+        total_kept += len(x)
+        if point_stats:
+            print(f"{arg}: kept {len(x)} of {num_points} points "
+                  f"({num_points-len(x)} dropped)")
 
         if (len(x) == 0) or (len(y) == 0):
             continue
@@ -255,11 +386,11 @@ def plot_alogs(alogs, figname, ignore_hash, file_type):
 
         plt.plot(x, y, label=legend_name)
         if (mhash == ""):
-            mhash = alog_mhash(arg)
+            mhash = this_mhash
         else:
-            if not (ignore_hash or mhash == alog_mhash(arg)):
+            if not (ignore_hash or mhash == this_mhash):
                 print("Error: alog files have different mission hashes: \n\t" +
-                      mhash+"\t"+alog_mhash(arg))
+                      mhash+"\t"+this_mhash)
                 print(" Use -i or --ignore-hash to ignore this error")
                 exit(1)
             # if there is no figure name, use the mission hash
@@ -267,6 +398,10 @@ def plot_alogs(alogs, figname, ignore_hash, file_type):
                 figname = mhash+"."+file_type
                 print("Using hash as figure name: "+figname)
 
+    if point_stats:
+        print(f"Total: kept {total_kept} of {total_points} points "
+              f"({total_points-total_kept} dropped)")
+
     # ensure some figure name is set (no hash and no argument for figurename)
     if (figname == ""):
         figname = "figure."+file_type
@@ -298,6 +433,12 @@ def display_help():
     print("     --ftype=<png>           If the figure name is not specified, this  ")
     print("                             will force a specific file type. Useful    ")
     print("                             when using the mission hash as the filename")
+    print("     --jobs=<N> -j=<N>       Parse the alogs with N worker processes.   ")
+    print("                             0 uses every cpu. Default is 1 (serial).   ")
+    print("     --simplify=<meters>     Simplify each track (Douglas-Peucker) so no")
+    print("                             dropped point is further than this from the")
+    print("                             plotted line. Default is 0 (off).          ")
+    print("     --stats -s              Print how many points were kept/dropped.   ")
 
 
 def main():
@@ -314,6 +455,9 @@ def main():
     file_type = ""
     ignore_hash = False
     to_find_alogs = False
+    jobs = 1
+    tolerance = 0
+    point_stats = False
 
     for (i, arg) in enumerate(sys.argv):
         # skip over the name of this script
@@ -330,6 +474,17 @@ def main():
             file_type = arg[len("--ftype="):]
             vprint("\tUsing figure type: "+file_type)
             continue
+        if (arg.startswith("--jobs=") or arg.startswith("-j=")):
+            jobs = int(arg[arg.index("=")+1:])
+            vprint("\tUsing "+str(jobs)+" jobs")
+            continue
+        if (arg.startswith("--simplify=")):
+            tolerance = float(arg[len("--simplify="):])
+            vprint("\tSimplifying with tolerance "+str(tolerance))
+            continue
+        if (arg == "--stats" or arg == "-s"):
+            point_stats = True
+            continue
         if (arg.startswith("--ignorehash") or arg.startswith("-i")):
             ignore_hash = True
             vprint("\tIgnoring mhash")
@@ -347,7 +502,8 @@ def main():
 
     if len(alog_files) == 0:
         alog_files = handle_no_alogs(to_find_alogs)
-    plot_alogs(alog_files, figname, ignore_hash, file_type)
+    plot_alogs(alog_files, figname, ignore_hash, file_type, jobs,
+               tolerance, point_stats)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# Kevin Becker
+# Standard metrics of a run, computed from its vehicles' alogs. The
+# NODE_REPORT_LOCAL of every vehicle is read once (see read_node_reports in
+# alog2image.py), put on one common time grid as NumPy arrays, and every
+# metric in the registry is computed on those arrays. The output is a
+# results.csv style file (a header line and one row), which
+# monte_merge_results.py picks up like any other csv in a run's dir.
+# --batch does the same for every run dir of a job, in parallel.
+#
+# In a post_process_results.sh:
+#   alog_metrics.py --auto --output="$LOCAL_RESULTS_DIR/metrics.csv"
+import math
+import os
+import sys
+from multiprocessing import Pool
+import numpy as np
+from alog2image import find_alogs, read_node_reports
+
+# Report fields kept besides x and y
+REPORT_FIELDS = ("spd",)
+METRICS = {}
+verbose = 0
+
+
+def vprint(msg, level=1):
+    """Verbose print, to stderr (stdout may be the csv)."""
+    if verbose >= level:
+        print("alog_metrics.py: "+str(msg), file=sys.stderr)
+
+
+def metric(name, description):
+    """Adds the decorated function to the registry. A metric takes a Run and
+    the params dict, and returns {column: value}."""
+    def register(function):
+        METRICS[name] = (function, description)
+        return function
+    return register
+
+
+class Run:
+    """The vehicles of one run. Each vehicle's own reports are kept as they
+    were logged (t, x, y and the REPORT_FIELDS, as arrays), and all of them
+    are also interpolated onto one time grid, every dt seconds over the
+    whole run: time (K), x and y (V x K). A vehicle's row is NaN outside of
+    the time it reported."""
+
+    def __init__(self, alogs, dt=1.0):
+        self.names = []
+        self.tracks = []
+        self.mhash = ""
+        for alog in alogs:
+            x, y, t, extras, vname, mhash = read_node_reports(alog, REPORT_FIELDS)
+            if len(t) < 2:
+                vprint(f"skipping {alog}: {len(t)} node reports", 1)
+                continue
+            t = np.frombuffer(t, dtype=float)
+            order = np.argsort(t, kind="stable")
+            track = {"t": t[order],
+                     "x": np.frombuffer(x, dtype=float)[order],
+                     "y": np.frombuffer(y, dtype=float)[order]}
+            for (field, values) in extras.items():
+                track[field] = np.frombuffer(values, dtype=float)[order]
+            self.tracks.append(track)
+            self.names.append(self.unique_name(vname or os.path.basename(alog).split(".")[0]))
+            self.mhash = mhash or self.mhash
+
+        if not self.tracks:
+            self.start = self.end = math.nan
+            self.time = np.zeros(0)
+            self.x = self.y = np.zeros((0, 0))
+            return
+        self.start = min(track["t"][0] for track in self.tracks)
+        self.end = max(track["t"][-1] for track in self.tracks)
+        self.time = np.arange(self.start, self.end+1e-9, dt)
+        self.x = np.full((len(self.tracks), len(self.time)), np.nan)
+        self.y = np.full_like(self.x, np.nan)
+        for (i, track) in enumerate(self.tracks):
+            inside = (self.time >= track["t"][0]) & (self.time <= track["t"][-1])
+            self.x[i, inside] = np.interp(self.time[inside], track["t"], track["x"])
+            self.y[i, inside] = np.interp(self.time[inside], track["t"], track["y"])
+
+    def unique_name(self, name):
+        """Column names must be unique, so a repeated name gets a number."""
+        new_name = name
+        count = 2
+        while new_name in self.names:
+            new_name = f"{name}{count}"
+            count += 1
+        return new_name
+
+
+#--------------------------------------------------------------
+# The metrics. Per vehicle columns are named <metric>_<vehicle>
+#--------------------------------------------------------------
+@metric("duration", "First to last node report (s)")
+def duration(run, params):
+    return {"duration": float(run.end-run.start)}
+
+
+@metric("path_length", "Distance traveled by each vehicle, and the mean (m)")
+def path_length(run, params):
+    columns = {}
+    for (name, track) in zip(run.names, run.tracks):
+        columns["path_length_"+name] = float(np.sum(np.hypot(np.diff(track["x"]), np.diff(track["y"]))))
+    columns["path_length"] = float(np.mean(list(columns.values()))) if columns else math.nan
+    return columns
+
+
+@metric("speed", "Mean and max speed of each vehicle (m/s)")
+def speed(run, params):
+    """From SPD in the node reports, else from the change in position."""
+    columns = {}
+    means = []
+    for (name, track) in zip(run.names, run.tracks):
+        spd = track.get("spd")
+        if spd is None or np.all(np.isnan(spd)):
+            dt = np.diff(track["t"])
+            moved = np.hypot(np.diff(track["x"]), np.diff(track["y"]))
+            spd = moved[dt > 0]/dt[dt > 0]
+        if len(spd) == 0 or np.all(np.isnan(spd)):
+            continue
+        columns["avg_speed_"+name] = float(np.nanmean(spd))
+        columns["max_speed_"+name] = float(np.nanmax(spd))
+        means.append(columns["avg_speed_"+name])
+    columns["avg_speed"] = float(np.mean(means)) if means else math.nan
+    return columns
+
+
+@metric("cpa", "Closest point of approach of any two vehicles (m)")
+def cpa(run, params):
+    """The closest any pair of vehicles got (on the time grid), when (s into
+    the run), which pair, and with --cpa_threshold, how many pairs got
+    closer than it (near_misses)."""
+    if len(run.tracks) < 2:
+        return {}
+    (first, second) = np.triu_indices(len(run.tracks), k=1)
+    # pairs x time
+    distance = np.hypot(run.x[first]-run.x[second], run.y[first]-run.y[second])
+    closest = np.nanmin(distance, axis=1, initial=np.inf, where=~np.isnan(distance))
+    if not np.any(np.isfinite(closest)):
+        return {}
+    pair = int(np.argmin(closest))
+    when = int(np.nanargmin(distance[pair]))
+    columns = {"min_cpa": float(closest[pair]),
+               "min_cpa_time": float(run.time[when]-run.start),
+               "min_cpa_pair": run.names[first[pair]]+"-"+run.names[second[pair]]}
+    threshold = params.get("cpa_threshold")
+    if threshold is not None:
+        columns["near_misses"] = int(np.sum(closest < threshold))
+    return columns
+
+
+@metric("time_to_goal", "Time until within --goal_radius of --goal (s)")
+def time_to_goal(run, params):
+    """When each vehicle first got within goal_radius of the goal (s into
+    the run), and when all of them had. Nothing without a goal."""
+    goal = params.get("goal")
+    if goal is None:
+        return {}
+    radius = params.get("goal_radius", 5.0)
+    columns = {}
+    times = []
+    for (name, track) in zip(run.names, run.tracks):
+        reached = np.flatnonzero(np.hypot(track["x"]-goal[0], track["y"]-goal[1]) <= radius)
+        value = float(track["t"][reached[0]]-run.start) if len(reached) else math.nan
+        columns["time_to_goal_"+name] = value
+        times.append(value)
+    columns["time_to_goal"] = max(times) if times and not any(math.isnan(v) for v in times) else math.nan
+    return columns
+
+
+#--------------------------------------------------------------
+# Running the metrics, writing the row
+#--------------------------------------------------------------
+def compute(alogs, names=None, params=None, dt=1.0):
+    """Computes the metrics (all of them if names is None) of the run made
+    up of alogs.
+
+    Returns:
+        dict: {column: value}, with mhash first
+    """
+    params = params or {}
+    run = Run(alogs, dt)
+    row = {"mhash": run.mhash}
+    if not run.tracks:
+        return row
+    for name in (names or METRICS):
+        (function, _) = METRICS[name]
+        row.update(function(run, params))
+    return row
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return "" if math.isnan(value) or math.isinf(value) else f"{value:.6g}"
+    return str(value)
+
+
+def to_csv(row):
+    """The row in the results.csv format: a header line and one line of
+    values. Values can't hold commas, so no quoting is needed."""
+    return ",".join(row)+"\n"+",".join(format_value(v).replace(",", ";") for v in row.values())+"\n"
+
+
+def write_row(row, output_file):
+    temp = os.path.join(os.path.dirname(output_file) or ".", ".tmp_"+os.path.basename(output_file))
+    with open(temp, "w") as f:
+        f.write(to_csv(row))
+    os.replace(temp, output_file)
+
+
+#--------------------------------------------------------------
+# Batch mode: every run dir of a job
+#--------------------------------------------------------------
+def _batch_task(task):
+    """One run of --batch (in a worker process).
+
+    Returns:
+        string, int, string: the run dir, the number of columns written
+            (-1 if up to date) and an error message (empty if none)
+    """
+    (run_dir, output_name, names, params, dt, force) = task
+    try:
+        alogs = find_alogs(run_dir)
+        if not alogs:
+            return run_dir, 0, "no vehicle alogs"
+        output_file = os.path.join(run_dir, output_name)
+        if not force and os.path.isfile(output_file) and \
+                os.path.getmtime(output_file) >= max(os.path.getmtime(a) for a in alogs):
+            return run_dir, -1, ""
+        row = compute(alogs, names, params, dt)
+        write_row(row, output_file)
+        return run_dir, len(row), ""
+    except Exception as e:
+        return run_dir, 0, str(e)
+
+
+def batch(results_dir, output_name="metrics.csv", names=None, params=None, dt=1.0,
+          workers=0, force=False):
+    """Computes the metrics of every run dir (every subdir) of results_dir,
+    writing run_dir/output_name. Runs whose output is newer than their alogs
+    are skipped, unless force.
+
+    Returns:
+        int, int, int: runs computed, up to date, and failed
+    """
+    run_dirs = sorted(e.path for e in os.scandir(results_dir)
+                      if e.is_dir() and not e.name.startswith("."))
+    tasks = [(run_dir, output_name, names, params, dt, force) for run_dir in run_dirs]
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(tasks)))
+    vprint(f"{len(tasks)} runs, {workers} workers")
+    (done, skipped, failed) = (0, 0, 0)
+    if workers == 1:
+        results = map(_batch_task, tasks)
+    else:
+        pool = Pool(workers)
+        results = pool.imap_unordered(_batch_task, tasks, chunksize=1)
+    for (run_dir, columns, error) in results:
+        if error:
+            failed += 1
+            vprint(f"{run_dir}: {error}")
+        elif columns < 0:
+            skipped += 1
+        else:
+            done += 1
+            vprint(f"{run_dir}: {columns} columns", 2)
+    if workers > 1:
+        pool.close()
+        pool.join()
+    return done, skipped, failed
+
+
+def display_help():
+    """Function displaying all help info when run on command line."""
+    print("Usage: alog_metrics.py [OPTIONS] [file1.alog] ... [fileN.alog]        ")
+    print("       alog_metrics.py [OPTIONS] --batch=<job results dir>            ")
+    print("     Computes metrics of a run from its vehicles' alogs, as a         ")
+    print("     results.csv style row (header line, value line).                 ")
+    print("     --auto, -a              Use every alog under the current dir     ")
+    print("                             (except SHORESIDE ones)                  ")
+    print("     --output=, -o=          Where to write the row. Default stdout.  ")
+    print("                             With --batch, the file name in each run  ")
+    print("                             dir. Default metrics.csv                 ")
+    print("     --metrics=a,b           Only these metrics. Default all of:      ")
+    for (name, (_, description)) in METRICS.items():
+        print(f"         {name:<15} {description}")
+    print("     --goal=x,y              Goal point, for time_to_goal             ")
+    print("     --goal_radius=<m>       Default 5                                ")
+    print("     --cpa_threshold=<m>     Count the pairs closer than this         ")
+    print("     --dt=<sec>              Time grid step for cross-vehicle metrics.")
+    print("                             Default 1                                ")
+    print("     --batch=<dir>           Every subdir of <dir> is a run           ")
+    print("     --workers=N, -j=N       Batch worker processes. Default: all cpus")
+    print("     --force, -f             Batch: recompute runs that are up to date")
+    print("     --verbose=num, -v=num or --verbose, -v  (prints to stderr)      ")
+
+
+def main():
+    """Handles cmd line args."""
+    global verbose
+    alogs = []
+    auto = False
+    output_file = ""
+    names = None
+    params = {}
+    dt = 1.0
+    batch_dir = ""
+    workers = 0
+    force = False
+    for (i, arg) in enumerate(sys.argv):
+        # skip over the name of this script
+        if i == 0:
+            continue
+        if arg == "-h" or arg == "--help":
+            display_help()
+            exit(0)
+        if arg == "--auto" or arg == "-a":
+            auto = True
+        elif arg.startswith("--output=") or arg.startswith("-o="):
+            output_file = arg[arg.index("=")+1:]
+        elif arg.startswith("--metrics="):
+            names = arg[len("--metrics="):].split(",")
+            for name in names:
+                assert name in METRICS, "Error: unknown metric " + name + ". Use -h or --help for the list."
+        elif arg.startswith("--goal="):
+            params["goal"] = tuple(float(v) for v in arg[len("--goal="):].split(","))
+            assert len(params["goal"]) == 2, "Error: --goal must be x,y"
+        elif arg.startswith("--goal_radius="):
+            params["goal_radius"] = float(arg[len("--goal_radius="):])
+        elif arg.startswith("--cpa_threshold="):
+            params["cpa_threshold"] = float(arg[len("--cpa_threshold="):])
+        elif arg.startswith("--dt="):
+            dt = float(arg[len("--dt="):])
+            assert dt > 0, "Error: --dt must be > 0"
+        elif arg.startswith("--batch="):
+            batch_dir = arg[len("--batch="):]
+        elif arg.startswith("--workers=") or arg.startswith("-j="):
+            workers = int(arg[arg.index("=")+1:])
+        elif arg == "--force" or arg == "-f":
+            force = True
+        elif arg == "--verbose" or arg == "-v":
+            verbose = 1
+        elif arg.startswith("--verbose=") or arg.startswith("-v="):
+            verbose = int(arg[arg.index("=")+1:])
+        elif arg.endswith(".alog"):
+            alogs.append(arg)
+        else:
+            assert False, "Error: " + arg + \
+                " is not a valid argument. Use -h or --help for usage."
+
+    if batch_dir:
+        (done, skipped, failed) = batch(batch_dir, output_file or "metrics.csv", names,
+                                        params, dt, workers, force)
+        print(f"alog_metrics.py: {done} runs computed, {skipped} up to date, {failed} failed")
+        exit(1 if failed and not done else 0)
+
+    if auto:
+        alogs += find_alogs()
+    if not alogs:
+        print("alog_metrics.py: no alog files given or found. Use -h or --help for usage.", file=sys.stderr)
+        exit(1)
+    row = compute(alogs, names, params, dt)
+    if output_file:
+        write_row(row, output_file)
+    else:
+        print(to_csv(row), end="")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# Kevin Becker
+# Benchmarks the result and queue scripts on synthetic inputs (see
+# synthetic_data.py) at several scales. Each tool is run as its own process,
+# and its wall time, peak RSS and throughput are recorded. The results are
+# written as a JSON baseline, which --compare diffs against a baseline from
+# another commit.
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import synthetic_data
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# The host's merge (monte_merge_results.py) is in global_scripts
+GLOBAL_SCRIPT_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), "global_scripts")
+sys.path.insert(0, GLOBAL_SCRIPT_DIR)
+import monte_merge_results
+
+# 2: the merge benchmarks run monte_merge_results.py (was merge_results.py)
+# 3: peak RSS no longer includes this process's (see measure)
+BASELINE_VERSION = 3
+# Inputs at 1x. Every size is multiplied by the scale
+ALOG_VEHICLES = 2
+ALOG_HOURS = 0.05
+RESULT_RUNS = 50
+QUEUE_LINES = 200
+JOB_NAME = "synth_job"
+# Smaller changes than these are noise, whatever the percentage
+MIN_WALL_CHANGE = 0.05
+MIN_RSS_CHANGE = 1024
+verbose = 0
+# Runs argv[1:] with its stdout to /dev/null, then prints its wall time,
+# peak RSS (kB) and exit code (see measure)
+LAUNCHER = """
+import os, sys, time
+start = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+    try:
+        os.execvp(sys.argv[1], sys.argv[1:])
+    finally:
+        os._exit(127)
+(_, status, rusage) = os.wait4(pid, 0)
+wall = time.perf_counter()-start
+# ru_maxrss is in bytes on macOS, kB on linux
+peak_rss = rusage.ru_maxrss//1024 if sys.platform == "darwin" else rusage.ru_maxrss
+print(wall, peak_rss, os.waitstatus_to_exitcode(status))
+"""
+
+
+def vprint(msg, level=1):
+    """Verbose print, to stderr."""
+    if verbose >= level:
+        print("benchmark.py: "+str(msg), file=sys.stderr)
+
+
+def git_commit():
+    """The commit being benchmarked, with -dirty if the tree has changes."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPT_DIR,
+                                capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=SCRIPT_DIR).returncode
+    except OSError:
+        return ""
+    return commit + ("-dirty" if commit and dirty else "")
+
+
+def make_inputs(work_dir, scale, seed):
+    """Generates the inputs for one scale under work_dir/<scale>x, unless
+    they are already there (same scale and seed).
+
+    Returns:
+        dict: paths and sizes of the inputs
+    """
+    scale_dir = os.path.join(work_dir, f"{scale}x")
+    stamp_file = os.path.join(scale_dir, "inputs.json")
+    try:
+        with open(stamp_file, "r") as f:
+            inputs = json.load(f)
+        if inputs.get("seed") == seed:
+            return inputs
+    except (OSError, ValueError):
+        pass
+
+    vprint(f"generating {scale}x inputs in {scale_dir}")
+    os.makedirs(scale_dir, exist_ok=True)
+    alogs, alog_lines = synthetic_data.make_alogs(os.path.join(scale_dir, "alogs"),
+                                                  ALOG_VEHICLES, ALOG_HOURS*scale, seed)
+    job_dir = synthetic_data.make_results_tree(os.path.join(scale_dir, "results"),
+                                               JOB_NAME, RESULT_RUNS*scale, seed)
+    merged = os.path.join(scale_dir, "merged.csv")
+    monte_merge_results.merge_csv_files(job_dir, merged, JOB_NAME)
+    queue = synthetic_data.make_queue(os.path.join(scale_dir, "job_queue.txt"),
+                                      QUEUE_LINES*scale, seed)
+    inputs = {"seed": seed, "dir": scale_dir, "alogs": alogs, "alog_lines": alog_lines,
+              "job_dir": job_dir, "runs": RESULT_RUNS*scale, "merged": merged,
+              "queue": queue, "queue_lines": QUEUE_LINES*scale}
+    with open(stamp_file, "w") as f:
+        json.dump(inputs, f)
+    return inputs
+
+
+def benchmarks(inputs):
+    """The commands to time at one scale.
+
+    Returns:
+        list of tuples: (name, command, items processed, unit of the items)
+    """
+    out = os.path.join(inputs["dir"], "out")
+    os.makedirs(out, exist_ok=True)
+    # The host merges with --incremental --columns on every loop, and most
+    # loops find few or no new runs. That is timed from an up to date merge
+    incremental = os.path.join(out, "results_incremental.csv")
+    monte_merge_results.merge_csv_files_incremental(inputs["job_dir"], incremental, JOB_NAME)
+    monte_merge_results.write_columns(incremental, JOB_NAME)
+
+    def script(name, directory=SCRIPT_DIR):
+        return [sys.executable, os.path.join(directory, name)]
+    merge = script("monte_merge_results.py", GLOBAL_SCRIPT_DIR) + ["--job="+JOB_NAME, "--wd="+inputs["job_dir"]]
+    return [
+        ("alog2image", script("alog2image.py") + ["--fname="+os.path.join(out, "alogs.png"), "-i"]
+         + inputs["alogs"], inputs["alog_lines"], "lines"),
+        ("merge_results", merge + ["--output="+os.path.join(out, "results.csv")], inputs["runs"], "runs"),
+        ("merge_results_parallel", merge + ["--output="+os.path.join(out, "results_parallel.csv"), "-w=2"],
+         inputs["runs"], "runs"),
+        ("merge_results_incremental", merge + ["--output="+incremental, "-i", "-c"], inputs["runs"], "runs"),
+        ("pltcsv", script("pltcsv.py") + [inputs["merged"], "--fname="+os.path.join(out, "results.png"),
+         "-x=avg_speed", "-y=min_range,collisions"], inputs["runs"], "rows"),
+        ("job_queue_select", script("job_queue.py") + ["-q="+inputs["queue"], "--select", "--seed=1",
+         "--bad_jobs="+os.path.join(out, "bad_jobs.txt"), "--runtimes="+os.path.join(out, "runtimes.txt")],
+         inputs["queue_lines"], "lines"),
+        ("consolidate_queue", script("consolidate_queue.py") + [inputs["queue"],
+         "-o="+os.path.join(out, "job_queue.txt")], inputs["queue_lines"], "lines"),
+    ]
+
+
+def measure(cmd):
+    """Runs cmd, returning its wall time, peak RSS (kB) and exit code.
+
+    A forked child's peak RSS starts at its parent's RSS, and exec keeps it,
+    so cmd isn't started from this process (numpy, the inputs). It's started
+    by LAUNCHER, a bare python that times and waits for it."""
+    env = dict(os.environ, MPLBACKEND="Agg")
+    proc = subprocess.run([sys.executable, "-S", "-c", LAUNCHER] + cmd, env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        (wall, peak_rss, exit_code) = proc.stdout.split()
+    except ValueError:
+        vprint(proc.stderr.decode(errors="replace").strip())
+        return 0.0, 0, proc.returncode or 1
+    if int(exit_code) != 0:
+        vprint(proc.stderr.decode(errors="replace").strip())
+    return float(wall), int(peak_rss), int(exit_code)
+
+
+def run(scales, work_dir, repeat=3, seed=1, only=None):
+    """Runs every benchmark at every scale. Of the repeats, the fastest wall
+    time and the largest peak RSS are kept.
+
+    Returns:
+        dict: the baseline
+    """
+    results = {}
+    for scale in scales:
+        inputs = make_inputs(work_dir, scale, seed)
+        for (name, cmd, items, unit) in benchmarks(inputs):
+            if only and name not in only:
+                continue
+            walls = []
+            rss = 0
+            for _ in range(repeat):
+                (wall, peak_rss, exit_code) = measure(cmd)
+                if exit_code != 0:
+                    print(f"benchmark.py: {name} at {scale}x exited {exit_code}", file=sys.stderr)
+                walls.append(wall)
+                rss = max(rss, peak_rss)
+            wall = min(walls)
+            key = f"{name}@{scale}x"
+            results[key] = {"wall_s": round(wall, 4), "peak_rss_kb": rss, "items": items,
+                            "unit": unit, "throughput": round(items/wall, 1) if wall else 0,
+                            "exit_code": exit_code}
+            print(format_row(key, results[key]))
+            sys.stdout.flush()
+    return {"version": BASELINE_VERSION, "commit": git_commit(), "date": time.time(),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "repeat": repeat, "seed": seed, "results": results}
+
+
+def format_row(key, result):
+    return f"{key:<32} {result['wall_s']:>9.3f}s {result['peak_rss_kb']/1024:>8.1f}MB " \
+        f"{result['throughput']:>12.1f} {result['unit']}/s"
+
+
+def compare(old, new, threshold):
+    """Prints the change of every benchmark in both baselines.
+
+    Returns:
+        list of strings: the benchmarks that got slower or bigger by more
+            than threshold percent (and by more than MIN_WALL_CHANGE seconds
+            or MIN_RSS_CHANGE kB)
+    """
+    regressions = []
+    print(f"{'benchmark':<32} {'wall':>9} {'change':>8} {'rss':>9} {'change':>8}   "
+          f"({old.get('commit', '?')} -> {new.get('commit', '?')})")
+    for (key, result) in new["results"].items():
+        if key not in old.get("results", {}):
+            print(f"{key:<32} {result['wall_s']:>8.3f}s      new")
+            continue
+        before = old["results"][key]
+        changes = []
+        for (field, min_change) in (("wall_s", MIN_WALL_CHANGE), ("peak_rss_kb", MIN_RSS_CHANGE)):
+            change = 100*(result[field]-before[field])/before[field] if before[field] else 0
+            changes.append(change)
+            if change > threshold and result[field]-before[field] > min_change:
+                regressions.append(f"{key} {field} {change:+.1f}%")
+        print(f"{key:<32} {result['wall_s']:>8.3f}s {changes[0]:>+7.1f}% "
+              f"{result['peak_rss_kb']/1024:>7.1f}MB {changes[1]:>+7.1f}%")
+    return regressions
+
+
+def display_help():
+    """Function displaying all help info when run on command line."""
+    print("Usage: benchmark.py [OPTIONS]                                          ")
+    print("     Times alog2image.py, monte_merge_results.py (full, parallel and   ")
+    print("     incremental), pltcsv.py and the queue scripts on synthetic inputs,")
+    print("     and writes a JSON baseline.                                       ")
+    print("     --scales=1,10,100       Input sizes, as multiples of 1x (default) ")
+    print("     --repeat=N              Runs of each benchmark. Default 3         ")
+    print("     --only=a,b              Only these benchmarks                     ")
+    print("     --seed=N                Seed of the inputs. Default 1             ")
+    print("     --work_dir=             Where the inputs go (kept for next time). ")
+    print("                             Default /tmp/monte_benchmark              ")
+    print("     --output=, -o=          Baseline to write. Default bench.json     ")
+    print("     --compare=<old.json>    Compare against an older baseline. Exits 1")
+    print("                             if anything got worse by > --threshold    ")
+    print("     --threshold=<percent>   Default 10                                ")
+    print("     --verbose=num, -v=num or --verbose, -v                            ")
+
+
+def main():
+    """Handles cmd line args."""
+    global verbose
+    scales = [1, 10, 100]
+    repeat = 3
+    only = []
+    seed = 1
+    work_dir = "/tmp/monte_benchmark"
+    output_file = "bench.json"
+    compare_file = ""
+    threshold = 10.0
+    for (i, arg) in enumerate(sys.argv):
+        # skip over the name of this script
+        if i == 0:
+            continue
+        if arg == "-h" or arg == "--help":
+            display_help()
+            exit(0)
+        if arg.startswith("--scales="):
+            scales = [int(s) for s in arg[len("--scales="):].split(",")]
+        elif arg.startswith("--repeat="):
+            repeat = max(1, int(arg[len("--repeat="):]))
+        elif arg.startswith("--only="):
+            only = arg[len("--only="):].split(",")
+        elif arg.startswith("--seed="):
+            seed = int(arg[len("--seed="):])
+        elif arg.startswith("--work_dir="):
+            work_dir = arg[len("--work_dir="):]
+        elif arg.startswith("--output=") or arg.startswith("-o="):
+            output_file = arg[arg.index("=")+1:]
+        elif arg.startswith("--compare="):
+            compare_file = arg[len("--compare="):]
+        elif arg.startswith("--threshold="):
+            threshold = float(arg[len("--threshold="):])
+        elif arg == "--verbose" or arg == "-v":
+            verbose = 1
+        elif arg.startswith("--verbose=") or arg.startswith("-v="):
+            verbose = int(arg[arg.index("=")+1:])
+        else:
+            assert False, "Error: " + arg + \
+                " is not a valid argument. Use -h or --help for usage."
+
+    old = None
+    if compare_file:
+        with open(compare_file, "r") as f:
+            old = json.load(f)
+        if old.get("version") != BASELINE_VERSION:
+            print(f"benchmark.py: {compare_file} is a version {old.get('version')} baseline "
+                  f"(this is {BASELINE_VERSION}), some benchmarks may not be comparable", file=sys.stderr)
+    baseline = run(scales, work_dir, repeat, seed, only)
+    with open(output_file, "w") as f:
+        json.dump(baseline, f, indent=1)
+        f.write("\n")
+    print(f"Baseline written to {output_file}")
+    if old is not None:
+        regressions = compare(old, baseline, threshold)
+        if regressions:
+            print("Regressions: "+", ".join(regressions))
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
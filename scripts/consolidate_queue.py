@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# Kevin Becker
+# Merges duplicate jobs in one or more queue files in a single pass. Same
+# rules and flags as consolidate_queue.sh / merge_queues.sh.
+import os
+import sys
+import tempfile
+import job_queue
+
+
+def consolidate_files(input_files, output_file, breakpoint=job_queue.BREAKPOINT,
+                      des_policy="add", act_policy="add", first_jobs=False,
+                      ignore_breakpoint=False):
+    """Consolidates the input queues into output_file. With more than one
+    input, the files are joined with a breakpoint between each of them (what
+    merge_queues.sh did with cat), so the first file sets the jobs and order.
+
+    The output is written to a temp file and then moved into place, so
+    output_file may also be one of the inputs.
+
+    Args:
+        input_files (list of strings): queue files, newest first
+        output_file (string): where to write the consolidated queue
+        breakpoint (string): the breakpoint marker
+        des_policy, act_policy, first_jobs, ignore_breakpoint: see
+            job_queue.consolidate
+    """
+    entries = []
+    for (i, input_file) in enumerate(input_files):
+        if i > 0:
+            entries.append(job_queue.parse_line(breakpoint, 0, breakpoint))
+        entries.extend(job_queue.read_queue(input_file, breakpoint))
+    lines = job_queue.consolidate(entries, des_policy, act_policy, first_jobs,
+                                  ignore_breakpoint)
+
+    output_dir = os.path.dirname(output_file) or "."
+    os.makedirs(output_dir, exist_ok=True)
+    fd, temp_file = tempfile.mkstemp(dir=output_dir, prefix=".tmp_")
+    with os.fdopen(fd, "w") as f:
+        for line in lines:
+            f.write(line+"\n")
+    os.replace(temp_file, output_file)
+
+
+def display_help():
+    """Function displaying all help info when run on command line."""
+    print("Usage: consolidate_queue.py [OPTIONS] queue_file_1.txt [queue_file_2.txt ...]")
+    print("     Merges duplicate jobs (same job file and args) in the queue.     ")
+    print("     Several files are merged like merge_queues.sh: a breakpoint is   ")
+    print("     put between them, so list the newest file first.                 ")
+    print("     --output=, -o=          Output file. Defaults to                 ")
+    print("                             consolidated_queue.txt                   ")
+    print("     --verbose=num, -v=num or --verbose, -v                           ")
+    print("   How to handle the breakpoint:                                      ")
+    print("     --breakpoint=, -b=      Set breakpoint string. Default is:       ")
+    print("                             " + job_queue.BREAKPOINT)
+    print("     --ignore_breakpoint, -ib  Treat the breakpoint as a comment      ")
+    print("     --first_jobs, -fj       Only output jobs from above the breakpoint")
+    print("   How to handle the desired/actual runs (default is to add them):    ")
+    print("     --max_desired, -md, or --max_actual, -ma     take the max        ")
+    print("     --add_desired, -ad, or --add_actual, -aa     take the sum        ")
+    print("     --first_desired, -fd, or --first_actual, -fa take the first      ")
+    print("     --last_desired, -ld, or --last_actual, -la   take the last       ")
+
+
+def main():
+    """Handles cmd line args."""
+    input_files = []
+    output_file = "consolidated_queue.txt"
+    breakpoint = job_queue.BREAKPOINT
+    des_policy = "add"
+    act_policy = "add"
+    first_jobs = False
+    ignore_breakpoint = False
+    policies = {"max": "max", "add": "add", "first": "first", "last": "last",
+                "m": "max", "a": "add", "f": "first", "l": "last"}
+    for (i, arg) in enumerate(sys.argv):
+        # skip over the name of this script
+        if i == 0:
+            continue
+        if arg == "-h" or arg == "--help":
+            display_help()
+            exit(0)
+        if arg.startswith("--output=") or arg.startswith("-o="):
+            output_file = arg[arg.index("=")+1:]
+            continue
+        if arg == "--verbose" or arg == "-v":
+            job_queue.verbose = 1
+            continue
+        if arg.startswith("--verbose=") or arg.startswith("-v="):
+            job_queue.verbose = int(arg[arg.index("=")+1:])
+            continue
+        if arg.startswith("--breakpoint=") or arg.startswith("-b="):
+            breakpoint = arg[arg.index("=")+1:]
+            continue
+        if arg == "--ignore_breakpoint" or arg == "-ib":
+            ignore_breakpoint = True
+            continue
+        if arg == "--first_jobs" or arg == "-fj":
+            first_jobs = True
+            continue
+        # --max_desired, -md, --first_actual, -fa, ...
+        if arg.startswith("--") and arg.endswith(("_desired", "_actual")):
+            policy, which = arg[2:].split("_", 1)
+        elif len(arg) == 3 and arg[0] == "-" and arg[2] in "da":
+            policy, which = arg[1], ("desired" if arg[2] == "d" else "actual")
+        else:
+            policy, which = "", ""
+        if policy in policies:
+            if which == "desired":
+                des_policy = policies[policy]
+            else:
+                act_policy = policies[policy]
+            continue
+        if not arg.startswith("-"):
+            input_files.append(arg)
+            continue
+        assert False, "Error: " + arg + \
+            " is not a valid argument. Use -h or --help for usage."
+
+    if not input_files:
+        print("consolidate_queue.py: no queue file given", file=sys.stderr)
+        exit(1)
+    for input_file in input_files:
+        if not os.path.isfile(input_file):
+            print("consolidate_queue.py: File does not exist: "+input_file, file=sys.stderr)
+            exit(1)
+    job_queue.vprint("RUNS_DES_MERGE_TYPE="+des_policy+" RUNS_ACT_MERGE_TYPE="+act_policy, 3)
+    consolidate_files(input_files, output_file, breakpoint, des_policy,
+                      act_policy, first_jobs, ignore_breakpoint)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# Kevin Becker
+# Adaptive early stopping. A job file may declare a stopping rule: a target
+# confidence interval width for some columns of its results.csv, e.g.
+#     STOP_CI="avg_speed=0.05 collisions=10%"
+#     STOP_CONFIDENCE=0.95   (default)
+#     STOP_MIN_RUNS=10       (default)
+# Each queue line of the job (its job args) is its own experiment, with its
+# own statistics: every run's results have its job args in the job_args
+# column (job_args.csv, written by monte_extract_results.sh). After each
+# merge the host updates the running mean/variance of those columns per
+# line (only the rows added since the last call are read), and projects how
+# many runs each line needs for every interval to be narrow enough. That
+# number caps the line's runs desired in the host queue, so clients move on
+# to jobs that still need samples.
+import csv
+import hashlib
+import io
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+
+STATE_VERSION = 2
+# Column with the job args of each run. Runs merged before it existed have
+# no job args, like the runs of a line without any
+ARGS_COLUMN = "job_args"
+TAIL_CHECK_BYTES = 64
+verbose = 0
+
+
+def vprint(msg, level=1):
+    """Verbose print, to stderr."""
+    if verbose >= level:
+        print("early_stop.py: "+str(msg), file=sys.stderr)
+
+
+def parse_rule(rule):
+    """Parses a stopping rule, "column=width [column=width%] ...". A width
+    ending in % is relative to the magnitude of the column's mean.
+
+    Returns:
+        dict: column -> (width, relative)
+    """
+    targets = {}
+    for term in rule.split():
+        (column, _, width) = term.rpartition("=")
+        relative = width.endswith("%")
+        try:
+            value = float(width[:-1] if relative else width)
+        except ValueError:
+            value = -1
+        assert column and value > 0, "Error: bad stopping rule term " + term + \
+            ". Use column=width or column=width%"
+        targets[column] = (value/100 if relative else value, relative)
+    return targets
+
+
+def t_quantile(p, dof):
+    """Quantile of Student's t distribution, from the normal quantile with
+    the Cornish-Fisher expansion (to within 0.5% for dof >= 3)."""
+    z = statistics.NormalDist().inv_cdf(p)
+    if dof <= 0:
+        return float("inf")
+    g1 = (z**3 + z)/4
+    g2 = (5*z**5 + 16*z**3 + 3*z)/96
+    g3 = (3*z**7 + 19*z**5 + 17*z**3 - 15*z)/384
+    g4 = (79*z**9 + 776*z**7 + 1482*z**5 - 1920*z**3 - 945*z)/92160
+    return z + g1/dof + g2/dof**2 + g3/dof**3 + g4/dof**4
+
+
+def state_filename(results_file):
+    """Running statistics kept next to the results (results.csv ->
+    .results.csv.stop.json)"""
+    return os.path.join(os.path.dirname(results_file),
+                        "." + os.path.basename(results_file) + ".stop.json")
+
+
+def write_atomic(file, text):
+    fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(file) or ".", prefix=".tmp_")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(temp_file, file)
+
+
+def tail_hash(f, offset):
+    """sha1 of the bytes just before offset, to tell an appended file from
+    a rewritten one."""
+    start = max(0, offset-TAIL_CHECK_BYTES)
+    f.seek(start)
+    return hashlib.sha1(f.read(offset-start)).hexdigest()
+
+
+def update_stats(results_file, columns):
+    """Brings the running count/mean/M2 (Welford) of each column, per job
+    args, up to date with results_file. Only the rows past the last call's
+    offset are read, unless the file was rewritten (header or earlier bytes
+    changed), in which case it is read from the start. Values that are not
+    numbers are skipped.
+
+    Returns:
+        dict: job args -> {"rows": rows seen, "stats": column -> {"n",
+            "mean", "m2"}}
+    """
+    state_file = state_filename(results_file)
+    try:
+        with open(state_file, "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    with open(results_file, "rb") as f:
+        header = f.readline()
+        if state.get("version") != STATE_VERSION or \
+                state.get("header") != header.decode(errors="replace") or \
+                sorted(state.get("columns", [])) != sorted(columns) or \
+                state.get("offset", 0) > os.fstat(f.fileno()).st_size or \
+                tail_hash(f, state.get("offset", 0)) != state.get("tail"):
+            vprint("reading "+results_file+" from the start")
+            state = {"version": STATE_VERSION, "header": header.decode(errors="replace"),
+                     "offset": len(header), "columns": columns, "groups": {}}
+        f.seek(state["offset"])
+        data = f.read()
+    # Only whole lines: a partial last line is read next time
+    data = data[:data.rfind(b"\n")+1]
+
+    names = next(csv.reader([state["header"]]), [])
+    index = {c: names.index(c) for c in columns if c in names}
+    args_index = names.index(ARGS_COLUMN) if ARGS_COLUMN in names else None
+    rows = 0
+    for row in csv.reader(io.StringIO(data.decode(errors="replace"))):
+        if not row:
+            continue
+        rows += 1
+        args = row[args_index] if args_index is not None and args_index < len(row) else ""
+        group = state["groups"].get(args)
+        if group is None:
+            group = state["groups"][args] = {
+                "rows": 0, "stats": {c: {"n": 0, "mean": 0.0, "m2": 0.0} for c in columns}}
+        group["rows"] += 1
+        for (column, i) in index.items():
+            try:
+                value = float(row[i])
+            except (ValueError, IndexError):
+                continue
+            if not math.isfinite(value):
+                continue
+            s = group["stats"][column]
+            s["n"] += 1
+            delta = value-s["mean"]
+            s["mean"] += delta/s["n"]
+            s["m2"] += delta*(value-s["mean"])
+    state["offset"] += len(data)
+    with open(results_file, "rb") as f:
+        state["tail"] = tail_hash(f, state["offset"])
+    write_atomic(state_file, json.dumps(state))
+    vprint(f"read {rows} new rows ({sum(g['rows'] for g in state['groups'].values())} total)")
+    return state["groups"]
+
+
+def runs_needed(stats, targets, confidence=0.95, min_runs=10):
+    """Projects the number of runs needed for every column's confidence
+    interval to be at most its target width. The interval width shrinks
+    with 1/sqrt(n), so a column with width w after n runs needs about
+    n*(w/target)^2. Until a column has min_runs values, nothing is
+    projected for it.
+
+    Returns:
+        int, dict: runs needed (None if it can't be projected yet), and
+            column -> {"n", "mean", "width", "target", "needed"}
+    """
+    report = {}
+    needed = 0
+    for (column, (target, relative)) in targets.items():
+        s = stats.get(column, {"n": 0, "mean": 0.0, "m2": 0.0})
+        n = s["n"]
+        entry = {"n": n, "mean": s["mean"], "width": None, "target": None, "needed": None}
+        report[column] = entry
+        if n < max(2, min_runs):
+            needed = None
+            continue
+        std = math.sqrt(s["m2"]/(n-1))
+        width = 2*t_quantile((1+confidence)/2, n-1)*std/math.sqrt(n)
+        goal = target*abs(s["mean"]) if relative else target
+        entry["width"] = width
+        entry["target"] = goal
+        if width <= goal:
+            entry["needed"] = n
+        elif goal > 0:
+            entry["needed"] = math.ceil(n*(width/goal)**2)
+        else:
+            entry["needed"] = None
+        if needed is not None:
+            needed = None if entry["needed"] is None else max(needed, entry["needed"])
+    return needed, report
+
+
+def read_caps(caps_file):
+    """Reads the caps file (JSON): job_file -> {"lines": {job args: {"cap":
+    runs needed, "rows": runs merged so far, "original": runs desired in
+    the queue before it was capped, "set": runs desired it was capped to}}}.
+    Jobs capped as a whole (one cap shared by all lines, from before caps
+    were per line) are dropped, and capped again at their next merge."""
+    try:
+        with open(caps_file, "r") as f:
+            caps = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(caps, dict):
+        return {}
+    return {job: c for (job, c) in caps.items() if isinstance(c, dict) and "cap" not in c}
+
+
+def write_caps(caps_file, caps):
+    write_atomic(caps_file, json.dumps(caps, indent=1, sort_keys=True)+"\n")
+
+
+def job_path(job_file):
+    """Same as job_path in lib_util_functions.sh (everything after job_dirs/)"""
+    while "//" in job_file:
+        job_file = job_file.replace("//", "/")
+    return job_file.split("job_dirs/", 1)[-1]
+
+
+def apply_caps(queue_file, caps):
+    """Caps runs desired in queue_file so each line (job file and job args)
+    only gets the runs it still needs (its cap minus its runs already
+    merged). Runs desired is never set above what the queue asked for
+    before it was capped (so a projection that grows gives runs back, up to
+    that), nor below runs actual. Lines without a cap yet are left as they
+    are.
+
+    Returns:
+        int: number of lines changed (caps is updated in place)
+    """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import job_queue
+
+    if not caps or not os.path.isfile(queue_file):
+        return 0
+    entries = job_queue.read_queue(queue_file)
+    changed = 0
+    lines = []
+    for entry in entries:
+        job = job_path(entry["job_file"])
+        line = caps.get(job, {}).get("lines", {}).get(entry["job_args"])
+        if entry["kind"] != "job" or line is None or "cap" not in line or entry["runs_des"] == "":
+            lines.append(entry["text"])
+            continue
+        runs_des = int(entry["runs_des"])
+        runs_act = int(entry["runs_act"])
+        if line.get("set") != runs_des:
+            # Not capped yet, or changed since (e.g. by the queue's owner)
+            line["original"] = runs_des
+        left = max(0, line["cap"]-line.get("rows", 0))
+        new_des = max(runs_act, min(line["original"], runs_act+left))
+        line["set"] = new_des
+        if new_des != runs_des:
+            vprint(f"{entry['job_file']} {entry['job_args']}: runs desired {runs_des} -> {new_des}")
+            entry["runs_des"] = str(new_des)
+            lines.append(job_queue.format_line(entry))
+            changed += 1
+        else:
+            lines.append(entry["text"])
+    if changed:
+        write_atomic(queue_file, "\n".join(lines)+"\n")
+    return changed
+
+
+def display_help():
+    """Function displaying all help info when run on command line."""
+    print("Usage: early_stop.py [OPTIONS] --results=<results.csv> --rule=\"<rule>\" ")
+    print("       early_stop.py [OPTIONS] --apply --queue_file=<queue>             ")
+    print("     Evaluates a job's stopping rule against its merged results.csv    ")
+    print("     (incrementally), and caps the runs desired of each of its lines   ")
+    print("     (job args, from the job_args column) in the host queue.           ")
+    print("     --results=<file>        Merged results of the job                 ")
+    print("     --rule=\"col=w col=w%\"   Target confidence interval width per      ")
+    print("                             column (w% is relative to |mean|)         ")
+    print("     --confidence=<p>        Default 0.95                              ")
+    print("     --min_runs=<N>          Runs before anything is projected. Def. 10")
+    print("     --job=<job_file>        The job, as named in the queue            ")
+    print("     --caps=<file>           Where the caps are kept. Defaults to      ")
+    print("                             $CARLO_DIR_LOCATION/early_stop_caps.json   ")
+    print("     --queue_file=, -qf=     Queue to apply the caps to                ")
+    print("     --apply                 Only apply the caps to the queue          ")
+    print("     --check_rule            Only check the rule's syntax              ")
+    print("     --verbose=num, -v=num or --verbose, -v  (prints to stderr)       ")
+
+
+def main():
+    """Handles cmd line args."""
+    global verbose
+    results_file = ""
+    rule = ""
+    confidence = 0.95
+    min_runs = 10
+    job = ""
+    caps_file = os.path.join(os.environ.get("CARLO_DIR_LOCATION", "."), "early_stop_caps.json")
+    queue_file = ""
+    apply_only = False
+    check_rule = False
+    for (i, arg) in enumerate(sys.argv):
+        # skip over the name of this script
+        if i == 0:
+            continue
+        if arg == "-h" or arg == "--help":
+            display_help()
+            exit(0)
+        if arg.startswith("--results="):
+            results_file = arg[len("--results="):]
+        elif arg.startswith("--rule="):
+            rule = arg[len("--rule="):]
+        elif arg.startswith("--confidence="):
+            confidence = float(arg[len("--confidence="):])
+            assert 0 < confidence < 1, "Error: confidence must be between 0 and 1"
+        elif arg.startswith("--min_runs="):
+            min_runs = int(arg[len("--min_runs="):])
+        elif arg.startswith("--job="):
+            job = job_path(arg[len("--job="):])
+        elif arg.startswith("--caps="):
+            caps_file = arg[len("--caps="):]
+        elif arg.startswith("--queue_file=") or arg.startswith("-qf="):
+            queue_file = arg[arg.index("=")+1:]
+        elif arg == "--apply":
+            apply_only = True
+        elif arg == "--check_rule":
+            check_rule = True
+        elif arg == "--verbose" or arg == "-v":
+            verbose = 1
+        elif arg.startswith("--verbose=") or arg.startswith("-v="):
+            verbose = int(arg[arg.index("=")+1:])
+        else:
+            assert False, "Error: " + arg + \
+                " is not a valid argument. Use -h or --help for usage."
+
+    if check_rule:
+        parse_rule(rule)
+        exit(0)
+    if not apply_only:
+        targets = parse_rule(rule)
+        if not targets:
+            print("early_stop.py: no stopping rule given", file=sys.stderr)
+            exit(1)
+        if not os.path.isfile(results_file):
+            print("early_stop.py: "+results_file+" not found", file=sys.stderr)
+            exit(1)
+        groups = update_stats(results_file, list(targets))
+        caps = read_caps(caps_file)
+        for (args, group) in sorted(groups.items()):
+            rows = group["rows"]
+            name = (job+" "+args).strip()
+            needed, report = runs_needed(group["stats"], targets, confidence, min_runs)
+            print(f"    {name or '(all runs)'}:")
+            for (column, r) in report.items():
+                if r["width"] is None:
+                    print(f"      {column}: {r['n']} values, need {min_runs} before projecting")
+                else:
+                    print(f"      {column}: mean {r['mean']:.4g}, {confidence:.0%} CI width "
+                          f"{r['width']:.4g} (target {r['target']:.4g}) -> {r['needed']} runs")
+            if job and needed is not None:
+                cap = max(needed, min_runs)
+                caps.setdefault(job, {}).setdefault("lines", {}).setdefault(args, {}).update(
+                    cap=cap, rows=rows)
+                print(f"      {rows} runs, capped at {cap}" + (" (converged)" if cap <= rows else ""))
+        if job:
+            write_caps(caps_file, caps)
+    if queue_file:
+        caps = read_caps(caps_file)
+        changed = apply_caps(queue_file, caps)
+        if caps:
+            write_caps(caps_file, caps)
+        vprint(f"{changed} queue lines changed in {queue_file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -47,7 +47,30 @@ fi
 # Encrypt or decrypt based on file extension
 #######################################################
 #       DECRYPT
-if [[ $INPUT = *".enc" ]]; then
+if [[ $INPUT = *".tar."*".enc" ]]; then
+    # Packed dir: decrypt, decompress and untar in one pass
+    echo "Decrypting..."
+    if [[ -z $OUTPUT ]]; then
+        # remove .tar.gz.enc from output
+        OUTPUT="${INPUT%.tar.*.enc}"
+    fi
+    vecho "monte_pack.sh --unpack $INPUT --output=$OUTPUT -o" 2
+    monte_pack.sh --unpack "$INPUT" --output="$OUTPUT" -o
+    if [[ $? -ne 0 ]]; then
+        vexit "error decompressing file" 5
+    fi
+    vecho "Decompressed $INPUT to $OUTPUT" 1
+
+    INPUT_STRIPPED_STRIPPED="$(basename $INPUT)"
+    INPUT_STRIPPED_STRIPPED="${INPUT_STRIPPED_STRIPPED%%.*}"
+    vecho "Checking if ${OUTPUT}/${INPUT_STRIPPED_STRIPPED}_backup exists..." 1
+
+    # Rename, as consistent with send2host.sh
+    if [[ -d "${OUTPUT}/${INPUT_STRIPPED_STRIPPED}_backup" ]]; then
+        vecho "${OUTPUT}/${INPUT_STRIPPED_STRIPPED}_backup exists. Moving to $OUTPUT/$INPUT_STRIPPED_STRIPPED" 1
+        mv "${OUTPUT}/${INPUT_STRIPPED_STRIPPED}_backup" "$OUTPUT/$INPUT_STRIPPED_STRIPPED"
+    fi
+elif [[ $INPUT = *".enc" ]]; then
     echo "Decrypting..."
     INPUT_STRIPPED="${INPUT%.enc}"
     if [[ -z $OUTPUT ]]; then
@@ -55,43 +78,11 @@ if [[ $INPUT = *".enc" ]]; then
         OUTPUT="$INPUT_STRIPPED"
     fi
     # decrypt
-    openssl enc -pbkdf2 -d -aes-256-cbc -in "$INPUT" -out "$INPUT_STRIPPED" -pass pass:"$PASSWORD"
-    vecho "Decrypted!" 1
+    openssl enc -pbkdf2 -d -aes-256-cbc -in "$INPUT" -out "$OUTPUT" -pass pass:"$PASSWORD"
     if [[ $? -ne 0 ]]; then
         vexit "error decrypting input " 4
     fi
-    vecho "Removing $INPUT" 1
-    # rm "$INPUT"
-
-    # If it's a directory, decompress
-    if [[ $INPUT_STRIPPED = *".tar.gz" ]]; then
-
-        if [[ $OUTPUT = *".tar.gz" ]]; then
-            # Remove .tar.gz from output
-            OUTPUT="${OUTPUT%.tar.gz}"
-        fi
-        vecho "Decompressing $INPUT_STRIPPED..." 2
-        mkdir -p $OUTPUT
-        tar -P -xzf "$INPUT_STRIPPED" -C $OUTPUT #2> /dev/null
-        if [[ $? -ne 0 ]]; then
-            vexit "error decompressing file" 5
-        fi
-        vecho "Decompressed $INPUT_STRIPPED to $OUTPUT. Removing $INPUT_STRIPPED" 1
-        rm "$INPUT_STRIPPED"
-
-        INPUT_STRIPPED_STRIPPED="$(basename $INPUT)"
-        INPUT_STRIPPED_STRIPPED="${INPUT_STRIPPED_STRIPPED%%.*}" 
-        vecho "Checking if ${OUTPUT}/${INPUT_STRIPPED_STRIPPED}_backup exists..." 1
-
-        # Rename, as consistent with send2host.sh
-        if [[ -d "${OUTPUT}/${INPUT_STRIPPED_STRIPPED}_backup" ]]; then
-            vecho "${OUTPUT}/${INPUT_STRIPPED_STRIPPED}_backup exists. Moving to $OUTPUT/$INPUT_STRIPPED_STRIPPED" 1
-            mv "${OUTPUT}/${INPUT_STRIPPED_STRIPPED}_backup" "$OUTPUT/$INPUT_STRIPPED_STRIPPED"
-        fi
-    else
-        vecho "not compressed, good to go" 1
-        true
-    fi
+    vecho "Decrypted!" 1
 
 #######################################################
 # Encrypt or decrypt based on file extension
@@ -99,43 +90,32 @@ if [[ $INPUT = *".enc" ]]; then
 #       ENCRYPT
 else
 
-    # If it's a directory, compress it first
+    # If it's a directory, pack it (tar, compress and encrypt in one pass)
     if [[ -d $INPUT ]]; then
-        # Compress first
-        old_pwd=$(pwd)
-        base_input=$(basename $INPUT)
-        dirname_input=$(dirname $INPUT)
-        cd $dirname_input
-        vecho "in dir $(pwd)" 2
-        vecho "Input is a directory. Compressing..." 1
-        vecho "tar -czf \"${base_input}.tar.gz\" $base_input " 2
-        tar        -czf  "${base_input}.tar.gz"  $base_input #"$base_input" -C $base_input #2> /dev/null
+        if [[ -z $OUTPUT ]]; then
+            OUTPUT="${INPUT}.tar.gz.enc"
+        fi
+        vecho "Input is a directory. Packing..." 1
+        vecho "monte_pack.sh $INPUT --output=$OUTPUT -o" 2
+        monte_pack.sh "$INPUT" --output="$OUTPUT" -o
         if [[ $? -ne 0 ]]; then
             vexit " compressing file" 2
         fi
-        # rm -rfd "$base_input"
-        cd $old_pwd
-        INPUT="${INPUT}.tar.gz"
-        vecho "Now zipped to input file: $INPUT" 1
     elif [[ -f $INPUT ]]; then
-        # echo "Input is a file. Good to go."
-        true
-    else
-        vecho "Input is not a file or directory" 1
-    fi
+        if [[ -z $OUTPUT ]]; then
+            # add .enc to output
+            OUTPUT="${INPUT}.enc"
+        fi
+        vecho "Encrypting..." 1
 
-   if [[ -z $OUTPUT ]]; then
-        # add .enc to output
-        OUTPUT="${INPUT}.enc"
-    fi
-    vecho "Encrypting..." 1
- 
-    # encrypt
-    openssl enc -pbkdf2 -aes-256-cbc -salt -in "$INPUT" -out "$OUTPUT" -pass pass:"$PASSWORD"
-    if [[ $? -ne 0 ]]; then
-        vexit "error encrypting input " 6
+        # encrypt
+        openssl enc -pbkdf2 -aes-256-cbc -salt -in "$INPUT" -out "$OUTPUT" -pass pass:"$PASSWORD"
+        if [[ $? -ne 0 ]]; then
+            vexit "error encrypting input " 6
+        fi
+    else
+        vexit "Input is not a file or directory" 1
     fi
-    # rm "$INPUT"
 
 fi
 
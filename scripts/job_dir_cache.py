@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# Kevin Becker
+# Bookkeeping for the client's cache of extracted job dirs (see run_next.sh).
+# Each entry is <cache_dir>/<sha256 of the published .tar.gz.enc>/<job_dir>,
+# so an entry is only reused if the archive on the host is byte-identical.
+# Entries are evicted least recently used first (by mtime, which run_next.sh
+# touches on every use) once the cache is over its size limit.
+import json
+import os
+import shutil
+import sys
+
+STATS_FILE = "stats.json"
+
+
+def is_entry(name):
+    """Cache entries are named after a sha256 (64 hex characters)."""
+    return len(name) == 64 and all(c in "0123456789abcdef" for c in name)
+
+
+def dir_size(path):
+    """Total size in bytes of the files under path."""
+    total = 0
+    for (root, _dirs, files) in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def evict(cache_dir, max_bytes, keep=""):
+    """Removes the least recently used entries until the cache fits in
+    max_bytes. The entry named keep (the one in use) is never removed.
+
+    Returns:
+        list of strings: the entries that were removed
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if is_entry(name) and os.path.isdir(path):
+            entries.append((os.stat(path).st_mtime, name, dir_size(path)))
+    total = sum(size for (_mtime, _name, size) in entries)
+    removed = []
+    for (_mtime, name, size) in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name == keep:
+            continue
+        shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+        total -= size
+        removed.append(name)
+    return removed
+
+
+def record(cache_dir, result):
+    """Counts a cache hit or miss. Returns the updated counts."""
+    stats_file = os.path.join(cache_dir, STATS_FILE)
+    try:
+        with open(stats_file, "r") as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        stats = {}
+    stats = {"hits": stats.get("hits", 0), "misses": stats.get("misses", 0)}
+    if result == "hit":
+        stats["hits"] += 1
+    elif result == "miss":
+        stats["misses"] += 1
+    with open(stats_file+".tmp", "w") as f:
+        json.dump(stats, f)
+    os.replace(stats_file+".tmp", stats_file)
+    return stats
+
+
+def display_help():
+    """Function displaying all help info when run on command line."""
+    print("Usage: job_dir_cache.py [OPTIONS] CACHE_DIR                           ")
+    print("     Records a hit/miss of the job dir cache, evicts least recently   ")
+    print("     used entries, and prints \"hits=N misses=N\"                     ")
+    print("     --record=hit|miss       Count a cache hit or miss                ")
+    print("     --max_size=<MB>         Size limit of the cache. Default 2048    ")
+    print("     --keep=<sha256>         Entry that must not be evicted           ")
+
+
+def main():
+    """Handles cmd line args."""
+    cache_dir = ""
+    result = ""
+    max_size = 2048
+    keep = ""
+    for (i, arg) in enumerate(sys.argv):
+        # skip over the name of this script
+        if i == 0:
+            continue
+        if arg == "-h" or arg == "--help":
+            display_help()
+            exit(0)
+        if arg.startswith("--record="):
+            result = arg[len("--record="):]
+            continue
+        if arg.startswith("--max_size="):
+            max_size = float(arg[len("--max_size="):])
+            continue
+        if arg.startswith("--keep="):
+            keep = arg[len("--keep="):]
+            continue
+        if cache_dir == "":
+            cache_dir = arg
+            continue
+        assert False, "Error: " + arg + \
+            " is not a valid argument. Use -h or --help for usage."
+
+    if not os.path.isdir(cache_dir):
+        print("job_dir_cache.py: no cache dir "+cache_dir, file=sys.stderr)
+        exit(1)
+    stats = record(cache_dir, result)
+    evict(cache_dir, max_size*1024*1024, keep)
+    print(f'hits={stats["hits"]} misses={stats["misses"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+# Kevin Becker
+# Parses a *_job_queue.txt file once, then answers queries from the parsed
+# lines. Replaces the per-line awk/read_queue.sh forks used by select_job.sh
+# and run_next.sh.
+#
+# Queue line format:
+#   job_file [--job_arg1 --job_arg2 ...] runs_desired runs_actual
+import os
+import random
+import sys
+
+BREAKPOINT = "-------BREAKPOINT-------"
+PROBABILITY_SKIP = 75  # proability it skips the first available job
+verbose = 0
+
+
+def vprint(msg, level=1):
+    """Verbose print. Goes to stderr, since stdout is the queue output."""
+    if verbose >= level:
+        print("job_queue.py: "+str(msg), file=sys.stderr)
+
+
+def parse_line(text, line_num=0, breakpoint=BREAKPOINT):
+    """Parses one line of a queue file, the same way read_queue.sh does.
+
+    Args:
+        text (string): the line (without the newline)
+        line_num (int): line number in the file (1-indexed)
+        breakpoint (string): the breakpoint marker
+
+    Returns:
+        dict: with keys line_num, text, kind, job_file, job_args, runs_des,
+            runs_act. kind is one of "job", "comment" (includes blank lines),
+            "breakpoint" or "bad" (runs are not integers).
+    """
+    entry = {"line_num": line_num, "text": text, "kind": "job",
+             "job_file": "", "job_args": "", "runs_des": "", "runs_act": "0"}
+    if text == breakpoint:
+        entry["kind"] = "breakpoint"
+        return entry
+    if text == "" or text.startswith("#"):
+        entry["kind"] = "comment"
+        return entry
+
+    tokens = text.split()
+    if not tokens:
+        entry["kind"] = "comment"
+        return entry
+    job_file = tokens[0]
+    job_args = []
+    runs_des = ""
+    runs_act = "0"
+    for token in tokens[1:]:
+        if token == job_file:
+            continue
+        if token.startswith("--"):
+            job_args.append(token)
+        elif runs_des == "":
+            runs_des = token
+        else:
+            runs_act = token
+    entry["job_file"] = job_file
+    entry["job_args"] = " ".join(job_args)
+    entry["runs_des"] = runs_des
+    entry["runs_act"] = runs_act
+    if not (runs_des.isdigit() or runs_des == "") or not runs_act.isdigit():
+        entry["kind"] = "bad"
+    return entry
+
+
+def read_queue(queue_file, breakpoint=BREAKPOINT):
+    """Reads and parses every line of a queue file.
+
+    Args:
+        queue_file (string): path to the queue file
+        breakpoint (string): the breakpoint marker
+
+    Returns:
+        list of dicts: one entry per line (see parse_line)
+    """
+    with open(queue_file, "r") as f:
+        return [parse_line(text.rstrip("\r\n"), i+1, breakpoint)
+                for (i, text) in enumerate(f)]
+
+
+def runs_left(entry):
+    """Number of runs left for a job entry (0 for anything else)."""
+    if entry["kind"] != "job":
+        return 0
+    return int(entry["runs_des"] or 0) - int(entry["runs_act"] or 0)
+
+
+def job_key(entry):
+    """The string list_bad_job.sh writes to bad_jobs.txt for this job."""
+    return entry["job_file"]+" "+entry["job_args"]
+
+
+def format_line(entry):
+    """Formats a job entry back into a queue line."""
+    if entry["job_args"] == "":
+        return f'{entry["job_file"]} {entry["runs_des"]} {entry["runs_act"]}'
+    return f'{entry["job_file"]} {entry["job_args"]} {entry["runs_des"]} {entry["runs_act"]}'
+
+
+def read_bad_jobs(bad_jobs_file):
+    """Reads bad_jobs.txt. Returns an empty list if it does not exist."""
+    if not bad_jobs_file or not os.path.isfile(bad_jobs_file):
+        return []
+    with open(bad_jobs_file, "r") as f:
+        return [line.rstrip("\r\n") for line in f]
+
+
+def is_bad_job(entry, bad_jobs):
+    """Same check as is_bad_job in lib_util_functions.sh (grep -F)."""
+    key = job_key(entry)
+    return any(key in line for line in bad_jobs)
+
+
+def job_owner(job_file):
+    """Who a job belongs to, the same as job_dirname in lib_util_functions.sh
+    (the first dir after job_dirs/, which is the owner's kerb).
+        foo/bar/baz -> foo,  jobname -> misc_jobs
+    """
+    path = job_file.split("job_dirs/", 1)[-1].strip("/")
+    if "/" not in path:
+        return "misc_jobs"
+    return path.split("/", 1)[0]
+
+
+def read_runtimes(runtimes_file, history=10):
+    """Reads the runtime log written by run_next.sh. Each line is
+    "<seconds> <job_file> [job_args]".
+
+    Args:
+        runtimes_file (string): path to the log
+        history (int): how many of the most recent runs to average
+
+    Returns:
+        dict: job_key (see job_key) -> average runtime in seconds
+    """
+    if not runtimes_file or not os.path.isfile(runtimes_file):
+        return {}
+    recent = {}
+    with open(runtimes_file, "r") as f:
+        for line in f:
+            parts = line.split(None, 1)
+            if len(parts) != 2:
+                continue
+            try:
+                seconds = float(parts[0])
+            except ValueError:
+                continue
+            entry = parse_line(parts[1].strip()+" 0 0")
+            recent.setdefault(job_key(entry), []).append(seconds)
+    return {key: sum(times[-history:])/len(times[-history:])
+            for (key, times) in recent.items()}
+
+
+def policy_skip(candidates, rng, runtimes, probability_skip=PROBABILITY_SKIP):
+    """The original select_job.sh policy. Walks the runnable jobs in order,
+    taking each with probability (100-probability_skip)%. If every job is
+    skipped, the last one is taken."""
+    for entry in candidates:
+        if rng.randrange(100) > probability_skip:
+            return entry
+        vprint("Randomly skipping job "+job_key(entry))
+    return candidates[-1]
+
+
+def policy_weighted(candidates, rng, runtimes, probability_skip=None):
+    """Picks a job with probability proportional to its runs left, so jobs
+    that are nearly finished are rarely picked by several clients at once."""
+    return rng.choices(candidates, weights=[runs_left(e) for e in candidates])[0]
+
+
+def policy_fair(candidates, rng, runtimes, probability_skip=None):
+    """Fair share across owners (see job_owner), then remaining work within
+    an owner.
+
+    Each owner gets the same share of compute time: an owner is picked with
+    weight 1/(average runtime of its jobs), so owners of short jobs get more
+    starts. Within the owner, a job is picked with weight runs left *
+    average runtime, so the jobs with the most work left start first and the
+    owner's jobs tend to finish together. Jobs with no runtime history are
+    assumed to take the average of the known runtimes.
+    """
+    known = [runtimes[job_key(e)] for e in candidates if job_key(e) in runtimes]
+    default = sum(known)/len(known) if known else 1.0
+
+    def runtime(entry):
+        return max(runtimes.get(job_key(entry), default), 1e-3)
+
+    owners = {}
+    for entry in candidates:
+        owners.setdefault(job_owner(entry["job_file"]), []).append(entry)
+    names = list(owners)
+    owner_weights = [len(owners[o])/sum(runtime(e) for e in owners[o]) for o in names]
+    owner = rng.choices(names, weights=owner_weights)[0]
+    jobs = owners[owner]
+    return rng.choices(jobs, weights=[runs_left(e)*runtime(e) for e in jobs])[0]
+
+
+POLICIES = {"skip": policy_skip, "weighted": policy_weighted, "fair": policy_fair}
+
+
+def select_job(entries, bad_jobs, policy="fair", rng=random, runtimes=None,
+               probability_skip=PROBABILITY_SKIP):
+    """Picks the next job to run. Bad jobs and jobs with no runs left are
+    never picked; which of the remaining jobs is picked is up to the policy
+    (see POLICIES).
+
+    Args:
+        entries (list of dicts): the parsed queue (see read_queue)
+        bad_jobs (list of strings): lines of bad_jobs.txt
+        policy (string): name of the selection policy
+        rng: source of random numbers (random.Random(seed) for repeatable
+            choices)
+        runtimes (dict): average runtime of each job (see read_runtimes)
+        probability_skip (int): percent chance of skipping a job, for the
+            "skip" policy
+
+    Returns:
+        dict, bool: the selected entry (None if there is none), and whether
+            any job with runs left was skipped for being bad
+    """
+    candidates = []
+    skipped_bad = False
+    seen = set()
+    for entry in entries:
+        if entry["kind"] != "job" or runs_left(entry) <= 0:
+            continue
+        if is_bad_job(entry, bad_jobs):
+            vprint("Skipping bad job "+job_key(entry)+" ...")
+            skipped_bad = True
+            continue
+        # Only the first copy of a job counts (that is the line run_next.sh
+        # updates)
+        if job_key(entry) in seen:
+            continue
+        seen.add(job_key(entry))
+        candidates.append(entry)
+    if not candidates:
+        return None, skipped_bad
+    selected = POLICIES[policy](candidates, rng, runtimes or {}, probability_skip)
+    vprint("Taking job "+job_key(selected)+" (policy "+policy+")")
+    return selected, skipped_bad
+
+
+def merge_runs(total, value, policy):
+    """Merges one more runs value into a running total, the same way
+    consolidate_queue.sh does.
+
+    Args:
+        total (int): the running total (starts at 0)
+        value (int): the value from the next matching line
+        policy (string): "add", "max", "first" or "last"
+
+    Returns:
+        int: the new total
+    """
+    if policy == "add":
+        return total + value
+    if policy == "max":
+        return max(total, value)
+    if policy == "first":
+        return value if total == 0 else total
+    if policy == "last":
+        return value
+    assert False, "Error: unknown merge policy " + str(policy)
+
+
+def consolidate(entries, des_policy="add", act_policy="add", first_jobs=False,
+                ignore_breakpoint=False):
+    """Merges duplicate jobs (same job file and args) in a single pass.
+
+    Every line with the same key contributes to its runs desired/actual,
+    including lines after the breakpoint. Jobs are output in the order they
+    first appear, and only if they still have runs left. Comment lines are
+    kept in place (each distinct comment once).
+
+    Args:
+        entries (list of dicts): the parsed queue (see read_queue)
+        des_policy (string): how to merge runs desired (see merge_runs)
+        act_policy (string): how to merge runs actual (see merge_runs)
+        first_jobs (bool): only output jobs (and comments) from above the
+            first breakpoint
+        ignore_breakpoint (bool): treat the breakpoint as a comment
+
+    Returns:
+        list of strings: the lines of the consolidated queue
+    """
+    totals = {}
+    order = []
+    seen_comments = set()
+    past_breakpoint = False
+    for entry in entries:
+        if entry["kind"] == "breakpoint":
+            if not ignore_breakpoint:
+                past_breakpoint = True
+            continue
+        if entry["kind"] == "comment":
+            text = entry["text"]
+            if text != "" and text not in seen_comments and \
+                    not (first_jobs and past_breakpoint):
+                seen_comments.add(text)
+                order.append(text)
+            continue
+        if entry["kind"] != "job":
+            continue
+        key = (entry["job_file"], entry["job_args"])
+        if key not in totals:
+            if first_jobs and past_breakpoint:
+                # Not in the first set of jobs: it never gets output
+                totals[key] = None
+                continue
+            totals[key] = [0, 0]
+            order.append(key)
+        elif totals[key] is None:
+            continue
+        total = totals[key]
+        total[0] = merge_runs(total[0], int(entry["runs_des"] or 0), des_policy)
+        total[1] = merge_runs(total[1], int(entry["runs_act"] or 0), act_policy)
+
+    lines = []
+    for item in order:
+        if isinstance(item, str):
+            lines.append(item)
+            continue
+        runs_des, runs_act = totals[item]
+        # Once the client's runs reach runs_desired, the line is dropped.
+        # That way, if the host increases runs_desired, the completed runs
+        # get reset and the host will add it back to the client's queue
+        if runs_des > runs_act:
+            lines.append(format_line({"job_file": item[0], "job_args": item[1],
+                                      "runs_des": runs_des, "runs_act": runs_act}))
+        else:
+            vprint("not adding "+" ".join(item)+" since runs_desired "+str(runs_des)
+                   + "<=" + str(runs_act)+" runs_act", 2)
+    return lines
+
+
+def get_field(entry, field):
+    """Returns the field of an entry as read_queue.sh would print it."""
+    if field == "fields":
+        return "\n".join([entry["job_file"], entry["job_args"],
+                          entry["runs_des"], entry["runs_act"]])
+    return entry[field]
+
+
+def display_help():
+    """Function displaying all help info when run on command line."""
+    print("Usage: job_queue.py [OPTIONS] --queue_file=<file> --select            ")
+    print("       job_queue.py [OPTIONS] --queue_file=<file> N <field>           ")
+    print("       job_queue.py [OPTIONS] --line=\"<line>\" <field>                ")
+    print("     Parses a job queue once and answers queries from it.             ")
+    print("     --queue_file=, -qf=, -q=   The queue file to read                ")
+    print("     --line=, -l=            Parse this line instead of a queue file   ")
+    print("     --select, -s            Select a job like select_job.sh, print its")
+    print("                             line. Exits 1 if no jobs are left, 2 if   ")
+    print("                             the only jobs left are bad jobs           ")
+    print("     --bad_jobs=<file>       Defaults to $CARLO_DIR_LOCATION/bad_jobs.txt")
+    print("     --policy=<name>         How to pick between runnable jobs:       ")
+    print("                               fair: equal compute share per owner, then")
+    print("                                 by runs left * average runtime (default)")
+    print("                               weighted: by runs left                 ")
+    print("                               skip: take each job in order with a    ")
+    print("                                 (100-probability_skip)% chance (old) ")
+    print("     --seed=<N>              Seed the selection (same seed, same job) ")
+    print("     --runtimes=<file>       Runtime log. Defaults to                 ")
+    print("                             $CARLO_DIR_LOCATION/.job_runtimes.txt    ")
+    print("     --probability_skip=<N>  Percent chance to skip a job. Default 75  ")
+    print("     --verbose=num, -v=num or --verbose, -v  (prints to stderr)       ")
+    print("   Fields (at most one, same as read_queue.sh):                       ")
+    print("     --job_file, -jf         The job file                             ")
+    print("     --job_args, -ja         The job args                             ")
+    print("     --runs_des, -rd         The desired number of runs               ")
+    print("     --runs_act, -ra         The actual number of runs                ")
+    print("     --fields, -a            All four, one per line, in the order above")
+    print("   Exits 2 if the line is a comment or its runs are not integers.     ")
+
+
+def main():
+    """Handles cmd line args."""
+    global verbose
+    queue_file = ""
+    line = None
+    line_num = 0
+    field = ""
+    select = False
+    bad_jobs_file = ""
+    probability_skip = PROBABILITY_SKIP
+    policy = "fair"
+    seed = None
+    runtimes_file = ""
+    fields = {"--job_file": "job_file", "-jf": "job_file",
+              "--job_args": "job_args", "-ja": "job_args",
+              "--runs_des": "runs_des", "-rd": "runs_des",
+              "--runs_act": "runs_act", "-ra": "runs_act",
+              "--fields": "fields", "-a": "fields"}
+    for (i, arg) in enumerate(sys.argv):
+        # skip over the name of this script
+        if i == 0:
+            continue
+        if arg == "-h" or arg == "--help":
+            display_help()
+            exit(0)
+        if arg.startswith("--queue_file=") or arg.startswith("-qf=") or arg.startswith("-q="):
+            queue_file = arg[arg.index("=")+1:]
+            continue
+        if arg.startswith("--line=") or arg.startswith("-l="):
+            line = arg[arg.index("=")+1:]
+            continue
+        if arg.startswith("--bad_jobs="):
+            bad_jobs_file = arg[len("--bad_jobs="):]
+            continue
+        if arg.startswith("--policy="):
+            policy = arg[len("--policy="):]
+            assert policy in POLICIES, "Error: unknown policy " + policy
+            continue
+        if arg.startswith("--seed="):
+            seed = arg[len("--seed="):]
+            continue
+        if arg.startswith("--runtimes="):
+            runtimes_file = arg[len("--runtimes="):]
+            continue
+        if arg.startswith("--probability_skip="):
+            probability_skip = int(arg[len("--probability_skip="):])
+            continue
+        if arg == "--verbose" or arg == "-v":
+            verbose = 1
+            continue
+        if arg.startswith("--verbose=") or arg.startswith("-v="):
+            verbose = int(arg[arg.index("=")+1:])
+            continue
+        if arg == "--select" or arg == "-s":
+            select = True
+            continue
+        if arg in fields:
+            field = fields[arg]
+            continue
+        if arg.isdigit() and line_num == 0:
+            line_num = int(arg)
+            continue
+        assert False, "Error: " + arg + \
+            " is not a valid argument. Use -h or --help for usage."
+
+    if select:
+        if not os.path.isfile(queue_file):
+            print("job_queue.py: Queue file does not exist: "+queue_file, file=sys.stderr)
+            exit(3)
+        carlo_dir = os.environ.get("CARLO_DIR_LOCATION", ".")
+        if bad_jobs_file == "":
+            bad_jobs_file = os.path.join(carlo_dir, "bad_jobs.txt")
+        if runtimes_file == "":
+            runtimes_file = os.path.join(carlo_dir, ".job_runtimes.txt")
+        rng = random.Random(seed) if seed is not None else random
+        entry, skipped_bad = select_job(read_queue(queue_file),
+                                        read_bad_jobs(bad_jobs_file),
+                                        policy, rng,
+                                        read_runtimes(runtimes_file),
+                                        probability_skip)
+        if entry is None:
+            vprint("No jobs left to run")
+            exit(2 if skipped_bad else 1)
+        print(get_field(entry, field) if field else format_line(entry))
+        exit(0)
+
+    if field == "":
+        print("job_queue.py: No return value specified", file=sys.stderr)
+        exit(1)
+    if line is None:
+        if not os.path.isfile(queue_file):
+            print("job_queue.py: "+queue_file+" not found", file=sys.stderr)
+            exit(1)
+        if line_num < 1:
+            print("job_queue.py: Line number must be greater than 0", file=sys.stderr)
+            exit(1)
+        entries = read_queue(queue_file)
+        if line_num > len(entries):
+            print("job_queue.py: No line found", file=sys.stderr)
+            exit(1)
+        entry = entries[line_num-1]
+        if entry["text"] == "":
+            print("job_queue.py: No line found", file=sys.stderr)
+            exit(1)
+    else:
+        entry = parse_line(line)
+    if entry["kind"] != "job":
+        vprint("Line is a comment or is malformed...", 5)
+        exit(2)
+    print(get_field(entry, field))
+
+
+if __name__ == '__main__':
+    main()
@@ -24,8 +24,8 @@ for ARGI; do
         echo "$ME: [OPTIONS] queue_file_1.txt queue_file_2.txt"
         echo "                                                          "
         echo "This script takes in two queues and merges them together."
-        echo "The two files are cat'd together and then consolidate_queue.sh"
-        echo "is run to remove duplicates. "
+        echo "The two files are merged by consolidate_queue.py, as if they "
+        echo "were cat'd together, to remove duplicates. "
         echo "  NOTE: the order of queue_file_1 and queue_file_2 matter."
         echo "  Job and job_arg combinations not in queue_file_1 will be"
         echo "  ignored! It is reccommended to put the newer, more up-to-date"
@@ -38,7 +38,7 @@ for ARGI; do
         echo "    Display this help message                         "
         echo "  --verbose=num, -v=num or --verbose, -v              "
         echo "    Set verbosity                                     "
-        echo "    All other args are passed to consolidate_queue.sh "
+        echo "    All other args are passed to consolidate_queue.py "
         exit 0
     elif [[ "${ARGI}" = "--verbose"* || "${ARGI}" = "-v"* ]]; then
         if [[ "${ARGI}" = "--verbose" || "${ARGI}" = "-v" ]]; then
@@ -70,34 +70,22 @@ if [[ ! -f $INPUT_FILE2 ]]; then
 fi
 
 vecho "mergeing file 1: $INPUT_FILE and $INPUT_FILE2" 1
-#--------------------------------------------------------------
-#  Part 4: Cat files together
-#--------------------------------------------------------------
-TEMP_INPUT_FILE=$(temp_filename ${INPUT_FILE})
-# Copy file 1 to the temp file
-cat $INPUT_FILE >>$TEMP_INPUT_FILE
-# Add breakpoint
-echo "${breakpoint}" >>"$TEMP_INPUT_FILE"
-# Copy file 2 to the temp file
-cat $INPUT_FILE2 >>$TEMP_INPUT_FILE
-
 #--------------------------------------------------------------
 #  Part 4: consolidate the queue
 #--------------------------------------------------------------
-# Removes duplicates, adds desired_runs, takes max act_runs
+# Removes duplicates, adds desired_runs, takes max act_runs. File 1 and
+# file 2 are merged as if cat'd together with a breakpoint in between.
 TEMP_OUTPUT=$(temp_filename ${OUTPUT_FILENAME}).out
 rm -f "$TEMP_OUTPUT"
-vecho "Consolodating queue $TEMP_INPUT_FILE to $TEMP_OUTPUT..." 1
+vecho "Consolodating queues $INPUT_FILE and $INPUT_FILE2 to $TEMP_OUTPUT..." 1
 
-${MONTE_MOOS_BASE_DIR}/scripts/consolidate_queue.sh --output=$TEMP_OUTPUT "$TEMP_INPUT_FILE" -b="$breakpoint" $FLOW_DOWN_ARGS #>/dev/null
+python3 /${MONTE_MOOS_BASE_DIR}/scripts/consolidate_queue.py --output=$TEMP_OUTPUT "$INPUT_FILE" "$INPUT_FILE2" -b="$breakpoint" $FLOW_DOWN_ARGS
 EXIT_CODE=$?
 # Check for errors
 if [[ $EXIT_CODE -ne 0 ]]; then
-    vexit "Error in consolidate_queue.sh, exited with code $EXIT_CODE " 1
+    vexit "Error in consolidate_queue.py, exited with code $EXIT_CODE " 1
 fi
 
-# Remove the temp file
-rm "$TEMP_INPUT_FILE" 2>/dev/null
 mkdir -p $(dirname "$OUTPUT_FILENAME")
 mv "$TEMP_OUTPUT" "$OUTPUT_FILENAME" || vexit "Error moving $TEMP_OUTPUT to $OUTPUT_FILENAME" 1
 
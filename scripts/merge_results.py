@@ -28,7 +28,8 @@ def merge_csv_files(main_dir, output_file, job_name):
             continue
         for file in files:
             if file.endswith('.csv'):
-                data[subdir_name] = {}
+                # Every csv of a run adds its columns to the run's row
+                data.setdefault(subdir_name, {})
                 try:
                     with open(os.path.join(subdir, file), 'r') as f:
                         reader = csv.DictReader(f)
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# Kevin Becker
+# Watches a running mission until it is done. uQueryDB is asked whether the
+# halt conditions have been met, at an interval that starts short and backs
+# off while nothing happens. The shoreside alog is tailed at the same time,
+# and a write to any variable named in the halt conditions triggers a query
+# right away. The progress bar is drawn here, so nothing is forked per
+# second. Exits as soon as the mission is done, so the caller can bring it
+# down.
+import glob
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Exit codes
+COMPLETED = 0
+ERROR = 1
+TIMED_OUT = 2
+verbose = 0
+
+CONDITION_PARAMS = ("halt_condition", "pass_condition", "fail_condition", "condition")
+NOT_VARIABLES = {"true", "false", "and", "or", "not"}
+
+
+def vprint(msg, level=1):
+    """Verbose print, to stderr."""
+    if verbose >= level:
+        print("\nmission_monitor.py: "+str(msg), file=sys.stderr)
+
+
+def condition_variables(targ_file, aliases=("uQueryDB", "mm-query")):
+    """The MOOS variables named in the uQueryDB config block(s) of the targ
+    file. Empty if there aren't any (or the file can't be read)."""
+    variables = set()
+    try:
+        with open(targ_file, "r", errors="replace") as f:
+            lines = f.readlines()
+    except OSError:
+        return variables
+    in_block = False
+    for line in lines:
+        line = line.split("//")[0].strip()
+        if line.lower().startswith("processconfig"):
+            in_block = line.partition("=")[2].strip() in aliases
+            continue
+        if not in_block or "=" not in line:
+            continue
+        (param, _, value) = line.partition("=")
+        if param.strip().lower() not in CONDITION_PARAMS:
+            continue
+        # Quoted strings are values, not variables
+        value = re.sub(r"\"[^\"]*\"", "", value)
+        for word in re.findall(r"[A-Za-z_][A-Za-z0-9_]*", value):
+            if word.lower() not in NOT_VARIABLES:
+                variables.add(word)
+    return variables
+
+
+class LogWatcher:
+    """Tails the newest alog under log_dir (the shoreside mission dir),
+    reporting whether any of the given variables were written."""
+
+    def __init__(self, log_dir, variables, since):
+        self.log_dir = log_dir
+        self.variables = variables
+        self.since = since
+        self.file = None
+        self.offset = 0
+        self.partial = b""
+        self.next_search = 0
+
+    def find(self, now):
+        """Looks for the alog started by this mission, every 2 seconds until
+        one shows up."""
+        if self.file or now < self.next_search:
+            return
+        self.next_search = now+2
+        alogs = glob.glob(os.path.join(self.log_dir, "*", "*.alog"))
+        alogs += glob.glob(os.path.join(self.log_dir, "*.alog"))
+        newest = None
+        for alog in alogs:
+            try:
+                mtime = os.path.getmtime(alog)
+            except OSError:
+                continue
+            # Older ones are left over from past runs
+            if mtime >= self.since and (newest is None or mtime > newest[0]):
+                newest = (mtime, alog)
+        if newest:
+            self.file = newest[1]
+            vprint("watching "+self.file)
+
+    def changed(self, now):
+        """True if any of the variables were written since the last call."""
+        if not self.variables:
+            return False
+        self.find(now)
+        if not self.file:
+            return False
+        try:
+            with open(self.file, "rb") as f:
+                f.seek(self.offset)
+                data = f.read()
+        except OSError:
+            return False
+        if not data:
+            return False
+        self.offset += len(data)
+        lines = (self.partial+data).split(b"\n")
+        self.partial = lines.pop()
+        for line in lines:
+            # alog lines are: time variable source value
+            fields = line.split(None, 2)
+            if len(fields) > 1 and fields[1].decode(errors="replace") in self.variables:
+                vprint("saw "+fields[1].decode(errors="replace"), 2)
+                return True
+        return False
+
+
+def query(targ_file, alias):
+    """Runs uQueryDB once. 0 means the halt conditions were met."""
+    try:
+        return subprocess.run(["uQueryDB", "--alias="+alias, targ_file],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+    except OSError as e:
+        vprint(f"uQueryDB failed: {e}")
+        return -1
+
+
+def progress_bar(elapsed, timeout, warning, bar_width=40):
+    """The same bar the old shell loop drew, as one string."""
+    fraction = min(1.0, elapsed/timeout) if timeout > 0 else 1.0
+    fill = min(bar_width, round(bar_width*fraction))
+    if sys.platform == "darwin":
+        bar = "\r      " + "░"*fill + "▉"*(bar_width-fill)
+    else:
+        bar = "\r      [" + " "*fill + "="*(bar_width-fill) + "]"
+    bar += f" {100*fraction:0.2f}% ({int(elapsed)}/{int(timeout)} sec)"
+    if warning:
+        bar += " \x1b[33mWarning: uQueryDB failed. Using timer \x1b[0m"
+    return bar
+
+
+def status_echo(msg):
+    """Runs secho.sh in the background. Returns the process, to be reaped."""
+    secho = "/"+os.environ.get("MONTE_MOOS_BASE_DIR", "")+"/lib/secho.sh"
+    try:
+        return subprocess.Popen([secho, msg], stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+
+
+def monitor(targ_file, timeout, timer_only=False, log_dir="", job_file="",
+            alias="mm-query", min_interval=1.0, max_interval=4.0,
+            status_interval=30, tick=0.25):
+    """Waits until the mission's halt conditions are met or it times out.
+
+    uQueryDB is run every min_interval seconds at first. Each query that
+    finds the mission still running multiplies the interval by 1.5, up to
+    max_interval. A write to a halt condition variable in the shoreside
+    alog triggers a query on the next tick and resets the interval. If no
+    variables could be watched, the interval stays at min_interval. As in
+    the old loop, a first query that already reports the mission done means
+    the query is invalid, and only the timer is used from then on.
+
+    Args:
+        targ_file (string): the shoreside targ file uQueryDB reads
+        timeout (float): seconds until the mission is timed out
+        timer_only (bool): don't query, just wait for the timeout
+        log_dir (string): where to look for the shoreside alog
+        job_file (string): named in the "Still running" status messages
+        alias (string): uQueryDB's alias
+        min_interval, max_interval (float): bounds of the query interval
+        status_interval (float): seconds between status messages
+        tick (float): how often the log and the clock are checked
+
+    Returns:
+        int: COMPLETED or TIMED_OUT
+    """
+    start = time.monotonic()
+    variables = set() if timer_only else condition_variables(targ_file)
+    vprint(f"halt condition variables: {' '.join(sorted(variables)) or 'none'}")
+    if not variables:
+        max_interval = min_interval
+    watcher = LogWatcher(log_dir, variables, time.time()-tick) if log_dir else None
+    valid_query = not timer_only
+    first_query = True
+    interval = min_interval
+    next_query = start
+    next_status = start+status_interval
+    drawn_second = -1
+    status_procs = []
+
+    try:
+        while True:
+            now = time.monotonic()
+            elapsed = now-start
+
+            if valid_query and watcher and watcher.changed(time.time()):
+                interval = min_interval
+                next_query = now
+
+            if valid_query and now >= next_query:
+                result = query(targ_file, alias)
+                vprint(f"uQueryDB output: {result} (next in {interval:.2f}s)", 3)
+                if result == 0:
+                    if not first_query:
+                        print("")
+                        return COMPLETED
+                    vprint("Empty uQueryDB. Resorting to only using the timer...", 2)
+                    valid_query = False
+                interval = min(max_interval, interval*1.5)
+                next_query = time.monotonic()+interval
+                first_query = False
+                now = time.monotonic()
+                elapsed = now-start
+
+            if now >= next_status:
+                next_status += status_interval
+                status_procs = [p for p in status_procs if p.poll() is None]
+                proc = status_echo(f"Still running {job_file} | {int(elapsed)}/{int(timeout)} seconds elapsed ")
+                if proc:
+                    status_procs.append(proc)
+
+            if int(elapsed) != drawn_second:
+                drawn_second = int(elapsed)
+                sys.stdout.write(progress_bar(drawn_second, timeout, not valid_query and not timer_only))
+                sys.stdout.flush()
+
+            if elapsed > timeout:
+                print("")
+                return TIMED_OUT
+
+            # Sleep to whatever is next, but at most a tick
+            wake = min(next_query if valid_query else now+tick, now+tick)
+            time.sleep(max(0.0, wake-time.monotonic()))
+    finally:
+        for proc in status_procs:
+            proc.wait()
+
+
+def display_help():
+    """Function displaying all help info when run on command line."""
+    print("Usage: mission_monitor.py [OPTIONS] --targ=<targ_shoreside.moos>       ")
+    print("     Waits until the mission's halt conditions are met (uQueryDB) or   ")
+    print("     it times out, drawing a progress bar.                             ")
+    print("     Exit codes: 0 completed, 2 timed out, 1 any other error           ")
+    print("     --targ=                 Shoreside targ file                       ")
+    print("     --timeout=<sec>         Default 300                               ")
+    print("     --timer_only            Don't query, only use the timer           ")
+    print("     --log_dir=<dir>         Shoreside mission dir, to watch its alog  ")
+    print("     --job_file=             Named in the status messages              ")
+    print("     --alias=                uQueryDB alias. Default mm-query          ")
+    print("     --min_interval=<sec>    Default 1                                 ")
+    print("     --max_interval=<sec>    Default 4                                 ")
+    print("     --status_interval=<sec> Default 30                                ")
+    print("     --verbose=num, -v=num or --verbose, -v  (prints to stderr)       ")
+
+
+def main():
+    """Handles cmd line args."""
+    global verbose
+    targ_file = ""
+    timeout = 300
+    timer_only = False
+    log_dir = ""
+    job_file = ""
+    alias = "mm-query"
+    min_interval = 1.0
+    max_interval = 4.0
+    status_interval = 30
+    for (i, arg) in enumerate(sys.argv):
+        # skip over the name of this script
+        if i == 0:
+            continue
+        if arg == "-h" or arg == "--help":
+            display_help()
+            exit(0)
+        if arg.startswith("--targ="):
+            targ_file = arg[len("--targ="):]
+        elif arg.startswith("--timeout="):
+            timeout = float(arg[len("--timeout="):])
+        elif arg == "--timer_only":
+            timer_only = True
+        elif arg.startswith("--log_dir="):
+            log_dir = arg[len("--log_dir="):]
+        elif arg.startswith("--job_file="):
+            job_file = arg[len("--job_file="):]
+        elif arg.startswith("--alias="):
+            alias = arg[len("--alias="):]
+        elif arg.startswith("--min_interval="):
+            min_interval = float(arg[len("--min_interval="):])
+        elif arg.startswith("--max_interval="):
+            max_interval = float(arg[len("--max_interval="):])
+        elif arg.startswith("--status_interval="):
+            status_interval = float(arg[len("--status_interval="):])
+        elif arg == "--verbose" or arg == "-v":
+            verbose = 1
+        elif arg.startswith("--verbose=") or arg.startswith("-v="):
+            verbose = int(arg[arg.index("=")+1:])
+        else:
+            assert False, "Error: " + arg + \
+                " is not a valid argument. Use -h or --help for usage."
+
+    if targ_file == "" and not timer_only:
+        print("mission_monitor.py: no targ file given", file=sys.stderr)
+        exit(ERROR)
+    try:
+        exit(monitor(targ_file, timeout, timer_only, log_dir, job_file, alias,
+                     min_interval, max(min_interval, max_interval), status_interval))
+    except KeyboardInterrupt:
+        print("")
+        exit(130)
+
+
+if __name__ == '__main__':
+    main()
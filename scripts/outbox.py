@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+# Kevin Becker
+# On-disk outbox for files going to the host. send2host.sh drops files,
+# result dirs and deletes into the outbox and returns right away; one
+# uploader process per outbox ships them in batches over a single,
+# multiplexed ssh connection (one rsync per batch), retrying with backoff
+# when the host can't be reached.
+#
+# Outbox layout (default $CARLO_DIR_LOCATION/.outbox):
+#     <time_ns>_<target hash>/meta.json {"op": "put"|"delete", "dest": ...,
+#                                        "replace": <bool>,
+#                                        "not_before": <time to send>}
+#     <time_ns>_<target hash>/payload/  the file or dir to send
+#     .sending/                         entries of the batch being sent
+#     .staging/                         the batch, laid out like the host
+import fcntl
+import hashlib
+import json
+import os
+import random
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+verbose = 0
+SENDING = ".sending"
+STAGING = ".staging"
+LOCK_FILE = ".uploader.lock"
+LOG_FILE = "uploader.log"
+
+
+def vprint(msg, level=1):
+    """Verbose print, to stderr."""
+    if verbose >= level:
+        print(time.strftime("%H:%M:%S")+" outbox.py: "+str(msg), file=sys.stderr, flush=True)
+
+
+def default_outbox():
+    """$MONTE_MOOS_OUTBOX_DIR, or .outbox in the carlo dir."""
+    if os.environ.get("MONTE_MOOS_OUTBOX_DIR"):
+        return os.environ["MONTE_MOOS_OUTBOX_DIR"]
+    return os.path.join(os.environ.get("CARLO_DIR_LOCATION", "."), ".outbox")
+
+
+def target_hash(target):
+    """Hash of the path an entry writes (or deletes) on the host, to find
+    the entries a replace=True entry replaces."""
+    return hashlib.sha1(os.path.normpath(target).encode()).hexdigest()[:16]
+
+
+def list_entries(dir_name):
+    """Entry names in dir_name, oldest first."""
+    try:
+        names = os.listdir(dir_name)
+    except FileNotFoundError:
+        return []
+    return sorted(n for n in names if not n.startswith(".") and "_" in n
+                  and os.path.isfile(os.path.join(dir_name, n, "meta.json")))
+
+
+def read_meta(entry_dir):
+    with open(os.path.join(entry_dir, "meta.json"), "r") as f:
+        return json.load(f)
+
+
+#--------------------------------------------------------------
+# Adding to the outbox
+#--------------------------------------------------------------
+def add(outbox, op, dest, local_path="", move=False, not_before=0, replace=False):
+    """Adds a put (local_path -> dest) or a delete (of dest) to the outbox.
+
+    A dir is sent like rsync dir host:dest would, so it ends up in
+    dest/<name of dir>. A file ends up at dest.
+
+    With replace, pending entries for the same target are dropped, for
+    snapshots where only the last one matters (e.g. status.txt, re-sent on
+    every secho). Without it, every entry is sent: results dirs are moved
+    into the outbox, so the entry may be their only copy.
+
+    Args:
+        outbox (string): outbox dir
+        op (string): "put" or "delete"
+        dest (string): path on the host
+        local_path (string): what to send (put only)
+        move (bool): move local_path into the outbox instead of copying it
+        not_before (float): don't send before this time (for rate limiting)
+        replace (bool): drop pending entries for the same target
+
+    Returns:
+        string: the name of the new entry
+    """
+    if op == "delete" and os.path.normpath(dest) in ("", ".", "/"):
+        raise ValueError("refusing to delete "+repr(dest)+" on the host")
+    os.makedirs(outbox, exist_ok=True)
+    target = dest
+    if op == "put" and os.path.isdir(local_path):
+        target = os.path.join(dest, os.path.basename(os.path.normpath(local_path)))
+    key = target_hash(target)
+    temp_dir = tempfile.mkdtemp(dir=outbox, prefix=".tmp_")
+    try:
+        if op == "put":
+            local_path = os.path.normpath(local_path)
+            payload = os.path.join(temp_dir, "payload", os.path.basename(local_path))
+            os.makedirs(os.path.dirname(payload))
+            if move:
+                try:
+                    os.rename(local_path, payload)
+                except OSError:
+                    shutil.move(local_path, payload)
+            elif os.path.isdir(local_path):
+                shutil.copytree(local_path, payload, symlinks=True)
+            else:
+                shutil.copy2(local_path, payload)
+        with open(os.path.join(temp_dir, "meta.json"), "w") as f:
+            json.dump({"op": op, "dest": dest, "created": time.time(),
+                       "replace": replace, "not_before": not_before}, f)
+        name = f"{time.time_ns():020d}_{key}"
+        os.rename(temp_dir, os.path.join(outbox, name))
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    if not replace:
+        return name
+    for old in list_entries(outbox):
+        if old.endswith("_"+key) and old < name:
+            vprint("replacing "+old, 2)
+            shutil.rmtree(os.path.join(outbox, old), ignore_errors=True)
+    return name
+
+
+#--------------------------------------------------------------
+# Sending
+#--------------------------------------------------------------
+class Transport:
+    """ssh/rsync to the host, sharing one master connection
+    (ControlMaster), so each batch costs one rsync and at most one ssh
+    on an already open connection.
+
+    ssh and rsync can be replaced (e.g. with local stand-ins) with
+    --ssh= and --rsync=, or MONTE_MOOS_OUTBOX_SSH/MONTE_MOOS_OUTBOX_RSYNC.
+    """
+
+    def __init__(self, host, ssh="ssh", rsync="rsync", key="", timeout=120):
+        self.host = host
+        self.timeout = timeout
+        control_path = os.path.join(tempfile.gettempdir(), f"monte_outbox_{os.getuid()}_%C")
+        self.ssh = shlex.split(ssh) + ["-o", "BatchMode=yes",
+                                       "-o", "ConnectTimeout=20",
+                                       "-o", "ControlMaster=auto",
+                                       "-o", "ControlPath="+control_path,
+                                       "-o", "ControlPersist=600"]
+        if key and os.path.isfile(key):
+            self.ssh += ["-i", key, "-o", "IdentitiesOnly=yes"]
+        self.rsync = shlex.split(rsync)
+
+    def run(self, cmd):
+        vprint(" ".join(shlex.quote(c) for c in cmd), 3)
+        try:
+            result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, timeout=self.timeout+30)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            vprint(f"{cmd[0]} failed: {e}")
+            return False
+        if result.returncode != 0:
+            vprint(f"{cmd[0]} exited with code {result.returncode}: "
+                   + result.stdout.decode(errors="replace").strip()[-500:])
+            return False
+        return True
+
+    def delete(self, dests):
+        """rm -rf all dests in one ssh call."""
+        remote = "rm -rf -- " + " ".join(shlex.quote(d) for d in dests)
+        return self.run(self.ssh + [self.host, remote])
+
+    def put(self, staging_dir, base):
+        """Sends the contents of staging_dir to base on the host with one
+        rsync (which also makes base, so there's no separate mkdir)."""
+        rsync_path = "mkdir -p " + shlex.quote(base) + " && rsync"
+        return self.run(self.rsync + ["-rlt", "-z", "--no-perms", "--omit-dir-times",
+                                      f"--timeout={self.timeout}",
+                                      "-e", " ".join(shlex.quote(c) for c in self.ssh),
+                                      "--rsync-path="+rsync_path,
+                                      staging_dir.rstrip("/")+"/",
+                                      self.host+":"+base.rstrip("/")+"/"])
+
+
+def link_tree(src, dst):
+    """Hard links src (file or dir) to dst, copying if links fail. A later
+    entry for the same target overwrites an earlier one."""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.isdir(src) and not os.path.islink(src):
+        shutil.copytree(src, dst, symlinks=True, copy_function=link_or_copy,
+                        dirs_exist_ok=True)
+    else:
+        link_or_copy(src, dst)
+
+
+def link_or_copy(src, dst):
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def send_batch(outbox, names, transport):
+    """Sends the entries in outbox/.sending: all deletes in one ssh call,
+    then all puts in one rsync. Since the deletes go first, a delete drops
+    the puts queued before it that it would have deleted.
+
+    Returns:
+        bool: True if everything was sent
+    """
+    sending = os.path.join(outbox, SENDING)
+    deletes = []
+    puts = []
+    for name in names:
+        meta = read_meta(os.path.join(sending, name))
+        if meta["op"] == "delete":
+            deletes.append(meta["dest"])
+            gone = os.path.normpath(meta["dest"])
+            puts = [(local, target) for (local, target) in puts
+                    if os.path.normpath(target) != gone
+                    and not os.path.normpath(target).startswith(gone+os.sep)]
+            continue
+        payload_dir = os.path.join(sending, name, "payload")
+        for item in os.listdir(payload_dir):
+            local = os.path.join(payload_dir, item)
+            if os.path.isdir(local) and not os.path.islink(local):
+                puts.append((local, os.path.join(meta["dest"], item)))
+            else:
+                puts.append((local, meta["dest"]))
+
+    if deletes and not transport.delete(deletes):
+        return False
+    if not puts:
+        return True
+
+    base = os.path.commonpath([os.path.dirname(os.path.normpath(target)) for (_, target) in puts])
+    staging = os.path.join(outbox, STAGING)
+    shutil.rmtree(staging, ignore_errors=True)
+    for (local, target) in puts:
+        link_tree(local, os.path.join(staging, os.path.relpath(os.path.normpath(target), base)))
+    ok = transport.put(staging, base)
+    shutil.rmtree(staging, ignore_errors=True)
+    return ok
+
+
+def is_due(entry_dir, now):
+    """Checks if an entry's not_before has passed."""
+    try:
+        return read_meta(entry_dir).get("not_before", 0) <= now
+    except (OSError, ValueError):
+        return False
+
+
+def claim(outbox, max_entries):
+    """Moves up to max_entries due entries into .sending (or picks up the
+    ones left there by a failed or killed batch)."""
+    sending = os.path.join(outbox, SENDING)
+    os.makedirs(sending, exist_ok=True)
+    now = time.time()
+    due = [n for n in list_entries(outbox) if is_due(os.path.join(outbox, n), now)]
+    for name in due[:max(0, max_entries-len(list_entries(sending)))]:
+        key = name.split("_", 1)[1]
+        # A newer replace entry replaces one that didn't make it last time
+        try:
+            replace = read_meta(os.path.join(outbox, name)).get("replace", False)
+        except (OSError, ValueError):
+            replace = False
+        for old in list_entries(sending) if replace else []:
+            if old.endswith("_"+key):
+                shutil.rmtree(os.path.join(sending, old), ignore_errors=True)
+        os.rename(os.path.join(outbox, name), os.path.join(sending, name))
+    return list_entries(sending)
+
+
+def run(outbox, transport, batch_wait=2.0, max_entries=200, max_backoff=300.0,
+        idle_exit=600.0, once=False):
+    """Ships the outbox until it has been empty for idle_exit seconds (or,
+    with once, until it is empty or a batch fails). Only one uploader runs
+    per outbox.
+
+    Returns:
+        int: 0, or 1 if once and a batch failed
+    """
+    os.makedirs(outbox, exist_ok=True)
+    lock = open(os.path.join(outbox, LOCK_FILE), "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        vprint("another uploader is running on "+outbox)
+        return 0
+    lock.write(str(os.getpid()))
+    lock.flush()
+
+    backoff = 0.0
+    idle_since = time.time()
+    while True:
+        names = claim(outbox, max_entries)
+        if not names:
+            # (entries that aren't due yet keep it from going idle)
+            if once or (time.time() - idle_since > idle_exit and not list_entries(outbox)):
+                return 0
+            time.sleep(1)
+            continue
+        idle_since = time.time()
+        if send_batch(outbox, names, transport):
+            vprint(f"sent {len(names)} entries")
+            for name in names:
+                shutil.rmtree(os.path.join(outbox, SENDING, name), ignore_errors=True)
+            backoff = 0.0
+            # Let a few more entries pile up for the next batch
+            time.sleep(0 if once else batch_wait)
+            continue
+        if once:
+            return 1
+        backoff = min(max_backoff, max(1.0, backoff*2))
+        vprint(f"sending {len(names)} entries failed, retrying in {backoff:.0f}s")
+        time.sleep(backoff * random.uniform(0.8, 1.2))
+
+
+def uploader_running(outbox):
+    """Checks if an uploader holds the outbox lock."""
+    try:
+        lock = open(os.path.join(outbox, LOCK_FILE), "a")
+    except OSError:
+        return False
+    with lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        fcntl.flock(lock, fcntl.LOCK_UN)
+    return False
+
+
+def start_uploader(outbox, args):
+    """Starts a detached uploader (logging to outbox/uploader.log) if
+    there isn't one already."""
+    if uploader_running(outbox):
+        return
+    with open(os.path.join(outbox, LOG_FILE), "a") as log:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "--run",
+                          "--outbox="+outbox] + args,
+                         stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+                         start_new_session=True)
+
+
+def wait_until_empty(outbox, timeout):
+    """Waits for the uploader to send everything.
+
+    Returns:
+        bool: True if the outbox is empty
+    """
+    end = time.time() + timeout
+    while list_entries(outbox) or list_entries(os.path.join(outbox, SENDING)):
+        if time.time() > end:
+            return False
+        time.sleep(0.5)
+    return True
+
+
+def display_help():
+    """Function displaying all help info when run on command line."""
+    print("Usage: outbox.py [OPTIONS] [LOCAL_PATH] HOST_PATH                    ")
+    print("     Queues LOCAL_PATH to be sent to HOST_PATH on the host, and makes ")
+    print("     sure an uploader is running. Returns right away.                ")
+    print("     --delete, -d            Queue a delete of HOST_PATH instead      ")
+    print("     --move, -m              Move LOCAL_PATH into the outbox (it is   ")
+    print("                             gone after this returns)                 ")
+    print("     --replace, -r           Drop entries still waiting for the same  ")
+    print("                             HOST_PATH (for snapshots, like status)   ")
+    print("     --no_start              Don't start an uploader                  ")
+    print("   Uploader:                                                          ")
+    print("     --run                   Send everything in the outbox, until it  ")
+    print("                             has been empty for --idle_exit seconds   ")
+    print("     --once                  Send everything once, then exit (exit 1  ")
+    print("                             if the host couldn't be reached)         ")
+    print("     --flush[=<sec>]         Wait (default 300s) for the outbox to    ")
+    print("                             empty. Exit 1 on timeout                 ")
+    print("     --status                Print the number of entries waiting      ")
+    print("     --batch_wait=<sec>      Wait between batches. Default 2          ")
+    print("     --idle_exit=<sec>       Default 600                              ")
+    print("     --max_backoff=<sec>     Max wait between retries. Default 300    ")
+    print("   Options:                                                           ")
+    print("     --outbox=<dir>          Default $MONTE_MOOS_OUTBOX_DIR, or       ")
+    print("                             $CARLO_DIR_LOCATION/.outbox              ")
+    print("     --host=<user@host>      Default                                  ")
+    print("                             $MONTE_MOOS_USERNAME@$MONTE_MOOS_HOSTNAME_SSH")
+    print("     --ssh=<cmd>             Default $MONTE_MOOS_OUTBOX_SSH or ssh    ")
+    print("     --rsync=<cmd>           Default $MONTE_MOOS_OUTBOX_RSYNC or rsync")
+    print("     --timeout=<sec>         rsync timeout. Default 120               ")
+    print("     --verbose=num, -v=num or --verbose, -v  (prints to stderr)       ")
+
+
+def main():
+    """Handles cmd line args."""
+    global verbose
+    outbox = default_outbox()
+    host = os.environ.get("MONTE_MOOS_USERNAME", "")+"@"+os.environ.get("MONTE_MOOS_HOSTNAME_SSH", "")
+    ssh = os.environ.get("MONTE_MOOS_OUTBOX_SSH", "ssh")
+    rsync = os.environ.get("MONTE_MOOS_OUTBOX_RSYNC", "rsync")
+    key = os.environ.get("MONTE_MOOS_HOST_SSH_KEY", "")
+    timeout = 120
+    mode = "add"
+    op = "put"
+    move = False
+    replace = False
+    start = True
+    flush_timeout = 300.0
+    batch_wait = 2.0
+    idle_exit = 600.0
+    max_backoff = 300.0
+    paths = []
+    # passed on to an uploader started by this call
+    uploader_args = []
+    for (i, arg) in enumerate(sys.argv):
+        # skip over the name of this script
+        if i == 0:
+            continue
+        if arg == "-h" or arg == "--help":
+            display_help()
+            exit(0)
+        if arg == "--delete" or arg == "-d":
+            op = "delete"
+            continue
+        if arg == "--move" or arg == "-m":
+            move = True
+            continue
+        if arg == "--replace" or arg == "-r":
+            replace = True
+            continue
+        if arg == "--no_start":
+            start = False
+            continue
+        if arg == "--run" or arg == "--once" or arg == "--status":
+            mode = arg[2:]
+            continue
+        if arg == "--flush" or arg.startswith("--flush="):
+            mode = "flush"
+            if "=" in arg:
+                flush_timeout = float(arg[len("--flush="):])
+            continue
+        if arg.startswith("--outbox="):
+            outbox = arg[len("--outbox="):]
+            continue
+        if arg.startswith("--host="):
+            host = arg[len("--host="):]
+        elif arg.startswith("--ssh="):
+            ssh = arg[len("--ssh="):]
+        elif arg.startswith("--rsync="):
+            rsync = arg[len("--rsync="):]
+        elif arg.startswith("--timeout="):
+            timeout = int(arg[len("--timeout="):])
+        elif arg.startswith("--batch_wait="):
+            batch_wait = float(arg[len("--batch_wait="):])
+        elif arg.startswith("--idle_exit="):
+            idle_exit = float(arg[len("--idle_exit="):])
+        elif arg.startswith("--max_backoff="):
+            max_backoff = float(arg[len("--max_backoff="):])
+        elif arg == "--verbose" or arg == "-v":
+            verbose = 1
+        elif arg.startswith("--verbose=") or arg.startswith("-v="):
+            verbose = int(arg[arg.index("=")+1:])
+        elif not arg.startswith("-"):
+            paths.append(arg)
+            continue
+        else:
+            assert False, "Error: " + arg + \
+                " is not a valid argument. Use -h or --help for usage."
+        uploader_args.append(arg)
+
+    if mode == "status":
+        print(len(list_entries(outbox)) + len(list_entries(os.path.join(outbox, SENDING))))
+        exit(0)
+    if mode == "flush":
+        exit(0 if wait_until_empty(outbox, flush_timeout) else 1)
+    if mode in ("run", "once"):
+        transport = Transport(host, ssh, rsync, key, timeout)
+        exit(run(outbox, transport, batch_wait, idle_exit=idle_exit,
+                 max_backoff=max_backoff, once=(mode == "once")))
+
+    if op == "delete" and len(paths) == 1:
+        add(outbox, "delete", paths[0], replace=replace)
+    elif op == "put" and len(paths) == 2:
+        if not os.path.exists(paths[0]):
+            print("outbox.py: "+paths[0]+" does not exist", file=sys.stderr)
+            exit(2)
+        add(outbox, "put", paths[1], paths[0], move, replace=replace)
+    else:
+        print("outbox.py: expected LOCAL_PATH HOST_PATH, or --delete HOST_PATH", file=sys.stderr)
+        exit(2)
+    if start:
+        start_uploader(outbox, uploader_args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,20 @@
 #!/usr/bin/env python3
 import csv
+import json
+import os
 import sys
+from multiprocessing import Pool
+import matplotlib
 import matplotlib.pyplot as plt
 from matplotlib import cm
 import numpy as np
 
+# Table shared with the worker processes (see plot_all)
+_table = None
+
+# In auto mode, series longer than this are drawn as a density plot
+DENSITY_THRESHOLD = 100000
+
 
 def getnum(x):
     """Returns a number from a string"""
@@ -14,8 +24,43 @@ def getnum(x):
         return None
 
 
-def plot_csv(input_file, figname, file_type, x_header, y_headers, plot_title):
-    """Generates and saves the fiven plots"""
+def load_columns(input_file):
+    """Maps the columnar copy of a csv written by monte_merge_results.py -c
+    (.results.csv.columns/). Each column is memory mapped, not read.
+
+    Returns:
+        list, list: header and one array per column. None, None if there is
+            no columnar copy or it does not match the csv
+    """
+    columns_dir = os.path.join(os.path.dirname(input_file),
+                               "." + os.path.basename(input_file) + ".columns")
+    try:
+        with open(os.path.join(columns_dir, "schema.json"), 'r', encoding="utf-8") as f:
+            schema = json.load(f)
+        stat = os.stat(input_file)
+        if schema["source"] != [stat.st_size, stat.st_mtime_ns]:
+            return None, None
+        header = []
+        columns = []
+        for column in schema["columns"]:
+            header.append(column["name"])
+            if column["file"] is None:
+                columns.append(np.full(schema["rows"], np.nan))
+            else:
+                columns.append(np.load(os.path.join(columns_dir, column["file"]),
+                                       mmap_mode='r'))
+    except (OSError, ValueError, KeyError):
+        return None, None
+    return header, columns
+
+
+def load_table(input_file):
+    """Loads a csv as a header and a list of columns, using the columnar copy
+    when there is an up to date one."""
+    header, columns = load_columns(input_file)
+    if columns is not None:
+        return header, columns
+
     # Read the data from the CSV file
     data = np.genfromtxt(input_file, delimiter=',', skip_header=1)
 
@@ -23,9 +68,62 @@ def plot_csv(input_file, figname, file_type, x_header, y_headers, plot_title):
     with open(input_file, 'r', encoding="utf-8") as csvfile:
         reader = csv.reader(csvfile)
         header = next(reader)
+    header = [x.strip() for x in header]
+    return header, [data[:, i] for i in range(data.shape[1])]
+
+
+def downsample(x, y, max_points):
+    """Deterministic stratified downsampling. Points are ordered by x and
+    max_points of them are taken at even spacing, so every slice of the x axis
+    keeps its share of points. Rows where x or y is not a number are dropped.
+
+    Returns:
+        array, array: the kept x and y values
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    keep = np.isfinite(x) & np.isfinite(y)
+    x = x[keep]
+    y = y[keep]
+    if max_points <= 0 or len(x) <= max_points:
+        return x, y
+    order = np.argsort(x, kind="stable")
+    picks = order[np.linspace(0, len(x)-1, max_points).round().astype(np.int64)]
+    return x[picks], y[picks]
+
+
+def plot_csv(input_file, figname, file_type, x_header, y_headers, plot_title,
+             mode="auto", max_points=0):
+    """Generates and saves the fiven plots"""
+    header, columns = load_table(input_file)
+    plot_table(header, columns, figname, file_type,
+               x_header, y_headers, plot_title, mode, max_points)
+
+
+def plot_density(header, x, y_columns, columns, x_column, plot_title):
+    """Draws one hexbin (2-D histogram) per y series on the current figure.
+    Render time and memory do not depend on the number of rows."""
+    fig = plt.gcf()
+    axes = fig.subplots(len(y_columns), 1, sharex=True, squeeze=False)[:, 0]
+    for ax, y_column in zip(axes, y_columns):
+        xs, ys = downsample(x, columns[y_column], 0)
+        if len(xs) > 0:
+            hexes = ax.hexbin(xs, ys, gridsize=100, mincnt=1,
+                              bins='log', cmap='viridis')
+            fig.colorbar(hexes, ax=ax, label="count")
+        ax.set_ylabel(header[y_column])
+    axes[-1].set_xlabel(header[x_column])
+    fig.suptitle(plot_title)
+
+
+def plot_table(header, columns, figname, file_type, x_header, y_headers, plot_title,
+               mode="auto", max_points=0):
+    """Generates and saves a plot from an already loaded table.
 
+    mode is scatter, density (hexbin per y series) or auto (density once a
+    series is longer than DENSITY_THRESHOLD). max_points > 0 downsamples
+    each series before it is scattered."""
     try:
-        header = [x.strip() for x in header]
         x_column = header.index(x_header)
     except ValueError:
         print(f"Error: {x_header} not found in header")
@@ -41,12 +139,29 @@ def plot_csv(input_file, figname, file_type, x_header, y_headers, plot_title):
         y_columns = [i for i in range(1, len(header)) if i != x_column]
 
     # Get the x data
-    x = data[:, x_column]
+    x = columns[x_column]
+
+    # ensure some figure name is set (no hash and no argument for figurename)
+    if figname == "":
+        figname = "figure."+file_type
+
+    max_len = max(len(columns[y_col]) for y_col in y_columns)
+    if mode == "density" or (mode == "auto" and max_points <= 0 and max_len > DENSITY_THRESHOLD):
+        plot_density(header, x, y_columns, columns, x_column, plot_title)
+        plt.savefig(figname)
+        plt.clf()
+        return
 
     # Get the y data and plot it
+    series = []
+    for y_column in y_columns:
+        if max_points > 0:
+            series.append(downsample(x, columns[y_column], max_points))
+        else:
+            series.append((x, columns[y_column]))
     norm = plt.Normalize(0, len(y_columns)-1)
     cmap = cm.ScalarMappable(norm=norm, cmap='rainbow')
-    max_len = max(len(data[:, y_col]) for y_col in y_columns)
+    max_len = max(len(ys) for (_, ys) in series)
     if max_len > 1000:
         marker = ","
         size = 1
@@ -57,13 +172,10 @@ def plot_csv(input_file, figname, file_type, x_header, y_headers, plot_title):
         marker = "o"
         size = 40
     for i, y_column in enumerate(y_columns):
-        y = data[:, y_column]
-        plt.scatter(x, y, color=cmap.to_rgba(
+        xs, y = series[i]
+        plt.scatter(xs, y, color=cmap.to_rgba(
             i), label=header[y_column], marker=marker, s=size)
 
-    # ensure some figure name is set (no hash and no argument for figurename)
-    if figname == "":
-        figname = "figure."+file_type
     plt.xlabel(header[x_column])
     plt.legend()
     plt.title(plot_title)
@@ -71,6 +183,43 @@ def plot_csv(input_file, figname, file_type, x_header, y_headers, plot_title):
     plt.clf()
 
 
+def _init_worker(input_file):
+    """Sets up a worker process. With fork, the table is inherited from the
+    parent, otherwise it is loaded once per worker."""
+    global _table
+    matplotlib.use("Agg")
+    if _table is None:
+        _table = load_table(input_file)
+
+
+def _plot_task(plot):
+    """Renders one figure in a worker process."""
+    header, columns = _table
+    plot_table(header, columns, *plot)
+    return plot[0]
+
+
+def plot_all(input_file, plots, jobs=1):
+    """Loads input_file once and renders every plot from that one table.
+
+    Args:
+        input_file (string): csv file to plot
+        plots (list of tuples): (figname, file_type, x_header, y_headers,
+            plot_title, mode, max_points) for each figure
+        jobs (int): number of worker processes to render with
+    """
+    global _table
+    _table = load_table(input_file)
+    jobs = min(jobs, len(plots))
+    if jobs <= 1:
+        header, columns = _table
+        for plot in plots:
+            plot_table(header, columns, *plot)
+        return
+    with Pool(jobs, initializer=_init_worker, initargs=(input_file,)) as pool:
+        pool.map(_plot_task, plots, chunksize=1)
+
+
 def display_help():
     """Prints help for use on command line"""
     print("Usage: pltcsv.py --fname=figure [OPTIONS] [file].csv                    ")
@@ -87,6 +236,12 @@ def display_help():
     print("     -y=c,d,e;f,g            Which variabes to plot on the y axis given ")
     print("                             an x (this plots c,d,e vs a and f,g vs b)  ")
     print("     --title=<something>     Title printed on the graph                 ")
+    print("     --jobs=<N>, -j=<N>      Render the plots in N worker processes     ")
+    print("     --mode=<auto>           scatter, density (a 2-D histogram for each ")
+    print("                             y variable) or auto (density above "+str(DENSITY_THRESHOLD)+"  ")
+    print("                             rows, unless --max_points is given)        ")
+    print("     --max_points=<N>        Scatter at most N points per y variable,   ")
+    print("                             evenly spread along the x axis             ")
     print(" Example usage:                                                         ")
     print(" pltcsv.py --fname=figure.png -x=0 -y=1,3,2,4 --title=\"Title\" file.csv")
 
@@ -100,6 +255,9 @@ def main():
     plot_title = ""
     y_plots = []
     x_cols = []
+    jobs = 1
+    mode = "auto"
+    max_points = 0
     for (i, arg) in enumerate(sys.argv):
         # skip over the name of this script
         if i == 0:
@@ -116,6 +274,16 @@ def main():
         if arg.startswith("--title"):
             plot_title = arg[len("--title="):]
             continue
+        if arg.startswith("--jobs=") or arg.startswith("-j="):
+            jobs = int(arg[arg.index("=")+1:])
+            continue
+        if arg.startswith("--mode="):
+            mode = arg[len("--mode="):]
+            assert mode in ("auto", "scatter", "density"), f"Error: unknown mode {mode}"
+            continue
+        if arg.startswith("--max_points="):
+            max_points = int(arg[len("--max_points="):])
+            continue
         if arg.startswith("-x"):
             x_cols = [x.strip() for x in arg[len("-x="):].split(";")]
             continue
@@ -134,17 +302,20 @@ def main():
     if len(y_plots) != 1:
         assert len(x_cols) == len(
             y_plots), "Error: Number of x variables must equal number of y plots (seperate x's with ',' and seperate y plots with ';')"
+    plots = []
     if len(x_cols) == 1:
-        plot_csv(input_file, figname, file_type,
-                 x_cols[0], y_plots[0], plot_title)
+        plots.append((figname, file_type,
+                      x_cols[0], y_plots[0], plot_title, mode, max_points))
     else:
         for i, x_col in enumerate(x_cols):
             if len(y_plots[i]) == 1:
                fname = figname+"_"+x_col+"_"+y_plots[i][0]+f"_{i}"
             else:
                fname = figname+"_"+x_col+"_"+f"{i}"
-            plot_csv(input_file, fname, file_type,
-                     x_col, y_plots[i], plot_title)
+            plots.append((fname, file_type,
+                          x_col, y_plots[i], plot_title, mode, max_points))
+    # the csv is only read once, no matter how many plots there are
+    plot_all(input_file, plots, jobs)
 
 
 if __name__ == '__main__':
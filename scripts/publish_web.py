@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# Kevin Becker
+# Publishes the web/ dir of each new run of a job to post_processed/<run>.
+# Files are stored once, by content (sha256), in a blob store shared by every
+# job, and post_processed is made of hardlinks to the blobs (or reflinks, or
+# copies, when hardlinks aren't possible). Identical legends, maps and config
+# dumps across runs take the space of one. The runs already published are
+# kept in an index, so a pass only looks at the new ones.
+import errno
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+INDEX_VERSION = 1
+# A run with no web/ dir is only marked as published once it is this old,
+# in case its upload is not done yet
+SETTLE_SECS = 600
+# ioctl number of FICLONE (linux), for reflinks
+FICLONE = 0x40049409
+verbose = 0
+
+
+def vprint(msg, level=1):
+    """Verbose print."""
+    if verbose >= level:
+        print("publish_web.py: "+str(msg))
+
+
+def index_filename(post_processed_dir):
+    """Index kept next to the post_processed dir (post_processed ->
+    .post_processed.index.json)"""
+    return os.path.join(os.path.dirname(post_processed_dir),
+                        "." + os.path.basename(post_processed_dir) + ".index.json")
+
+
+def load_index(post_processed_dir):
+    """The runs already published. Without a usable index, the runs that
+    already have a dir in post_processed (published before there was an
+    index) are taken as published."""
+    try:
+        with open(index_filename(post_processed_dir), 'r') as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION:
+            return index["runs"]
+    except (OSError, ValueError, KeyError):
+        pass
+    runs = {}
+    try:
+        for entry in os.scandir(post_processed_dir):
+            if entry.is_dir() and not entry.name.startswith("."):
+                runs[entry.name] = {"files": None}
+    except OSError:
+        pass
+    return runs
+
+
+def save_index(post_processed_dir, runs):
+    """Atomically writes the index."""
+    fname = index_filename(post_processed_dir)
+    temp = fname + ".tmp"
+    with open(temp, 'w') as f:
+        json.dump({"version": INDEX_VERSION, "runs": runs}, f)
+    os.replace(temp, fname)
+
+
+def file_hash(path):
+    """sha256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store_blob(blob_dir, path):
+    """Puts a copy of the file at path in the blob store, unless the same
+    content is already there.
+
+    Returns:
+        string, int: the blob's path, and the bytes added to the store
+    """
+    digest = file_hash(path)
+    blob = os.path.join(blob_dir, digest[:2], digest[2:])
+    if os.path.exists(blob):
+        return blob, 0
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    temp = blob + ".tmp" + str(os.getpid())
+    shutil.copy2(path, temp)
+    # Blobs are shared, so they must not be edited through a link
+    os.chmod(temp, os.stat(temp).st_mode & 0o555)
+    os.replace(temp, blob)
+    return blob, os.path.getsize(blob)
+
+
+def reflink(src, dest):
+    """Copy-on-write clone of src (btrfs, xfs, ...). False if unsupported."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, 'rb') as s, open(dest, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        shutil.copystat(src, dest)
+        return True
+    except OSError:
+        try:
+            os.remove(dest)
+        except OSError:
+            pass
+        return False
+
+
+def materialize(blob, dest):
+    """Makes dest a hardlink to blob, else a reflink, else a copy.
+
+    Returns:
+        string: "link", "reflink" or "copy"
+    """
+    try:
+        os.link(blob, dest)
+        return "link"
+    except OSError as e:
+        # Different filesystem, too many links, or no hardlinks at all
+        if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM, errno.ENOTSUP, errno.EACCES):
+            raise
+    if reflink(blob, dest):
+        return "reflink"
+    shutil.copy2(blob, dest)
+    return "copy"
+
+
+def publish_run(web_dir, dest_dir, blob_dir, stats):
+    """Publishes one run's web dir to dest_dir (built next to it, then
+    renamed into place). Symlinks are copied as symlinks, like cp -rp.
+
+    Returns:
+        int: number of files published
+    """
+    temp_dir = os.path.join(os.path.dirname(dest_dir), ".tmp_" + os.path.basename(dest_dir))
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    files = 0
+    for (subdir, dirs, names) in os.walk(web_dir):
+        out_dir = os.path.join(temp_dir, os.path.relpath(subdir, web_dir))
+        os.makedirs(out_dir, exist_ok=True)
+        for name in names + [d for d in dirs if os.path.islink(os.path.join(subdir, d))]:
+            src = os.path.join(subdir, name)
+            dest = os.path.join(out_dir, name)
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), dest)
+                continue
+            try:
+                blob, added = store_blob(blob_dir, src)
+            except OSError as e:
+                print(f"publish_web.py: unable to publish {src}: {e}", file=sys.stderr)
+                continue
+            how = materialize(blob, dest)
+            stats[how] = stats.get(how, 0)+1
+            stats["stored_bytes"] += added
+            stats["bytes"] += os.path.getsize(blob)
+            files += 1
+    if os.path.isdir(dest_dir):
+        shutil.rmtree(dest_dir)
+    os.rename(temp_dir, dest_dir)
+    return files
+
+
+def symlink_run(web_dir, dest_dir):
+    """The old TYPE=ln: links each entry of web/ from dest_dir.
+
+    Returns:
+        int: number of entries linked
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    names = os.listdir(web_dir)
+    for name in names:
+        dest = os.path.join(dest_dir, name)
+        if not os.path.lexists(dest):
+            os.symlink(os.path.abspath(os.path.join(web_dir, name)), dest)
+    return len(names)
+
+
+def publish(input_dir, post_processed_dir, blob_dir, symlink=False, now=None):
+    """Publishes every run in input_dir that isn't in the index yet.
+
+    Returns:
+        dict: counts of the runs and files published, and bytes stored
+            vs bytes published
+    """
+    now = time.time() if now is None else now
+    runs = load_index(post_processed_dir)
+    stats = {"runs": 0, "files": 0, "bytes": 0, "stored_bytes": 0}
+    changed = False
+    try:
+        entries = [e for e in os.scandir(input_dir)
+                   if e.name not in runs and not e.name.startswith(".") and e.is_dir()]
+    except OSError as e:
+        print(f"publish_web.py: unable to read {input_dir}: {e}", file=sys.stderr)
+        return stats
+    for entry in sorted(entries, key=lambda e: e.name):
+        web_dir = os.path.join(entry.path, "web")
+        try:
+            has_web = os.path.isdir(web_dir) and len(os.listdir(web_dir)) > 0
+        except OSError:
+            has_web = False
+        if not has_web:
+            # Might still be uploading. Checked again next time, until it settles
+            if now - entry.stat().st_mtime > SETTLE_SECS:
+                runs[entry.name] = {"files": 0}
+                changed = True
+            vprint(f"{entry.name} has no web dir (or it is empty). Nothing to publish", 3)
+            continue
+        vprint(f"publishing {entry.name}", 1)
+        dest_dir = os.path.join(post_processed_dir, entry.name)
+        os.makedirs(post_processed_dir, exist_ok=True)
+        if symlink:
+            files = symlink_run(web_dir, dest_dir)
+        else:
+            files = publish_run(web_dir, dest_dir, blob_dir, stats)
+        runs[entry.name] = {"files": files}
+        stats["runs"] += 1
+        stats["files"] += files
+        changed = True
+        # Saved as it goes, so an interrupted pass keeps its progress
+        if stats["runs"] % 100 == 0:
+            save_index(post_processed_dir, runs)
+    if changed or not os.path.isfile(index_filename(post_processed_dir)):
+        save_index(post_processed_dir, runs)
+    return stats
+
+
+def collect_garbage(blob_dir):
+    """Removes blobs nothing links to anymore (a link count of 1). Blobs
+    that were reflinked or copied out look unused too, but removing them
+    doesn't affect the published copies.
+
+    Returns:
+        int, int: blobs removed, bytes freed
+    """
+    removed = 0
+    freed = 0
+    for (subdir, _, names) in os.walk(blob_dir):
+        for name in names:
+            path = os.path.join(subdir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_nlink == 1:
+                os.remove(path)
+                removed += 1
+                freed += stat.st_size
+    return removed, freed
+
+
+def display_help():
+    """Function displaying all help info when run on command line."""
+    print("Usage: publish_web.py [OPTIONS] --input=<job results dir> --output=<post_processed dir>")
+    print("     Publishes the web/ dir of each run not published yet to          ")
+    print("     <post_processed dir>/<run>, as hardlinks into a content-addressed ")
+    print("     blob store (reflinks or copies if hardlinks can't be made).      ")
+    print("     Published runs are tracked in .<post_processed>.index.json       ")
+    print("     --input=                Dir with one subdir per run of the job   ")
+    print("     --output=, -o=          The post_processed dir                   ")
+    print("     --blobs=                Blob store. Must be on the same disk as  ")
+    print("                             --output for hardlinks. Default          ")
+    print("                             <output>/../.blobs                       ")
+    print("     --symlink               Symlink to the runs' web/ files instead  ")
+    print("     --gc                    Remove blobs nothing links to anymore    ")
+    print("     --verbose=num, -v=num or --verbose, -v                           ")
+
+
+def main():
+    """Handles cmd line args."""
+    global verbose
+    input_dir = ""
+    post_processed_dir = ""
+    blob_dir = ""
+    symlink = False
+    gc = False
+    for (i, arg) in enumerate(sys.argv):
+        # skip over the name of this script
+        if i == 0:
+            continue
+        if arg == "-h" or arg == "--help":
+            display_help()
+            exit(0)
+        if arg.startswith("--input="):
+            input_dir = arg[len("--input="):]
+        elif arg.startswith("--output=") or arg.startswith("-o="):
+            post_processed_dir = arg[arg.index("=")+1:]
+        elif arg.startswith("--blobs="):
+            blob_dir = arg[len("--blobs="):]
+        elif arg == "--symlink":
+            symlink = True
+        elif arg == "--gc":
+            gc = True
+        elif arg == "--verbose" or arg == "-v":
+            verbose = 1
+        elif arg.startswith("--verbose=") or arg.startswith("-v="):
+            verbose = int(arg[arg.index("=")+1:])
+        else:
+            assert False, "Error: " + arg + \
+                " is not a valid argument. Use -h or --help for usage."
+
+    if post_processed_dir == "" or (input_dir == "" and not gc):
+        print("publish_web.py: --input= and --output= are required", file=sys.stderr)
+        exit(1)
+    post_processed_dir = post_processed_dir.rstrip("/")
+    if blob_dir == "":
+        blob_dir = os.path.join(os.path.dirname(os.path.abspath(post_processed_dir)), ".blobs")
+    if input_dir:
+        stats = publish(input_dir, post_processed_dir, blob_dir, symlink)
+        if stats["runs"]:
+            how = ", ".join(f"{stats[k]} {k}" for k in ("link", "reflink", "copy") if stats.get(k))
+            vprint(f"published {stats['runs']} runs, {stats['files']} files ({how}): "
+                   f"{stats['bytes']} bytes, {stats['stored_bytes']} of them new in {blob_dir}")
+    if gc:
+        (removed, freed) = collect_garbage(blob_dir)
+        vprint(f"removed {removed} unused blobs ({freed} bytes)")
+
+
+if __name__ == '__main__':
+    main()
@@ -74,79 +74,7 @@ for ARGI; do
 done
 
 #--------------------------------------------------------------
-#  Part 3: Error handling
+#  Part 3: Parse the line with job_queue.py (same output and exit codes)
 #--------------------------------------------------------------
-
-if [[ "$TO_RETURN" == "" ]]; then
-    vexit "No return value specified" 1
-fi
-if [[ "$line" == "" ]]; then
-    if [[ ! -f $QUEUE_FILE ]]; then
-        vexit "$QUEUE_FILE not found" 1
-    fi
-    if [[ "$LINE_NUM" == "" ]]; then
-        vexit "No line number or line specified" 1
-    fi
-    if [[ $LINE_NUM -lt 1 ]]; then
-        vexit "Line number must be greater than 0" 1
-    fi
-fi
-
-#--------------------------------------------------------------
-#  Part 4: Read line
-#--------------------------------------------------------------
-[[ "$line" == "" ]] && { line=$(awk "NR==$LINE_NUM" $QUEUE_FILE); }
-[[ "$line" != "" ]] || { vexit "No line found" 1; }
-
-[[ $line != \#* ]] || {
-    vecho "Line is a comment..." 5
-    exit 2
-}
-[[ $line != "" ]] || {
-    vecho "Skipping empty line..." 5
-    exit 2
-}
-
-read -ra linearray <<<"$line"
-
-JOB_FILE=${linearray[0]}
-JOB_ARGS=""
-RUNS_DES=""
-RUNS_ACT="0"
-for j in "${linearray[@]}"; do
-    if [[ "$j" == "$JOB_FILE" ]]; then
-        continue
-    elif [[ "$j" == "--"* ]]; then
-        if [[ ! $JOB_ARGS == "" ]]; then
-            JOB_ARGS="${JOB_ARGS} ${j}"
-        else
-            JOB_ARGS="${j}"
-        fi
-    elif [[ $RUNS_DES == "" ]]; then
-        RUNS_DES=$j
-    else
-        RUNS_ACT=$j
-    fi
-done
-
-
-#--------------------------------------------------------------
-#  Part 5: Return values
-#--------------------------------------------------------------
-
-# Check for errors
-# Checks that RUN_DES and RUN_ACT are integers > 0
-[[ "${RUNS_DES//[^0-9]/}" = "$RUNS_DES" ]] || { exit 2 ; }
-[[ "${RUNS_ACT//[^0-9]/}" = "$RUNS_ACT" ]] || { exit 2 ; }
-
-if [[ $TO_RETURN = "job_file" ]]; then
-    echo "$JOB_FILE"
-elif [[ "$TO_RETURN" == "job_args" ]]; then
-    echo "$JOB_ARGS"
-elif [[ "$TO_RETURN" == "runs_des" ]]; then
-    echo "$RUNS_DES"
-elif [[ "$TO_RETURN" == "runs_act" ]]; then
-    echo "$RUNS_ACT"
-else
-    vexit "Bad return value specified" 1
-fi
+[[ "$TO_RETURN" != "" ]] || { vexit "No return value specified" 1; }
+exec python3 "/${MONTE_MOOS_BASE_DIR}/scripts/job_queue.py" "$@"
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# Kevin Becker
+# Reports where the clients' time goes, from the run traces (trace.jsonl,
+# one timing record per phase of a run, see trace_phase in
+# lib_util_functions.sh) that travel with the results. Gives percentiles of
+# each phase, the ratio of overhead (everything but the mission) to mission
+# time, and runs/hour per node and per job. With --index, the records of the
+# traces already read are kept, so each call only parses the new ones.
+import json
+import os
+import sys
+import time
+
+INDEX_VERSION = 1
+MISSION_PHASE = "mission"
+# The fields of a record the report uses (the rest aren't kept in the index)
+RECORD_FIELDS = ("node", "job", "args", "phase", "start", "duration", "exit")
+# The order phases happen in a run, for the report
+PHASE_ORDER = ["select_queue", "select_job", "job_dir", "check", "update",
+               "launch", "poke_delay", "mission", "teardown", "post_process",
+               "send"]
+
+
+def read_trace(file):
+    """The timing records of one trace file. Records that aren't timing
+    records (no phase or duration) are skipped, so other jsonl files can
+    be in the same tree."""
+    records = []
+    with open(file, "r", errors="replace") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and "phase" in record and "duration" in record:
+                records.append({k: record[k] for k in RECORD_FIELDS if k in record})
+    return records
+
+
+def load_index(index_file):
+    """The traces read by an earlier call: path -> {"sig": [size, mtime_ns],
+    "records": [...]}"""
+    try:
+        with open(index_file, "r") as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION:
+            return index["files"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
+def save_index(index_file, files):
+    write_atomic(index_file, json.dumps({"version": INDEX_VERSION, "files": files}))
+
+
+def read_traces(paths, since=0, index=None):
+    """Reads every *.jsonl under paths (files or dirs). Each file is one
+    run. A file last written before since can't hold a run that ended
+    after it, so it isn't opened.
+
+    Args:
+        paths (list of strings): files or dirs
+        since (float): only runs that ended after this time
+        index (dict): the traces read before (see load_index). Files that
+            haven't changed aren't parsed again. Updated in place to hold
+            only the files read this time
+
+    Returns:
+        list of lists of dicts: the records of each run, in order
+    """
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        for (subdir, dirs, names) in os.walk(path):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            files += [os.path.join(subdir, n) for n in names if n.endswith(".jsonl")]
+    old_index = dict(index) if index is not None else {}
+    if index is not None:
+        index.clear()
+    runs = []
+    for file in sorted(files):
+        try:
+            stat = os.stat(file)
+        except OSError:
+            continue
+        if stat.st_mtime < since:
+            continue
+        sig = [stat.st_size, stat.st_mtime_ns]
+        cached = old_index.get(file)
+        if cached is not None and cached["sig"] == sig:
+            records = cached["records"]
+        else:
+            try:
+                records = read_trace(file)
+            except OSError:
+                continue
+        if index is not None:
+            index[file] = {"sig": sig, "records": records}
+        if records and records[-1]["start"] >= since:
+            runs.append(records)
+    return runs
+
+
+def percentile(values, p):
+    """Percentile p (0-100) of sorted values, interpolating between ranks."""
+    if not values:
+        return 0.0
+    rank = (len(values)-1)*p/100
+    low = int(rank)
+    high = min(low+1, len(values)-1)
+    return values[low] + (values[high]-values[low])*(rank-low)
+
+
+def run_summary(records):
+    """One run: its node, job, wall time, and time in and out of the
+    mission."""
+    first = records[0]
+    last = max(records, key=lambda r: r["start"]+r["duration"])
+    job = next((r["job"] for r in records if r.get("job")), "")
+    args = next((r["args"] for r in records if r.get("args")), "")
+    mission = sum(r["duration"] for r in records if r["phase"] == MISSION_PHASE)
+    traced = sum(r["duration"] for r in records)
+    return {"node": first.get("node", ""),
+            "job": (job+" "+args).strip(),
+            "start": first["start"],
+            "end": last["start"]+last["duration"],
+            "wall": last["start"]+last["duration"]-first["start"],
+            "mission": mission,
+            "overhead": traced-mission}
+
+
+def group_summary(runs, key):
+    """Runs/hour, overhead ratio and mean mission time of the runs grouped
+    by key ("node" or "job"). For a node, runs/hour is over the span from
+    its first start to its last end. For a job, it is per hour of run wall
+    time, so it doesn't depend on how many nodes ran it."""
+    groups = {}
+    for run in runs:
+        groups.setdefault(run[key], []).append(run)
+    summaries = []
+    for (name, group) in groups.items():
+        mission = sum(r["mission"] for r in group)
+        overhead = sum(r["overhead"] for r in group)
+        if key == "node":
+            hours = (max(r["end"] for r in group)-min(r["start"] for r in group))/3600
+        else:
+            hours = sum(r["wall"] for r in group)/3600
+        missions = [r for r in group if r["mission"]]
+        summaries.append({key: name,
+                          "runs": len(group),
+                          "runs_per_hour": round(len(group)/hours, 2) if hours else 0,
+                          "overhead_ratio": round(overhead/mission, 3) if mission else None,
+                          "mean_mission": round(mission/len(missions), 1) if missions else 0,
+                          "mean_wall": round(sum(r["wall"] for r in group)/len(group), 1)})
+    summaries.sort(key=lambda s: -s["runs"])
+    return summaries
+
+
+def report(runs):
+    """Per phase percentiles, and per node and per job summaries.
+
+    Returns:
+        dict: the report
+    """
+    durations = {}
+    failures = {}
+    for records in runs:
+        for record in records:
+            durations.setdefault(record["phase"], []).append(record["duration"])
+            if record.get("exit", 0) != 0 and not (record["phase"] == MISSION_PHASE and record["exit"] == 2):
+                failures[record["phase"]] = failures.get(record["phase"], 0)+1
+    total = sum(sum(d) for d in durations.values())
+    phases = []
+    order = PHASE_ORDER + sorted(set(durations)-set(PHASE_ORDER))
+    for phase in order:
+        if phase not in durations:
+            continue
+        values = sorted(durations[phase])
+        phases.append({"phase": phase,
+                       "n": len(values),
+                       "mean": round(sum(values)/len(values), 3),
+                       "p50": round(percentile(values, 50), 3),
+                       "p90": round(percentile(values, 90), 3),
+                       "p99": round(percentile(values, 99), 3),
+                       "max": round(values[-1], 3),
+                       "share": round(sum(values)/total, 4) if total else 0,
+                       "failures": failures.get(phase, 0)})
+    summaries = [run_summary(records) for records in runs]
+    mission = sum(s["mission"] for s in summaries)
+    overhead = sum(s["overhead"] for s in summaries)
+    return {"runs": len(runs),
+            "overhead_ratio": round(overhead/mission, 3) if mission else None,
+            "phases": phases,
+            "nodes": group_summary(summaries, "node"),
+            "jobs": group_summary(summaries, "job")}
+
+
+def format_duration(seconds):
+    if seconds < 10:
+        return f"{seconds:.2f}s"
+    if seconds < 3600:
+        return f"{int(seconds)//60}m{int(seconds)%60:02d}s"
+    return f"{int(seconds)//3600}h{(int(seconds)%3600)//60:02d}m"
+
+
+def format_ratio(ratio):
+    return "-" if ratio is None else f"{ratio:.2f}"
+
+
+def format_report(rep, now=None):
+    """The report as text tables."""
+    now = time.time() if now is None else now
+    lines = [f"Run traces ({time.ctime(now)}): {rep['runs']} runs, "
+             f"overhead/mission = {format_ratio(rep['overhead_ratio'])}", "",
+             f"{'phase':<14} {'n':>6} {'mean':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} {'share':>6} {'fail':>5}"]
+    for p in rep["phases"]:
+        lines.append(f"{p['phase'][:14]:<14} {p['n']:>6} {format_duration(p['mean']):>8} "
+                     f"{format_duration(p['p50']):>8} {format_duration(p['p90']):>8} "
+                     f"{format_duration(p['p99']):>8} {format_duration(p['max']):>8} "
+                     f"{100*p['share']:>5.1f}% {p['failures']:>5}")
+    for (key, title) in (("nodes", "node"), ("jobs", "job")):
+        lines += ["", f"{title:<30} {'runs':>6} {'runs/h':>7} {'overhead':>8} {'mission':>8} {'wall':>8}"]
+        for s in rep[key]:
+            lines.append(f"{s[title][-30:]:<30} {s['runs']:>6} {s['runs_per_hour']:>7} "
+                         f"{format_ratio(s['overhead_ratio']):>8} {format_duration(s['mean_mission']):>8} "
+                         f"{format_duration(s['mean_wall']):>8}")
+    return "\n".join(lines)+"\n"
+
+
+def write_atomic(file, text):
+    temp_file = os.path.join(os.path.dirname(file) or ".", ".tmp_"+os.path.basename(file))
+    with open(temp_file, "w") as f:
+        f.write(text)
+    os.replace(temp_file, file)
+
+
+def display_help():
+    """Function displaying all help info when run on command line."""
+    print("Usage: run_trace.py [OPTIONS] DIR_OR_FILE [DIR_OR_FILE ...]            ")
+    print("     Reports per-phase percentiles, the overhead/mission ratio and     ")
+    print("     runs/hour per node and per job from the run traces (*.jsonl)      ")
+    print("     found under the given dirs (ex: the host's results dir, or a      ")
+    print("     client's $CARLO_DIR_LOCATION/traces).                             ")
+    print("     --since=<hours>         Only runs that ended in the last <hours>  ")
+    print("     --json                  Print the report as JSON                  ")
+    print("     --output=, -o=          Write the report to a file                ")
+    print("     --json_output=<file>    Also write the report as JSON to a file   ")
+    print("     --index=<file>          Keep the records read in <file>, and only ")
+    print("                             parse new or changed traces next time     ")
+
+
+def main():
+    """Handles cmd line args."""
+    paths = []
+    since_hours = 0
+    as_json = False
+    output_file = ""
+    json_file = ""
+    index_file = ""
+    for (i, arg) in enumerate(sys.argv):
+        # skip over the name of this script
+        if i == 0:
+            continue
+        if arg == "-h" or arg == "--help":
+            display_help()
+            exit(0)
+        if arg.startswith("--since="):
+            since_hours = float(arg[len("--since="):])
+        elif arg == "--json":
+            as_json = True
+        elif arg.startswith("--output=") or arg.startswith("-o="):
+            output_file = arg[arg.index("=")+1:]
+        elif arg.startswith("--json_output="):
+            json_file = arg[len("--json_output="):]
+        elif arg.startswith("--index="):
+            index_file = arg[len("--index="):]
+        elif not arg.startswith("-"):
+            paths.append(arg)
+        else:
+            assert False, "Error: " + arg + \
+                " is not a valid argument. Use -h or --help for usage."
+
+    if not paths:
+        print("run_trace.py: no dir or file given", file=sys.stderr)
+        exit(1)
+    since = time.time()-since_hours*3600 if since_hours else 0
+    index = load_index(index_file) if index_file else None
+    rep = report(read_traces(paths, since, index))
+    if index_file:
+        save_index(index_file, index)
+    text = json.dumps(rep, indent=1)+"\n" if as_json else format_report(rep)
+    if output_file:
+        write_atomic(output_file, text)
+    elif not json_file:
+        print(text, end="")
+    if json_file:
+        write_atomic(json_file, json.dumps(rep, indent=1)+"\n")
+
+
+if __name__ == '__main__':
+    main()
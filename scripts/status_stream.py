@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# Kevin Becker
+# Structured status for secho.sh. Each status line is appended to
+# status.jsonl (one JSON record per line). A coalesced copy of the recent
+# records is put in the outbox (see outbox.py) at most once per flush
+# interval, so reporting status costs no network round-trip of its own.
+# On the host, --summary rolls every client's stream up into one fleet
+# summary.
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import outbox
+
+STREAM_FILE = "status.jsonl"
+STATE_FILE = ".status_stream.json"
+MAX_STREAM_BYTES = 1000000
+TAIL_BYTES = 65536
+KEEP_RECORDS = 200
+ANSI = re.compile(r"\x1b\[[0-9;]*[A-Za-z]|\x1b\(B")
+
+
+def subline(msg):
+    """The part of a message before the first |, which is what must match
+    for two records to be coalesced (the same rule secho.sh used)."""
+    return msg.split("|")[0].strip()
+
+
+def coalesce_key(record):
+    return (record.get("slot"), record.get("job"), record.get("phase"),
+            subline(record.get("msg", "")))
+
+
+def coalesce(records):
+    """Merges runs of records with the same slot, job, phase and message
+    (up to the first |) into the last one of each run, with t0 set to the
+    time of the first and n to the number merged."""
+    merged = []
+    for record in records:
+        if merged and coalesce_key(merged[-1]) == coalesce_key(record):
+            first = merged[-1]
+            record = dict(record, t0=first.get("t0", first["t"]),
+                          n=first.get("n", 1)+record.get("n", 1))
+            merged[-1] = record
+        else:
+            merged.append(record)
+    return merged
+
+
+def read_records(file, tail_bytes=0):
+    """Reads the records of a stream (only the last tail_bytes, if set),
+    skipping anything that isn't a full JSON record."""
+    records = []
+    try:
+        with open(file, "rb") as f:
+            if tail_bytes:
+                f.seek(max(0, os.path.getsize(file)-tail_bytes))
+            data = f.read()
+    except OSError:
+        return records
+    for line in data.decode(errors="replace").splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict) and "t" in record:
+            records.append(record)
+    return records
+
+
+def write_atomic(file, text):
+    fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(file) or ".", prefix=".tmp_")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(temp_file, file)
+
+
+def to_status_txt(records):
+    """The old status.txt layout: newest first, "msg | date meta"."""
+    lines = []
+    for record in reversed(records):
+        meta = "  ".join(f"{k}={v}" for (k, v) in record.get("meta", {}).items())
+        lines.append(f"{record.get('msg', '')} | {time.ctime(record['t'])}  {meta}")
+    return "\n".join(lines)+"\n"
+
+
+#--------------------------------------------------------------
+# Client side
+#--------------------------------------------------------------
+def append(carlo_dir, msg, job="", phase="", slot="", meta=None, now=None):
+    """Appends one record to carlo_dir/status.jsonl (rotating it to
+    status.jsonl.1 when it gets big), and rewrites status.txt from the
+    coalesced recent records.
+
+    Returns:
+        list: the coalesced recent records
+    """
+    now = time.time() if now is None else now
+    record = {"t": round(now, 3), "msg": ANSI.sub("", msg).strip()}
+    if slot:
+        record["slot"] = slot
+    if job:
+        record["job"] = job
+    if phase:
+        record["phase"] = phase
+    if meta:
+        record["meta"] = meta
+    stream = os.path.join(carlo_dir, STREAM_FILE)
+    try:
+        if os.path.getsize(stream) > MAX_STREAM_BYTES:
+            os.replace(stream, stream+".1")
+    except OSError:
+        pass
+    with open(stream, "a") as f:
+        f.write(json.dumps(record)+"\n")
+
+    records = coalesce(read_records(stream, TAIL_BYTES))[-KEEP_RECORDS:]
+    write_atomic(os.path.join(carlo_dir, "status.txt"), to_status_txt(records))
+    return records
+
+
+def flush(carlo_dir, records, dest, interval, outbox_dir, now=None):
+    """Puts the coalesced records in the outbox for dest. Sends are spaced
+    at least interval seconds apart: a newer snapshot replaces a waiting
+    one (it is added with replace=True), and keeps
+    its send time. An error is sent right away.
+
+    Returns:
+        float: when the snapshot will be sent
+    """
+    now = time.time() if now is None else now
+    state_file = os.path.join(carlo_dir, STATE_FILE)
+    try:
+        with open(state_file, "r") as f:
+            next_send = json.load(f).get("next_send", 0)
+    except (OSError, ValueError):
+        next_send = 0
+    if records and records[-1].get("phase") == "error":
+        send_at = now
+    elif next_send > now:
+        # One is already waiting; this replaces it
+        send_at = next_send
+    else:
+        send_at = max(now, next_send+interval)
+
+    snapshot = os.path.join(carlo_dir, "."+STREAM_FILE+".snapshot")
+    write_atomic(snapshot, "".join(json.dumps(r)+"\n" for r in records))
+    outbox.add(outbox_dir, "put", dest, snapshot, move=True, not_before=send_at,
+               replace=True)
+    with open(state_file, "w") as f:
+        json.dump({"next_send": max(send_at, now)}, f)
+    return send_at
+
+
+#--------------------------------------------------------------
+# Host side
+#--------------------------------------------------------------
+def client_summary(name, records, now):
+    """Summary of one client's stream: its current job and phase, how long
+    it has been in each, and how many jobs it finished in the last hour
+    (records with phase "done")."""
+    last = records[-1]
+    phase_start = last.get("t0", last["t"])
+    job_start = phase_start
+    same_phase = True
+    for record in reversed(records[:-1]):
+        if record.get("job") != last.get("job") or record.get("slot") != last.get("slot"):
+            break
+        job_start = record.get("t0", record["t"])
+        if same_phase and record.get("phase") == last.get("phase"):
+            phase_start = job_start
+        else:
+            same_phase = False
+    runs = sum(r.get("n", 1) for r in records
+               if r.get("phase") == "done" and r["t"] >= now-3600)
+    return {"client": name,
+            "last_seen": last["t"],
+            "job": last.get("job", ""),
+            "phase": last.get("phase", ""),
+            "phase_elapsed": round(now-phase_start),
+            "job_elapsed": round(now-job_start) if last.get("job") else 0,
+            "runs_per_hour": runs,
+            "msg": last.get("msg", "")}
+
+
+def summarize(status_dir, now=None, write_txt=False):
+    """Summaries of every <client>.jsonl in status_dir, most recently seen
+    first. With write_txt, also writes <client>.txt in the old status.txt
+    layout for anything still reading those."""
+    now = time.time() if now is None else now
+    summaries = []
+    for file in sorted(os.listdir(status_dir)):
+        if not file.endswith(".jsonl"):
+            continue
+        records = read_records(os.path.join(status_dir, file))
+        if not records:
+            continue
+        name = file[:-len(".jsonl")]
+        summaries.append(client_summary(name, records, now))
+        if write_txt:
+            write_atomic(os.path.join(status_dir, name+".txt"), to_status_txt(records))
+    summaries.sort(key=lambda s: -s["last_seen"])
+    return summaries
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds//60}m{seconds%60:02d}s"
+    return f"{seconds//3600}h{(seconds%3600)//60:02d}m"
+
+
+def format_summary(summaries, now=None, active_secs=900):
+    """Fleet summary as a text table, with totals for the clients seen in
+    the last active_secs seconds."""
+    now = time.time() if now is None else now
+    active = [s for s in summaries if now-s["last_seen"] <= active_secs]
+    lines = [f"Fleet summary ({time.ctime(now)}): {len(active)}/{len(summaries)} clients active, "
+             f"{sum(s['runs_per_hour'] for s in active)} runs in the last hour",
+             f"{'client':<20} {'seen':>8} {'phase':<8} {'in phase':>9} {'in job':>9} {'runs/h':>6}  job"]
+    for s in summaries:
+        lines.append(f"{s['client'][:20]:<20} {format_duration(now-s['last_seen']):>8} "
+                     f"{s['phase'][:8]:<8} {format_duration(s['phase_elapsed']):>9} "
+                     f"{format_duration(s['job_elapsed']):>9} {s['runs_per_hour']:>6}  {s['job']}")
+    return "\n".join(lines)+"\n"
+
+
+def display_help():
+    """Function displaying all help info when run on command line."""
+    print("Usage: status_stream.py [OPTIONS] MESSAGE                             ")
+    print("     Appends MESSAGE to status.jsonl in the carlo dir, and queues the ")
+    print("     recent (coalesced) records to be sent to the host at most once   ")
+    print("     per flush interval.                                              ")
+    print("     --name=                 This client's name. Default $MYNAME      ")
+    print("     --phase=, --job=        Default $MONTE_MOOS_STATUS_PHASE,        ")
+    print("                             $MONTE_MOOS_STATUS_JOB                   ")
+    print("     --meta=\"k=v k=v\"        Extra info (processes, temp, ...)        ")
+    print("     --flush_interval=<sec>  Default $MONTE_MOOS_STATUS_FLUSH or 60   ")
+    print("     --hostless, -nh         Don't send to the host                   ")
+    print("   Host side:                                                         ")
+    print("     --summary=<dir>         Summarize every <client>.jsonl in <dir>  ")
+    print("     --json                  Print the summary as JSON                ")
+    print("     --txt                   Also write <client>.txt (old layout)     ")
+    print("     --output=, -o=          Write the summary to a file              ")
+
+
+def main():
+    """Handles cmd line args."""
+    carlo_dir = os.environ.get("CARLO_DIR_LOCATION", ".")
+    name = os.environ.get("MYNAME", "")
+    phase = os.environ.get("MONTE_MOOS_STATUS_PHASE", "")
+    job = os.environ.get("MONTE_MOOS_STATUS_JOB", "")
+    slot = os.environ.get("MONTE_MOOS_SLOT", "")
+    interval = float(os.environ.get("MONTE_MOOS_STATUS_FLUSH", 60))
+    hostless = name == "" or name == os.environ.get("MONTE_MOOS_HOST")
+    force_hostless = False
+    meta = {}
+    msg = None
+    summary_dir = ""
+    as_json = False
+    write_txt = False
+    output_file = ""
+    for (i, arg) in enumerate(sys.argv):
+        # skip over the name of this script
+        if i == 0:
+            continue
+        if arg == "-h" or arg == "--help":
+            display_help()
+            exit(0)
+        if arg.startswith("--name="):
+            name = arg[len("--name="):]
+            hostless = name == "" or name == os.environ.get("MONTE_MOOS_HOST")
+        elif arg.startswith("--phase="):
+            phase = arg[len("--phase="):]
+        elif arg.startswith("--job="):
+            job = arg[len("--job="):]
+        elif arg.startswith("--meta="):
+            for pair in arg[len("--meta="):].split():
+                (key, _, value) = pair.partition("=")
+                meta[key] = value
+        elif arg.startswith("--flush_interval="):
+            interval = float(arg[len("--flush_interval="):])
+        elif arg == "--hostless" or arg == "-nh":
+            hostless = True
+            force_hostless = True
+        elif arg.startswith("--summary="):
+            summary_dir = arg[len("--summary="):]
+        elif arg == "--json":
+            as_json = True
+        elif arg == "--txt":
+            write_txt = True
+        elif arg.startswith("--output=") or arg.startswith("-o="):
+            output_file = arg[arg.index("=")+1:]
+        elif msg is None:
+            msg = arg
+        else:
+            assert False, "Error: " + arg + \
+                " is not a valid argument. Use -h or --help for usage."
+
+    if summary_dir:
+        summaries = summarize(summary_dir, write_txt=write_txt)
+        text = json.dumps(summaries, indent=1)+"\n" if as_json else format_summary(summaries)
+        if output_file:
+            write_atomic(output_file, text)
+        else:
+            print(text, end="")
+        exit(0)
+
+    if msg is None:
+        print("status_stream.py: no message given", file=sys.stderr)
+        exit(1)
+    records = append(carlo_dir, msg, job, phase, slot, meta)
+    if not (hostless or force_hostless):
+        stream_name = name + (f"_slot{slot}" if slot else "")
+        dest = os.path.join(os.environ.get("MONTE_MOOS_HOST_RECIEVE_DIR", ""),
+                            "clients", "status", stream_name+".jsonl")
+        outbox_dir = outbox.default_outbox()
+        flush(carlo_dir, records, dest, interval, outbox_dir)
+        outbox.start_uploader(outbox_dir, [])
+
+
+if __name__ == '__main__':
+    main()
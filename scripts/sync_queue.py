@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# Kevin Becker
+# Conditional download of a (queue) file from the host. Remembers the ETag,
+# Last-Modified and sha256 of the last copy it downloaded, so an unchanged
+# file costs one small request (304 Not Modified) and no decrypt/merge.
+import base64
+import email.utils
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# Exit codes (1, 2 and 4 match pull_from_host.sh)
+CHANGED = 0
+NOT_FOUND = 1
+ERROR = 2
+UNCHANGED = 3
+NETWORK_ERROR = 4
+verbose = 0
+
+
+def vprint(msg, level=1):
+    """Verbose print, to stderr."""
+    if verbose >= level:
+        print("sync_queue.py: "+str(msg), file=sys.stderr)
+
+
+def meta_filename(output_file):
+    """Where the validators of output_file are kept: .<output>.sync.json"""
+    dirname, basename = os.path.split(output_file)
+    return os.path.join(dirname, "."+basename+".sync.json")
+
+
+def load_meta(output_file, url):
+    """Reads the validators saved for this url (empty if none)."""
+    try:
+        with open(meta_filename(output_file), "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if meta.get("url") != url:
+        return {}
+    return meta
+
+
+def save_meta(output_file, meta):
+    """Saves the validators atomically."""
+    meta_file = meta_filename(output_file)
+    fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(meta_file) or ".", prefix=".tmp_")
+    with os.fdopen(fd, "w") as f:
+        json.dump(meta, f)
+    os.replace(temp_file, meta_file)
+
+
+def strong_last_modified(headers):
+    """Last-Modified only has 1 second resolution. If the file was modified
+    within 2 seconds of the response, it may change again within the same
+    second, so it can't be used for If-Modified-Since (RFC 7232 2.2.2)."""
+    last_modified = headers.get("Last-Modified")
+    date = headers.get("Date")
+    if not last_modified or not date:
+        return last_modified
+    try:
+        age = (email.utils.parsedate_to_datetime(date)
+               - email.utils.parsedate_to_datetime(last_modified)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+    return last_modified if age >= 2 else None
+
+
+def build_request(url, meta):
+    """Builds a GET with If-None-Match/If-Modified-Since from meta. Any
+    user:password in the url is sent as basic auth, like wget does."""
+    parts = urllib.parse.urlsplit(url)
+    headers = {}
+    if parts.username is not None:
+        netloc = parts.hostname + (f":{parts.port}" if parts.port else "")
+        url = urllib.parse.urlunsplit(parts._replace(netloc=netloc))
+        credentials = f"{urllib.parse.unquote(parts.username)}:{urllib.parse.unquote(parts.password or '')}"
+        headers["Authorization"] = "Basic " + base64.b64encode(credentials.encode()).decode()
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return urllib.request.Request(url, headers=headers)
+
+
+def sync(url, output_file, force=False, timeout=30):
+    """Downloads url to output_file, unless it has not changed since the last
+    download.
+
+    The host is asked with If-None-Match/If-Modified-Since. If the server
+    ignores those and sends the whole file anyway, the sha256 of the body is
+    compared with the last one, so an unchanged file is still reported as
+    unchanged (and output_file is left alone).
+
+    Args:
+        url (string): the file on the host
+        output_file (string): where to save it
+        force (bool): ignore the saved validators
+        timeout (float): seconds to wait for the host
+
+    Returns:
+        int: CHANGED, UNCHANGED, NOT_FOUND, NETWORK_ERROR or ERROR
+    """
+    meta = {} if force else load_meta(output_file, url)
+    request = build_request(url, meta)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = response.read()
+            etag = response.headers.get("ETag")
+            last_modified = strong_last_modified(response.headers)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            vprint("not modified: "+url)
+            return UNCHANGED
+        if e.code == 404:
+            vprint("not found: "+url)
+            return NOT_FOUND
+        vprint(f"HTTP error {e.code}: "+url)
+        return ERROR
+    except (urllib.error.URLError, OSError) as e:
+        vprint(f"network error: {e}")
+        return NETWORK_ERROR
+
+    sha256 = hashlib.sha256(body).hexdigest()
+    new_meta = {"url": url, "etag": etag, "last_modified": last_modified,
+                "sha256": sha256}
+    if sha256 == meta.get("sha256"):
+        vprint("same content: "+url)
+        save_meta(output_file, new_meta)
+        return UNCHANGED
+
+    fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(output_file) or ".", prefix=".tmp_")
+    with os.fdopen(fd, "wb") as f:
+        f.write(body)
+    os.replace(temp_file, output_file)
+    save_meta(output_file, new_meta)
+    vprint(f"downloaded {len(body)} bytes: "+url)
+    return CHANGED
+
+
+def display_help():
+    """Function displaying all help info when run on command line."""
+    print("Usage: sync_queue.py [OPTIONS] URL [OUTPUT_FILE]                      ")
+    print("     Downloads URL to OUTPUT_FILE (default: basename of the URL),     ")
+    print("     unless it is the same as the last copy downloaded. The ETag,     ")
+    print("     Last-Modified and sha256 are kept in .<OUTPUT_FILE>.sync.json    ")
+    print("     Exit codes: 0 downloaded, 3 unchanged, 1 not found on the host,  ")
+    print("                 4 network error, 2 any other error                   ")
+    print("     --force, -f             Ignore the saved validators               ")
+    print("     --print_hash            Print the sha256 of the current copy      ")
+    print("     --timeout=<sec>         Default 30                               ")
+    print("     --verbose=num, -v=num or --verbose, -v  (prints to stderr)       ")
+
+
+def main():
+    """Handles cmd line args."""
+    global verbose
+    url = ""
+    output_file = ""
+    force = False
+    print_hash = False
+    timeout = 30
+    for (i, arg) in enumerate(sys.argv):
+        # skip over the name of this script
+        if i == 0:
+            continue
+        if arg == "-h" or arg == "--help":
+            display_help()
+            exit(0)
+        if arg == "--force" or arg == "-f":
+            force = True
+            continue
+        if arg == "--print_hash":
+            print_hash = True
+            continue
+        if arg.startswith("--timeout="):
+            timeout = float(arg[len("--timeout="):])
+            continue
+        if arg == "--verbose" or arg == "-v":
+            verbose = 1
+            continue
+        if arg.startswith("--verbose=") or arg.startswith("-v="):
+            verbose = int(arg[arg.index("=")+1:])
+            continue
+        if url == "":
+            url = arg
+            continue
+        if output_file == "":
+            output_file = arg
+            continue
+        assert False, "Error: " + arg + \
+            " is not a valid argument. Use -h or --help for usage."
+
+    if url == "":
+        print("sync_queue.py: no url given", file=sys.stderr)
+        exit(ERROR)
+    if output_file == "":
+        output_file = os.path.basename(urllib.parse.urlsplit(url).path)
+    result = sync(url, output_file, force, timeout)
+    if print_hash and result in (CHANGED, UNCHANGED):
+        print(load_meta(output_file, url).get("sha256", ""))
+    exit(result)
+
+
+if __name__ == '__main__':
+    main()
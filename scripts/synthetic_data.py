@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# Kevin Becker
+# Generators of synthetic (but realistic looking) inputs for benchmarking:
+# alog files of N vehicles over M hours, results trees of K <job>_<hash>
+# run dirs with varying csv schemas, and job queue files of any length.
+# The same seed always gives byte-identical output.
+import hashlib
+import math
+import os
+import random
+import sys
+import job_queue
+
+VEHICLE_NAMES = ["abe", "ben", "cal", "deb", "eve", "fin", "gil", "hal",
+                 "ida", "jim", "kay", "lou", "max", "ned", "opi", "pal"]
+# Result columns: every run has the first ones, the rest only sometimes
+RESULT_COLUMNS = ["mhash", "avg_speed", "min_range", "collisions",
+                  "near_misses", "time_to_goal", "path_length", "encounters",
+                  "avg_cpa", "max_heading_rate"]
+ALWAYS_COLUMNS = 4
+# Other variables written to the alogs between the node reports, to make
+# the files (and the parsing) look like a real mission's
+FILLER_VARS = [("DESIRED_HEADING", "pHelmIvP"), ("DESIRED_SPEED", "pHelmIvP"),
+               ("NAV_X", "uSimMarineV22"), ("NAV_Y", "uSimMarineV22"),
+               ("NAV_SPEED", "uSimMarineV22"), ("IVPHELM_ITER", "pHelmIvP")]
+
+
+def mission_hash(rng):
+    """A made up mission hash in the usual format."""
+    return "mhash=" + f"{rng.randrange(24, 100):02d}0{rng.randrange(1, 13):02d}-" \
+        f"{rng.randrange(0, 24):02d}{rng.randrange(0, 60):02d}" \
+        f"{rng.choice('ABCDEFGHJK')}-{rng.choice(['SOFT', 'GRAY', 'BOLD'])}-" \
+        f"{rng.choice(['FERN', 'JUNE', 'RUBY'])}"
+
+
+def write_alog(path, vname, hours, rng, mhash, rate=4.0, fillers=2):
+    """Writes one vehicle's alog: rate NODE_REPORT_LOCAL per second for
+    hours, each followed by a few other variables, and a MISSION_HASH once
+    a minute.
+
+    Returns:
+        int: number of lines written
+    """
+    lines = 0
+    x, y = rng.uniform(-100, 100), rng.uniform(-200, 0)
+    heading = rng.uniform(0, 360)
+    speed = rng.uniform(1, 2.5)
+    steps = int(hours*3600*rate)
+    with open(path, "w") as f:
+        f.write(f"%% LOG FILE:       {path}\n%% FILE OPENED ON  Thu Jan  1 00:00:00 1970\n"
+                "%% LOGSTART               1000.00\n%" + "%"*80 + "\n")
+        for step in range(steps):
+            t = step/rate
+            heading = (heading + rng.gauss(0, 3)) % 360
+            x += speed/rate*math.sin(math.radians(heading))
+            y += speed/rate*math.cos(math.radians(heading))
+            f.write(f"{t:<14.3f} NODE_REPORT_LOCAL      uSimMarineV22  "
+                    f"NAME={vname},X={x:.2f},Y={y:.2f},SPD={speed:.2f},HDG={heading:.2f},"
+                    f"DEP=0,LAT=43.8{rng.randrange(10**6):06d},LON=-70.3{rng.randrange(10**6):06d},"
+                    f"TYPE=kayak,MODE=MODE@ACTIVE:LOITERING,ALLSTOP=clear,INDEX={step},"
+                    f"TIME={1000+t:.2f},LENGTH=4\n")
+            lines += 1
+            for (var, source) in rng.sample(FILLER_VARS, fillers):
+                f.write(f"{t:<14.3f} {var:<22} {source:<14} {rng.uniform(0, 360):.4f}\n")
+                lines += 1
+            if step % int(60*rate) == 0:
+                f.write(f"{t:<14.3f} MISSION_HASH           pMissionHash   {mhash}\n")
+                lines += 1
+    return lines
+
+
+def make_alogs(out_dir, vehicles=2, hours=0.25, seed=1, rate=4.0):
+    """Writes one LOG_<NAME>/LOG_<NAME>.alog per vehicle under out_dir.
+
+    Returns:
+        list of strings, int: the alog paths, and the total number of lines
+    """
+    rng = random.Random(seed)
+    mhash = mission_hash(rng)
+    paths = []
+    total = 0
+    for i in range(vehicles):
+        vname = VEHICLE_NAMES[i % len(VEHICLE_NAMES)] + ("" if i < len(VEHICLE_NAMES) else str(i))
+        log_dir = os.path.join(out_dir, f"LOG_{vname.upper()}_1_1_1970_____00_00_00")
+        os.makedirs(log_dir, exist_ok=True)
+        path = os.path.join(log_dir, os.path.basename(log_dir)+".alog")
+        total += write_alog(path, vname, hours, rng, mhash, rate)
+        paths.append(path)
+    return paths, total
+
+
+def make_results_tree(out_dir, job="synth_job", runs=100, seed=1):
+    """Writes runs <job>_<hash> dirs under out_dir/<job>, each with a
+    results.csv. The schemas vary like real results do: columns come and go,
+    some values are missing or not numbers, and some runs have a second
+    csv file.
+
+    Returns:
+        string: the job's results dir
+    """
+    rng = random.Random(seed)
+    job_dir = os.path.join(out_dir, job)
+    for i in range(runs):
+        run_hash = hashlib.sha1(f"{seed} {i}".encode()).hexdigest()[:10]
+        run_dir = os.path.join(job_dir, f"{job}_{run_hash}")
+        os.makedirs(run_dir, exist_ok=True)
+        columns = RESULT_COLUMNS[:ALWAYS_COLUMNS] + \
+            [c for c in RESULT_COLUMNS[ALWAYS_COLUMNS:] if rng.random() < 0.7]
+        values = []
+        for column in columns:
+            if column == "mhash":
+                values.append(mission_hash(rng)[len("mhash="):])
+            elif rng.random() < 0.02:
+                values.append(rng.choice(["", "nan", "inf"]))
+            elif column in ("collisions", "near_misses", "encounters"):
+                values.append(str(rng.randrange(0, 6)))
+            else:
+                values.append(f"{rng.gauss(10, 3):.4f}")
+        with open(os.path.join(run_dir, "results.csv"), "w") as f:
+            f.write(",".join(columns)+"\n"+",".join(values)+"\n")
+        if rng.random() < 0.1:
+            with open(os.path.join(run_dir, "extra.csv"), "w") as f:
+                f.write(f"cpu_time\n{rng.uniform(50, 500):.2f}\n")
+    return job_dir
+
+
+def make_queue(path, lines=100, seed=1, owners=5):
+    """Writes a job queue file: jobs from a few owners, some with job args,
+    some listed twice, some already finished, plus comments and a
+    breakpoint two thirds of the way down."""
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        f.write("# synthetic queue\n")
+        for i in range(lines):
+            if i == 2*lines//3:
+                f.write(job_queue.BREAKPOINT+"\n")
+            if rng.random() < 0.03:
+                f.write(f"# comment {i}\n")
+                continue
+            # About 1 in 10 lines repeats an earlier job
+            n = rng.randrange(i) if i and rng.random() < 0.1 else i
+            job = f"owner{n % owners}/missions/job_{n}"
+            args = f" --seed={n % 7} --speed={n % 3}" if n % 2 else ""
+            runs_des = rng.randrange(10, 500)
+            runs_act = rng.randrange(0, runs_des+1) if rng.random() < 0.8 else runs_des
+            f.write(f"{job}{args} {runs_des} {runs_act}\n")
+    return path
+
+
+def display_help():
+    """Function displaying all help info when run on command line."""
+    print("Usage: synthetic_data.py [OPTIONS] --alogs|--results|--queue --output=<dir/file>")
+    print("     Generates synthetic inputs for benchmarking (see benchmark.py).   ")
+    print("     --alogs                 alogs of --vehicles over --hours          ")
+    print("     --results               a results tree of --runs run dirs         ")
+    print("     --queue                 a queue file of --lines lines             ")
+    print("     --output=, -o=          Where to write (dir, or file for --queue) ")
+    print("     --vehicles=N            Default 2                                 ")
+    print("     --hours=H               Default 0.25                              ")
+    print("     --runs=K                Default 100                               ")
+    print("     --lines=L               Default 100                               ")
+    print("     --job=<name>            Job name of the results tree              ")
+    print("     --seed=N                Default 1 (same seed, same files)         ")
+
+
+def main():
+    """Handles cmd line args."""
+    kind = ""
+    output = ""
+    vehicles = 2
+    hours = 0.25
+    runs = 100
+    lines = 100
+    job = "synth_job"
+    seed = 1
+    for (i, arg) in enumerate(sys.argv):
+        # skip over the name of this script
+        if i == 0:
+            continue
+        if arg == "-h" or arg == "--help":
+            display_help()
+            exit(0)
+        if arg in ("--alogs", "--results", "--queue"):
+            kind = arg[2:]
+        elif arg.startswith("--output=") or arg.startswith("-o="):
+            output = arg[arg.index("=")+1:]
+        elif arg.startswith("--vehicles="):
+            vehicles = int(arg[len("--vehicles="):])
+        elif arg.startswith("--hours="):
+            hours = float(arg[len("--hours="):])
+        elif arg.startswith("--runs="):
+            runs = int(arg[len("--runs="):])
+        elif arg.startswith("--lines="):
+            lines = int(arg[len("--lines="):])
+        elif arg.startswith("--job="):
+            job = arg[len("--job="):]
+        elif arg.startswith("--seed="):
+            seed = int(arg[len("--seed="):])
+        else:
+            assert False, "Error: " + arg + \
+                " is not a valid argument. Use -h or --help for usage."
+
+    if kind == "" or output == "":
+        print("synthetic_data.py: give one of --alogs, --results, --queue and --output=", file=sys.stderr)
+        exit(1)
+    if kind == "alogs":
+        paths, total = make_alogs(output, vehicles, hours, seed)
+        print(f"{len(paths)} alogs, {total} lines in {output}")
+    elif kind == "results":
+        print(f"{runs} runs in {make_results_tree(output, job, runs, seed)}")
+    else:
+        print(f"{lines} lines in {make_queue(output, lines, seed)}")
+
+
+if __name__ == '__main__':
+    main()